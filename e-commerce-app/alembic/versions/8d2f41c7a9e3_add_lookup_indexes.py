@@ -0,0 +1,101 @@
+"""Add lookup indexes
+
+Revision ID: 8d2f41c7a9e3
+Revises: 37569be52dc7
+Create Date: 2024-02-10 11:24:05.318472
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8d2f41c7a9e3"
+down_revision: Union[str, None] = "37569be52dc7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def drop_invalid_index(name: str, table_name: str) -> None:
+    """A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which
+    `if_not_exists` would then keep. It's dropped, so a rerun builds it again."""
+    # Nothing to check when the SQL is only generated (--sql).
+    if op.get_context().as_sql:
+        return
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    stmt = sa.text(
+        "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+    )
+    if bind.execute(stmt, {"name": name}).first() is not None:
+        op.drop_index(name, table_name=table_name, postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    # The unique indexes fail if there are duplicate emails/usernames; remove them first.
+    with op.get_context().autocommit_block():
+        drop_invalid_index("ix_customers_email", table_name="customers")
+        op.create_index(
+            "ix_customers_email",
+            "customers",
+            ["email"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        drop_invalid_index("ix_customers_username", table_name="customers")
+        op.create_index(
+            "ix_customers_username",
+            "customers",
+            ["username"],
+            unique=True,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        drop_invalid_index("ix_products_name", table_name="products")
+        op.create_index(
+            "ix_products_name",
+            "products",
+            ["name"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        drop_invalid_index("ix_orders_customer_id_status", table_name="orders")
+        op.create_index(
+            "ix_orders_customer_id_status",
+            "orders",
+            ["customer_id", "status"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_orders_customer_id_status",
+            table_name="orders",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_products_name", table_name="products", postgresql_concurrently=True, if_exists=True
+        )
+        op.drop_index(
+            "ix_customers_username",
+            table_name="customers",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_customers_email",
+            table_name="customers",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,77 @@
+"""Add product search indexes
+
+Revision ID: c4e7a1b9d2f6
+Revises: 8d2f41c7a9e3
+Create Date: 2024-02-17 09:41:52.106934
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e7a1b9d2f6"
+down_revision: Union[str, None] = "8d2f41c7a9e3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# NB: These must be the same expressions as `product_document` and `product_tags`
+# in `models.py`, otherwise the search queries can't use the indexes.
+PRODUCT_DOCUMENT: str = "to_tsvector('english', name || ' ' || description)"
+PRODUCT_TAGS: str = "regexp_split_to_array(lower(trim(tags)), '[[:space:]]*,[[:space:]]*')"
+
+
+def drop_invalid_index(name: str, table_name: str) -> None:
+    """A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which
+    `if_not_exists` would then keep. It's dropped, so a rerun builds it again."""
+    # Nothing to check when the SQL is only generated (--sql).
+    if op.get_context().as_sql:
+        return
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    stmt = sa.text(
+        "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+    )
+    if bind.execute(stmt, {"name": name}).first() is not None:
+        op.drop_index(name, table_name=table_name, postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction.
+    with op.get_context().autocommit_block():
+        drop_invalid_index("ix_products_document", table_name="products")
+        op.create_index(
+            "ix_products_document",
+            "products",
+            [sa.text(PRODUCT_DOCUMENT)],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        drop_invalid_index("ix_products_tags", table_name="products")
+        op.create_index(
+            "ix_products_tags",
+            "products",
+            [sa.text(PRODUCT_TAGS)],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_products_tags", table_name="products", postgresql_concurrently=True, if_exists=True
+        )
+        op.drop_index(
+            "ix_products_document",
+            table_name="products",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
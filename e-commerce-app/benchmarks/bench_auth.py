@@ -0,0 +1,59 @@
+"""The micro-benchmarks of `jwt_auth.create_access_token` and `get_current_user`.
+
+`get_current_user` is measured with its caches (token and user) warm and cold.
+
+Usage:
+    pytest benchmarks/bench_auth.py
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+from datetime import timedelta
+from typing import Any, Iterator
+
+import pytest
+from sqlalchemy.orm import Session
+
+from e_commerce_app.utils.auth_cache import token_cache, user_cache
+from e_commerce_app.v1.auth.jwt_auth import create_access_token, get_current_user
+
+pytestmark = pytest.mark.benchmark(group="auth")
+
+
+@pytest.fixture()
+def loop() -> Iterator[asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture()
+def token() -> str:
+    return create_access_token(username="user1", user_id=2, expires_delta=timedelta(minutes=30))
+
+
+def test_create_access_token(benchmark: Any) -> None:
+    result: str = benchmark(
+        create_access_token, username="user1", user_id=2, expires_delta=timedelta(minutes=30)
+    )
+    assert result.count(".") == 2
+
+
+def test_get_current_user_cached(
+    benchmark: Any, db: Session, token: str, loop: asyncio.AbstractEventLoop
+) -> None:
+    user: Any = benchmark(lambda: loop.run_until_complete(get_current_user(db=db, token=token)))
+    assert user.username == "user1"
+
+
+def test_get_current_user_cold(
+    benchmark: Any, db: Session, token: str, loop: asyncio.AbstractEventLoop
+) -> None:
+    def run() -> Any:
+        # The JWT is decoded and the user is loaded from the database.
+        token_cache.clear()
+        user_cache.clear()
+        return loop.run_until_complete(get_current_user(db=db, token=token))
+
+    assert benchmark(run).username == "user1"
@@ -0,0 +1,195 @@
+"""The micro-benchmarks of `utils/crud.py`, on each backend of the `engine` fixture.
+
+Usage:
+    pytest benchmarks/bench_crud.py
+
+Author: Chinedu Ezeofor
+"""
+
+import itertools
+import uuid
+from datetime import date
+from typing import Any
+
+import pytest
+from sqlalchemy.orm import Session
+
+from e_commerce_app import models
+from e_commerce_app.utils import crud
+from e_commerce_app.utils.seed import SEED_PASSWORD
+from e_commerce_app.v1.schemas import db_schema
+
+pytestmark = pytest.mark.benchmark(group="crud")
+
+# bcrypt is ~250 ms per call: a few rounds are enough.
+BCRYPT_ROUNDS: int = 3
+BATCH_SIZE: int = 100
+_counter: Any = itertools.count()
+
+
+def _customer(hashed_password: str = SEED_PASSWORD) -> db_schema.CustomersSchemaInDB:
+    number: int = next(_counter)
+    return db_schema.CustomersSchemaInDB(
+        name="bench customer",
+        username=f"bench{number}-{uuid.uuid4().hex[:8]}",
+        email=f"bench{number}-{uuid.uuid4().hex[:8]}@example.com",
+        shipping_address="1 main street, lagos",
+        hashed_password=hashed_password,
+    )
+
+
+def _product(name: str = "bench product") -> db_schema.ProductsSchema:
+    return db_schema.ProductsSchema(
+        name=name, description="a product", tags="bench,new", price=9.99
+    )
+
+
+def _order(customer_id: int = 1) -> db_schema.OrdersSchema:
+    return db_schema.OrdersSchema(
+        customer_id=customer_id, order_date=date(2024, 12, 31), total_price=42.0, status="pending"
+    )
+
+
+# ===== Passwords =====
+def test_get_password_hash(benchmark: Any) -> None:
+    result: str = benchmark.pedantic(
+        crud.get_password_hash, kwargs={"password": SEED_PASSWORD}, rounds=BCRYPT_ROUNDS
+    )
+    assert result.startswith("$2b$")
+
+
+def test_verify_password(benchmark: Any) -> None:
+    hashed_password: str = crud.get_password_hash(password=SEED_PASSWORD)
+    kwargs: dict[str, Any] = {"plain_password": SEED_PASSWORD, "hashed_password": hashed_password}
+    assert benchmark.pedantic(crud.verify_password, kwargs=kwargs, rounds=BCRYPT_ROUNDS)
+
+
+def test_authenticate_user(benchmark: Any, db: Session) -> None:
+    kwargs: dict[str, Any] = {"username": "user1", "password": SEED_PASSWORD, "db": db}
+    assert benchmark.pedantic(crud.authenticate_user, kwargs=kwargs, rounds=BCRYPT_ROUNDS)
+
+
+# ===== Customers =====
+def test_get_customer(benchmark: Any, db: Session) -> None:
+    assert benchmark(crud.get_customer, db=db, id=1) is not None
+
+
+def test_get_customer_by_email(benchmark: Any, db: Session) -> None:
+    assert benchmark(crud.get_customer_by_email, db=db, email="user1@example.com") is not None
+
+
+def test_get_customer_by_username(benchmark: Any, db: Session) -> None:
+    assert benchmark(crud.get_customer_by_username, db=db, username="user1") is not None
+
+
+def test_get_customers(benchmark: Any, db: Session) -> None:
+    assert len(benchmark(crud.get_customers, db=db, after_id=500, limit=100)) == 100
+
+
+def test_stream_rows(benchmark: Any, db: Session) -> None:
+    columns: list[str] = ["id", "name", "username", "email"]
+
+    def stream() -> int:
+        chunks: Any = crud.stream_rows(db=db, model=models.Customers, columns=columns)
+        return sum(len(chunk) for chunk in chunks)
+
+    assert benchmark(stream) >= 1_000
+
+
+def test_create_customer(benchmark: Any, db: Session) -> None:
+    # It hashes the password.
+    result: Any = benchmark.pedantic(
+        lambda: crud.create_customer(db=db, data=_customer()), rounds=BCRYPT_ROUNDS
+    )
+    assert result is not None
+
+
+def test_create_customers(benchmark: Any, db: Session) -> None:
+    hashed_password: str = crud.get_password_hash(password=SEED_PASSWORD)
+
+    def create() -> dict[str, Any]:
+        data: list[Any] = [_customer(hashed_password) for _ in range(BATCH_SIZE)]
+        return crud.create_customers(db=db, data=data, hash_passwords=False)
+
+    assert len(benchmark(create)["data"]) == BATCH_SIZE
+
+
+# ===== Products =====
+def test_get_products_by_name(benchmark: Any, db: Session) -> None:
+    name: str = f"bench product {uuid.uuid4().hex}"
+    crud.create_product(db=db, data=_product(name=name))
+    assert benchmark(crud.get_products_by_name, db=db, name=name) is not None
+
+
+def test_get_products_by_id(benchmark: Any, db: Session) -> None:
+    assert benchmark(crud.get_products_by_id, db=db, id=1) is not None
+
+
+def test_get_products(benchmark: Any, db: Session) -> None:
+    assert len(benchmark(crud.get_products, db=db, after_id=500, limit=100)) == 100
+
+
+def test_search_products(benchmark: Any, db: Session) -> None:
+    result: list[Any] = benchmark(crud.search_products, db=db, q="wireless", tags=["home"])
+    assert result is not None
+
+
+def test_create_product(benchmark: Any, db: Session) -> None:
+    assert benchmark(lambda: crud.create_product(db=db, data=_product())) is not None
+
+
+def test_create_products(benchmark: Any, db: Session) -> None:
+    data: list[db_schema.ProductsSchema] = [_product() for _ in range(BATCH_SIZE)]
+    assert len(benchmark(crud.create_products, db=db, data=data)["data"]) == BATCH_SIZE
+
+
+# ===== Orders =====
+def test_get_orders(benchmark: Any, db: Session) -> None:
+    assert len(benchmark(crud.get_orders, db=db, after_id=5_000, limit=100)) == 100
+
+
+def test_get_orders_by_id_n_status(benchmark: Any, db: Session) -> None:
+    result: Any = benchmark(
+        crud.get_orders_by_id_n_status, db=db, customer_id=1, status="delivered"
+    )
+    assert result is not None
+
+
+def test_create_order(benchmark: Any, db: Session) -> None:
+    assert benchmark(lambda: crud.create_order(db=db, data=_order())) is not None
+
+
+def test_create_orders(benchmark: Any, db: Session) -> None:
+    data: list[db_schema.OrdersSchema] = [
+        _order(customer_id=idx % 1_000 + 1) for idx in range(BATCH_SIZE)
+    ]
+    assert len(benchmark(crud.create_orders, db=db, data=data)["data"]) == BATCH_SIZE
+
+
+# ===== Idempotency keys =====
+def test_claim_idempotency_key(benchmark: Any, db: Session) -> None:
+    def claim() -> tuple[bool, Any]:
+        return crud.claim_idempotency_key(
+            db=db, key=uuid.uuid4().hex, request_hash="hash", ttl=60, lock_timeout=60
+        )
+
+    assert benchmark(claim)[0]
+
+
+def test_save_idempotency_key(benchmark: Any, db: Session) -> None:
+    key: str = uuid.uuid4().hex
+    crud.claim_idempotency_key(db=db, key=key, request_hash="hash", ttl=60, lock_timeout=60)
+    benchmark(crud.save_idempotency_key, db=db, key=key, status_code=200, response="{}")
+
+
+def test_release_idempotency_key(benchmark: Any, db: Session) -> None:
+    def claim_and_release() -> None:
+        key: str = uuid.uuid4().hex
+        crud.claim_idempotency_key(db=db, key=key, request_hash="hash", ttl=60, lock_timeout=60)
+        crud.release_idempotency_key(db=db, key=key)
+
+    benchmark(claim_and_release)
+
+
+def test_purge_idempotency_keys(benchmark: Any, db: Session) -> None:
+    assert benchmark(crud.purge_idempotency_keys, db=db) >= 0
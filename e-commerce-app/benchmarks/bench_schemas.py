@@ -0,0 +1,82 @@
+"""The micro-benchmarks of the pydantic round trip of the `output_schema` models:
+the ORM rows are validated (`from_attributes`), dumped to JSON and parsed back,
+i.e. what a response and its client do.
+
+Usage:
+    pytest benchmarks/bench_schemas.py
+
+Author: Chinedu Ezeofor
+"""
+
+from datetime import date
+from typing import Any
+
+import pytest
+from pydantic import BaseModel
+
+from e_commerce_app import models
+from e_commerce_app.utils.pagination import encode_cursor
+from e_commerce_app.v1.schemas import output_schema
+
+pytestmark = pytest.mark.benchmark(group="schemas")
+
+PAGE_SIZE: int = 100
+
+
+def _customer(idx: int) -> models.Customers:
+    return models.Customers(
+        id=idx,
+        name="ada okafor",
+        username=f"user{idx}",
+        email=f"user{idx}@example.com",
+        hashed_password="hashed",
+        billing_address=None,
+        shipping_address="1 main street, lagos",
+        phone_number="+2348000000000",
+    )
+
+
+def _product(idx: int) -> models.Products:
+    return models.Products(
+        id=idx, name="smart lamp", description="a smart lamp.", tags="home,new", price=19.99
+    )
+
+
+def _order(idx: int) -> models.Orders:
+    return models.Orders(
+        id=idx, customer_id=1, order_date=date(2024, 12, 31), total_price=42.5, status="shipped"
+    )
+
+
+def _page(make_row: Any) -> dict[str, Any]:
+    return {
+        "data": [make_row(idx) for idx in range(1, PAGE_SIZE + 1)],
+        "next_cursor": encode_cursor(last_id=PAGE_SIZE),
+    }
+
+
+CASES: dict[str, tuple[type[BaseModel], Any]] = {
+    "customer": (output_schema.CustomersOutputSchema, _customer(1)),
+    "product": (output_schema.ProductsOutputSchema, _product(1)),
+    "order": (output_schema.OrdersOutputSchema, _order(1)),
+    "customers_page": (output_schema.CustomersPageOutputSchema, _page(_customer)),
+    "products_page": (output_schema.ProductsPageOutputSchema, _page(_product)),
+    "orders_page": (output_schema.OrdersPageOutputSchema, _page(_order)),
+    "orders_bulk": (
+        output_schema.OrdersBulkOutputSchema,
+        {"data": _page(_order)["data"], "errors": [{"index": 0, "detail": "not found"}]},
+    ),
+}
+
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_round_trip(benchmark: Any, case: str) -> None:
+    schema, data = CASES[case]
+
+    def round_trip() -> BaseModel:
+        payload: bytes = (
+            schema.model_validate(data, from_attributes=True).model_dump_json().encode()
+        )
+        return schema.model_validate_json(payload)
+
+    assert isinstance(benchmark(round_trip), schema)
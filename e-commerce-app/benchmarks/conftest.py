@@ -0,0 +1,76 @@
+"""The fixtures of the micro-benchmarks (`bench_*.py`, run with pytest-benchmark).
+
+The database benchmarks run against an in-memory SQLite database and, when
+`BENCH_POSTGRES_URL` is set, against that Postgres database too (its customers,
+products and orders are deleted: use a dedicated database). Both are seeded with
+the same small dataset (`utils/seed.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+
+ROOT: Path = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Dummy credentials. The database is the one of the `engine` fixture.
+DUMMY_ENV: dict[str, str] = {
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "SECRET_KEY": "bench-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}
+for key, value in DUMMY_ENV.items():
+    os.environ.setdefault(key, value)
+
+POSTGRES_URL_ENV: str = "BENCH_POSTGRES_URL"
+DATASET: dict[str, int] = {"customers": 1_000, "products": 1_000, "orders": 10_000}
+
+
+@pytest.fixture(scope="session", params=["sqlite", "postgresql"])
+def engine(request: Any) -> Iterator[Any]:
+    """The seeded database of each backend."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+
+    from e_commerce_app import models
+    from e_commerce_app.utils.seed import seed_database
+
+    if request.param == "sqlite":
+        engine: Any = create_engine(
+            "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+        )
+    else:
+        url: str = os.getenv(POSTGRES_URL_ENV, "")
+        if not url:
+            pytest.skip(f"{POSTGRES_URL_ENV} isn't set.")
+        engine = create_engine(url)
+    models.Base.metadata.create_all(engine)
+    seed_database(
+        engine=engine,
+        customers=DATASET["customers"],
+        products=DATASET["products"],
+        orders=DATASET["orders"],
+        reset=True,
+        echo=lambda _: None,
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def db(engine: Any) -> Iterator[Any]:
+    """A session of the seeded database."""
+    from sqlalchemy.orm import Session
+
+    with Session(bind=engine, autoflush=False, expire_on_commit=False) as session:
+        yield session
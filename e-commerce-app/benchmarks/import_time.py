@@ -0,0 +1,132 @@
+"""This is a benchmark of the cold start of the app, i.e. `import e_commerce_app`
+followed by `create_app()`.
+
+It runs in fresh interpreters with `python -X importtime` and prints:
+    - the wall time of the import and of `create_app()` (the best of `--runs`).
+    - the import time of the app's own modules (`e_commerce_app.*`), i.e. without
+      fastapi, pydantic, sqlalchemy, ... which the app can't make faster.
+    - the slowest modules (self time).
+It exits with 1 if the import time of the app's own modules is over `--budget-ms`.
+
+Usage:
+    python benchmarks/import_time.py --runs 5 --budget-ms 300
+
+Author: Chinedu Ezeofor
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+import click
+
+ROOT: Path = Path(__file__).absolute().parent.parent
+APP_PACKAGE: str = "e_commerce_app"
+
+# Dummy credentials. Nothing connects to Postgres.
+DUMMY_ENV: dict[str, str] = {
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "SECRET_KEY": "bench-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}
+
+COLD_START: str = """
+import json, time
+start = time.perf_counter()
+import e_commerce_app
+imported = time.perf_counter()
+e_commerce_app.create_app()
+done = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1e3, "create_app_ms": (done - imported) * 1e3}))
+"""
+
+
+def parse_importtime(report: str) -> list[dict[str, Any]]:
+    """Return the modules of a `-X importtime` report with their self and
+    cumulative times (in milliseconds)."""
+    modules: list[dict[str, Any]] = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or line.rstrip().endswith("imported package"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", maxsplit=2)
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_ms": int(self_us) / 1e3,
+                "cumulative_ms": int(cumulative_us) / 1e3,
+            }
+        )
+    return modules
+
+
+def run_cold_start() -> dict[str, Any]:
+    """This imports the app and creates it in a fresh interpreter."""
+    env: dict[str, str] = {**DUMMY_ENV, **os.environ}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", COLD_START],
+        env=env,
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings: dict[str, Any] = json.loads(result.stdout.strip().splitlines()[-1])
+    modules: list[dict[str, Any]] = parse_importtime(result.stderr)
+    app_modules: list[dict[str, Any]] = [
+        item for item in modules if item["module"].split(".")[0] == APP_PACKAGE
+    ]
+    return {
+        **timings,
+        "total_ms": timings["import_ms"] + timings["create_app_ms"],
+        "app_import_ms": sum(item["self_ms"] for item in app_modules),
+        "modules": modules,
+    }
+
+
+@click.command()
+@click.option("--runs", default=5, help="Number of cold starts. The best one is reported.")
+@click.option("--budget-ms", default=300.0, help="Max. import time of the app's own modules.")
+@click.option("--top", default=15, help="Number of slow modules to show.")
+@click.option("--json", "as_json", is_flag=True, help="Print the report as JSON.")
+def main(runs: int, budget_ms: float, top: int, as_json: bool) -> None:
+    """Measure the cold start of the app."""
+    best: dict[str, Any] = min(
+        (run_cold_start() for _ in range(runs)), key=lambda item: item["total_ms"]
+    )
+    slowest: list[dict[str, Any]] = sorted(
+        best["modules"], key=lambda item: item["self_ms"], reverse=True
+    )[:top]
+    passed: bool = best["app_import_ms"] <= budget_ms
+
+    if as_json:
+        summary: dict[str, Any] = {key: value for key, value in best.items() if key != "modules"}
+        click.echo(
+            json.dumps({**summary, "budget_ms": budget_ms, "passed": passed, "slowest": slowest})
+        )
+    else:
+        click.echo(f"\n{'import e_commerce_app':<36}{best['import_ms']:>10.1f} ms")
+        click.echo(f"{'create_app()':<36}{best['create_app_ms']:>10.1f} ms")
+        click.echo(f"{'cold start':<36}{best['total_ms']:>10.1f} ms")
+        click.echo(
+            f"{'app modules (budget)':<36}{best['app_import_ms']:>10.1f} ms  ({budget_ms:.0f} ms)"
+        )
+        click.echo(f"\n{'module':<52}{'self (ms)':>10}{'cumulative (ms)':>17}")
+        for item in slowest:
+            click.echo(
+                f"{item['module']:<52}{item['self_ms']:>10.1f}{item['cumulative_ms']:>17.1f}"
+            )
+
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
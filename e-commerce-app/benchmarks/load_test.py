@@ -0,0 +1,526 @@
+"""This is an end-to-end load test of the API: `create_app()` against a seeded
+local database, driven by `--concurrency` clients.
+
+Each client sends requests in a closed loop (the next one when the previous one
+is done) for `--duration` seconds. The endpoint of each request is drawn from
+the `--mix` of workloads:
+    - login:        POST /auth/token (bcrypt).
+    - browse:       GET /products/ from a random cursor.
+    - order_create: POST /orders/ with one order of the logged-in customer.
+    - order_lookup: GET /order/{customer_id}?order_status=... of a random status.
+
+The database is seeded with `utils/seed.py` when it's empty (or with `--reseed`),
+i.e. a run is reproducible for a given `--seed`. By default, it's a SQLite file;
+any SQLAlchemy URL (e.g. a local Postgres) can be used with `--database-url`.
+With `--transport asgi` (default), the requests go straight to the app, in the
+same process; with `--transport http`, the app runs in a uvicorn subprocess.
+
+The report (throughput, status codes and p50/p95/p99 latency of each endpoint)
+is written to `--output` as JSON, with the git commit, so the runs can be
+compared with `--compare <previous report>`.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 32 --duration 30 --output load.json
+    python benchmarks/load_test.py --compare load.json --output load-new.json
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import click
+
+ROOT: Path = Path(__file__).absolute().parent.parent
+API_PREFIX: str = "/api/v1"
+DEFAULT_DATABASE_URL: str = f"sqlite:///{Path(tempfile.gettempdir()) / 'e_commerce_load.db'}"
+DEFAULT_MIX: str = "login=1,browse=10,order_create=4,order_lookup=6"
+STATUSES: tuple[str, ...] = ("pending", "processing", "shipped", "delivered")
+
+# Dummy credentials. The database is the one of `--database-url`.
+DUMMY_ENV: dict[str, str] = {
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "SECRET_KEY": "bench-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}
+
+
+def use_database(database_url: str) -> Any:
+    """This binds the app's engines and session factories to `database_url`
+    (before `create_app()`). Return the (sync) engine."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from e_commerce_app import models
+    from e_commerce_app.config import get_settings
+
+    url: Any = make_url(database_url)
+    is_sqlite: bool = url.get_backend_name() == "sqlite"
+    kwargs: dict[str, Any] = (
+        {"connect_args": {"check_same_thread": False}} if is_sqlite else models.get_pool_kwargs()
+    )
+    engine: Any = create_engine(url, echo=False, **kwargs)
+    models.engine = engine
+    models.SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    models.async_engine, models.AsyncSessionLocal = None, None
+    if get_settings().database.DB_ASYNC_MODE:
+        driver: str = "sqlite+aiosqlite" if is_sqlite else "postgresql+asyncpg"
+        async_kwargs: dict[str, Any] = {} if is_sqlite else models.get_pool_kwargs()
+        models.async_engine = create_async_engine(url.set(drivername=driver), **async_kwargs)
+        models.AsyncSessionLocal = async_sessionmaker(
+            bind=models.async_engine, autoflush=False, expire_on_commit=False
+        )
+    return engine
+
+
+def prepare_database(
+    engine: Any, customers: int, products: int, orders: int, seed: int, reseed: bool
+) -> dict[str, int]:
+    """This creates the tables and seeds them if they're empty (or with `reseed`).
+    Return the number of rows of each table."""
+    from e_commerce_app import models
+    from e_commerce_app.utils.seed import count_rows, seed_database
+
+    models.Base.metadata.create_all(engine)
+    if reseed or not any(count_rows(engine=engine).values()):
+        click.echo(f"Seeding {engine.url.render_as_string(hide_password=True)} (seed={seed})")
+        seed_database(
+            engine=engine,
+            customers=customers,
+            products=products,
+            orders=orders,
+            seed=seed,
+            reset=reseed,
+            echo=lambda _: None,
+        )
+    return count_rows(engine=engine)
+
+
+def load_users(engine: Any, n_users: int) -> list[dict[str, Any]]:
+    """Return the seeded customers used by the clients (`user0`, `user1`, ...)
+    with an access token each, so only `login` pays for bcrypt."""
+    from sqlalchemy import select
+
+    from e_commerce_app import models
+    from e_commerce_app.v1.auth.jwt_auth import create_access_token
+
+    stmt: Any = (
+        select(models.Customers.id, models.Customers.username)
+        .where(models.Customers.username.like("user%"))
+        .order_by(models.Customers.id)
+        .limit(n_users)
+    )
+    with engine.connect() as conn:
+        rows: list[Any] = conn.execute(stmt).all()
+    return [
+        {
+            "id": row.id,
+            "username": row.username,
+            "headers": {
+                "Authorization": "Bearer "
+                + create_access_token(
+                    username=row.username, user_id=row.id, expires_delta=timedelta(hours=1)
+                )
+            },
+        }
+        for row in rows
+    ]
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Return the weights of the workloads, e.g. `login=1,browse=10`."""
+    weights: dict[str, float] = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in WORKLOADS:
+            raise click.BadParameter(f"Unknown workload {name!r}. Use {sorted(WORKLOADS)}.")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def login(
+    client: Any, rng: random.Random, user: dict[str, Any], state: dict[str, Any]
+) -> Any:
+    from e_commerce_app.utils.seed import SEED_PASSWORD
+
+    return await client.post(
+        f"{API_PREFIX}/auth/token",
+        data={"username": user["username"], "password": SEED_PASSWORD},
+    )
+
+
+async def browse(
+    client: Any, rng: random.Random, user: dict[str, Any], state: dict[str, Any]
+) -> Any:
+    from e_commerce_app.utils.pagination import encode_cursor
+
+    params: dict[str, Any] = {"limit": 20}
+    # A few pages from the start (cached), the others from a random product.
+    if rng.random() < 0.8:
+        params["cursor"] = encode_cursor(last_id=rng.randrange(state["products"]))
+    return await client.get(f"{API_PREFIX}/products/", params=params, headers=user["headers"])
+
+
+async def order_create(
+    client: Any, rng: random.Random, user: dict[str, Any], state: dict[str, Any]
+) -> Any:
+    order: dict[str, Any] = {
+        "customer_id": user["id"],
+        "order_date": str(date.today()),
+        "total_price": round(rng.uniform(5, 500), 2),
+        "status": "pending",
+    }
+    return await client.post(
+        f"{API_PREFIX}/orders/", json={"data": [order]}, headers=user["headers"]
+    )
+
+
+async def order_lookup(
+    client: Any, rng: random.Random, user: dict[str, Any], state: dict[str, Any]
+) -> Any:
+    return await client.get(
+        f"{API_PREFIX}/order/{user['id']}",
+        params={"order_status": rng.choice(STATUSES)},
+        headers=user["headers"],
+    )
+
+
+WORKLOADS: dict[str, Any] = {
+    "login": login,
+    "browse": browse,
+    "order_create": order_create,
+    "order_lookup": order_lookup,
+}
+
+
+async def run_client(
+    client: Any,
+    rng: random.Random,
+    users: list[dict[str, Any]],
+    weights: dict[str, float],
+    deadline: float,
+    state: dict[str, Any],
+    samples: dict[str, dict[str, Any]],
+) -> None:
+    """This sends requests in a closed loop until the deadline."""
+    names: list[str] = list(weights)
+    cum_weights: list[float] = []
+    for name in names:
+        cum_weights.append((cum_weights[-1] if cum_weights else 0.0) + weights[name])
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, cum_weights=cum_weights)[0]
+        sample: dict[str, Any] = samples[name]
+        start: float = time.perf_counter()
+        try:
+            response: Any = await WORKLOADS[name](client, rng, rng.choice(users), state)
+            code: str = str(response.status_code)
+        except Exception as err:
+            code = type(err).__name__
+        sample["latencies"].append(time.perf_counter() - start)
+        sample["status_codes"][code] = sample["status_codes"].get(code, 0) + 1
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return the q-th percentile (nearest rank) of the sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values) + 0.5) - 1))]
+
+
+def summarize(samples: dict[str, dict[str, Any]], seconds: float) -> dict[str, Any]:
+    """Return the throughput, errors and latencies (ms) of each endpoint and in total."""
+    endpoints: dict[str, Any] = {}
+    for name, sample in samples.items():
+        latencies: list[float] = sorted(sample["latencies"])
+        errors: int = sum(
+            count
+            for code, count in sample["status_codes"].items()
+            if not code.isdigit() or int(code) >= 500
+        )
+        endpoints[name] = {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / seconds, 2),
+            "errors": errors,
+            "status_codes": dict(sorted(sample["status_codes"].items())),
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies) * 1e3, 3) if latencies else 0.0,
+                "p50": round(percentile(latencies, 50) * 1e3, 3),
+                "p95": round(percentile(latencies, 95) * 1e3, 3),
+                "p99": round(percentile(latencies, 99) * 1e3, 3),
+                "max": round(latencies[-1] * 1e3, 3) if latencies else 0.0,
+            },
+        }
+    total: int = sum(item["requests"] for item in endpoints.values())
+    return {
+        "total": {
+            "requests": total,
+            "throughput_rps": round(total / seconds, 2),
+            "errors": sum(item["errors"] for item in endpoints.values()),
+        },
+        "endpoints": endpoints,
+    }
+
+
+async def drive(
+    base_url: str,
+    app: Any,
+    users: list[dict[str, Any]],
+    weights: dict[str, float],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    seed: int,
+    state: dict[str, Any],
+) -> dict[str, Any]:
+    """This runs the clients (after a warmup that isn't measured) and returns the summary."""
+    import httpx
+
+    transport: Optional[Any] = httpx.ASGITransport(app=app) if app is not None else None
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, transport=transport, limits=limits, timeout=60
+    ) as client:
+        for phase_duration, measured in ((warmup, False), (duration, True)):
+            samples: dict[str, dict[str, Any]] = {
+                name: {"latencies": [], "status_codes": {}} for name in weights
+            }
+            start: float = time.perf_counter()
+            await asyncio.gather(
+                *[
+                    run_client(
+                        client=client,
+                        rng=random.Random(f"{seed}:{measured}:{idx}"),
+                        users=users,
+                        weights=weights,
+                        deadline=start + phase_duration,
+                        state=state,
+                        samples=samples,
+                    )
+                    for idx in range(concurrency)
+                ]
+            )
+            if measured:
+                return summarize(samples=samples, seconds=time.perf_counter() - start)
+    return {}
+
+
+async def drive_in_process(**kwargs: Any) -> dict[str, Any]:
+    """This runs the load test against the app in this process (with its lifespan)."""
+    from e_commerce_app import create_app
+
+    app: Any = create_app()
+    async with app.router.lifespan_context(app):
+        return await drive(base_url="http://bench", app=app, **kwargs)
+
+
+def free_port() -> int:
+    """Return a free TCP port of localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen[bytes]:
+    """This starts the app in a uvicorn subprocess and waits until it's ready."""
+    import httpx
+
+    env: dict[str, str] = {**DUMMY_ENV, **os.environ}
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(port), "--database-url", database_url],
+        env=env,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline: float = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException("The server exited during startup.")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise click.ClickException("The server didn't start within 60 seconds.")
+
+
+def git_commit() -> Optional[str]:
+    """Return the current git commit (with `-dirty` for local changes)."""
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "describe", "--always", "--dirty"], cwd=ROOT, stderr=subprocess.DEVNULL
+            )
+            .decode("utf-8")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict[str, Any], baseline: Optional[dict[str, Any]]) -> None:
+    """This prints the table of the endpoints (and the change from the baseline)."""
+    header: str = f"\n{'endpoint':<16}{'requests':>10}{'req/s':>10}{'errors':>8}"
+    header += f"{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}"
+    click.echo(header + ("   vs baseline (req/s, p50, p95, p99)" if baseline else ""))
+    rows: dict[str, Any] = {**report["endpoints"], "total": report["total"]}
+    for name, item in rows.items():
+        latency: dict[str, float] = item.get("latency_ms", {})
+        line: str = f"{name:<16}{item['requests']:>10,}{item['throughput_rps']:>10.1f}"
+        line += f"{item['errors']:>8}"
+        line += "".join(
+            f"{latency[key]:>11.2f}" if key in latency else f"{'':>11}"
+            for key in ("p50", "p95", "p99")
+        )
+        previous: Optional[dict[str, Any]] = (
+            (baseline["endpoints"].get(name) if name != "total" else baseline["total"])
+            if baseline
+            else None
+        )
+        if previous:
+            changes: list[str] = [_change(previous["throughput_rps"], item["throughput_rps"])]
+            if latency:
+                changes += [
+                    _change(previous["latency_ms"][key], latency[key])
+                    for key in ("p50", "p95", "p99")
+                ]
+            line += "   " + ", ".join(changes)
+        click.echo(line)
+
+
+def _change(before: float, after: float) -> str:
+    return f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+
+
+@click.command()
+@click.option("--database-url", default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option("--customers", default=2_000, show_default=True, help="Seeded customers.")
+@click.option("--products", default=1_000, show_default=True, help="Seeded products.")
+@click.option("--orders", default=20_000, show_default=True, help="Seeded orders.")
+@click.option("--seed", default=42, show_default=True)
+@click.option("--reseed", is_flag=True, help="Delete the rows and seed the database again.")
+@click.option("--users", default=100, show_default=True, help="Customers used by the clients.")
+@click.option("--concurrency", default=16, show_default=True)
+@click.option("--duration", default=10.0, show_default=True, help="Seconds measured.")
+@click.option("--warmup", default=2.0, show_default=True, help="Seconds before measuring.")
+@click.option("--mix", default=DEFAULT_MIX, show_default=True, help="The weights of the workloads.")
+@click.option("--transport", type=click.Choice(["asgi", "http"]), default="asgi", show_default=True)
+@click.option("--output", type=click.Path(dir_okay=False, path_type=Path), default=None)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="A previous report to compare with.",
+)
+@click.option("--serve", is_flag=True, hidden=True)
+@click.option("--port", default=0, hidden=True)
+def main(
+    database_url: str,
+    customers: int,
+    products: int,
+    orders: int,
+    seed: int,
+    reseed: bool,
+    users: int,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    mix: str,
+    transport: str,
+    output: Optional[Path],
+    compare: Optional[Path],
+    serve: bool,
+    port: int,
+) -> None:
+    """Run a load test of the API and report the latency of each endpoint."""
+    for key, value in DUMMY_ENV.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, str(ROOT))
+    engine: Any = use_database(database_url=database_url)
+
+    if serve:
+        import uvicorn
+
+        from e_commerce_app import create_app
+
+        uvicorn.run(create_app(), host="127.0.0.1", port=port, log_level="warning")
+        return
+
+    weights: dict[str, float] = parse_mix(mix=mix)
+    counts: dict[str, int] = prepare_database(
+        engine=engine,
+        customers=customers,
+        products=products,
+        orders=orders,
+        seed=seed,
+        reseed=reseed,
+    )
+    clients: list[dict[str, Any]] = load_users(engine=engine, n_users=users)
+    if not clients:
+        raise click.ClickException("No seeded customers (user0, user1, ...). Use --reseed.")
+    kwargs: dict[str, Any] = {
+        "users": clients,
+        "weights": weights,
+        "concurrency": concurrency,
+        "duration": duration,
+        "warmup": warmup,
+        "seed": seed,
+        "state": {"products": max(counts["products"], 1)},
+    }
+
+    click.echo(f"Running {concurrency} clients for {duration}s ({transport}): {mix}")
+    if transport == "asgi":
+        summary: dict[str, Any] = asyncio.run(drive_in_process(**kwargs))
+    else:
+        port = free_port()
+        process: subprocess.Popen[bytes] = start_server(database_url=database_url, port=port)
+        try:
+            summary = asyncio.run(drive(base_url=f"http://127.0.0.1:{port}", app=None, **kwargs))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report: dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": engine.url.render_as_string(hide_password=True),
+            "dataset": {**counts, "seed": seed},
+            "transport": transport,
+            "concurrency": concurrency,
+            "duration_s": duration,
+            "mix": weights,
+        },
+        **summary,
+    }
+    baseline: Optional[dict[str, Any]] = json.loads(compare.read_text()) if compare else None
+    print_report(report=report, baseline=baseline)
+    if output is not None:
+        output.write_text(json.dumps(report, indent=2))
+        click.echo(f"\nReport written to {output}")
+
+
+if __name__ == "__main__":
+    main()
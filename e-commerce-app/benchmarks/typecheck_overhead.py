@@ -0,0 +1,129 @@
+"""This is a micro-benchmark of the overhead added by typeguard's `@typechecked`.
+
+It runs the same workload twice, in fresh interpreters, with
+`TYPECHECK_ENABLED=true` and `TYPECHECK_ENABLED=false`, against an in-memory
+SQLite database and prints the time per call/request of each run.
+
+Usage:
+    python benchmarks/typecheck_overhead.py --requests 2000
+
+Author: Chinedu Ezeofor
+"""
+
+import json
+import os
+import subprocess
+import sys
+import timeit
+from pathlib import Path
+from typing import Any
+
+import click
+
+ROOT: Path = Path(__file__).absolute().parent.parent
+
+# Dummy credentials. Nothing connects to Postgres.
+DUMMY_ENV: dict[str, str] = {
+    "DB_USER": "bench",
+    "DB_PASSWORD": "bench",
+    "DB_NAME": "bench",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "SECRET_KEY": "bench-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}
+
+
+def run_workload(n_requests: int) -> dict[str, float]:
+    """Return the time per call (in microseconds) of each workload."""
+    from datetime import timedelta
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+
+    from e_commerce_app import create_app, models
+    from e_commerce_app.utils import crud
+    from e_commerce_app.utils.pagination import decode_cursor, encode_cursor
+    from e_commerce_app.v1.auth.jwt_auth import create_access_token
+
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    models.Base.metadata.create_all(engine)
+    models.SessionLocal.configure(bind=engine)
+    with models.SessionLocal() as db:
+        db.add(
+            models.Customers(
+                name="Bench",
+                username="bench",
+                email="bench@email.com",
+                hashed_password=crud.get_password_hash(password="password"),
+                shipping_address="Lagos",
+            )
+        )
+        db.commit()
+
+    token: str = create_access_token(
+        username="bench", user_id=1, expires_delta=timedelta(minutes=30)
+    )
+    client = TestClient(create_app())
+    headers: dict[str, str] = {"Authorization": f"Bearer {token}"}
+
+    def request() -> None:
+        response = client.get("/api/v1/customer/1", headers=headers)
+        assert response.status_code == 200, response.text
+
+    with models.SessionLocal() as db:
+        results: dict[str, float] = {
+            "encode/decode cursor (no I/O)": timeit.timeit(
+                lambda: decode_cursor(cursor=encode_cursor(last_id=42)), number=n_requests * 10
+            )
+            / (n_requests * 10),
+            "crud.get_customer (SQLite)": timeit.timeit(
+                lambda: crud.get_customer(db=db, id=1), number=n_requests
+            )
+            / n_requests,
+        }
+    request()  # warm up
+    results["GET /customer/{id} (full request)"] = (
+        timeit.timeit(request, number=n_requests) / n_requests
+    )
+    return {name: seconds * 1e6 for name, seconds in results.items()}
+
+
+def run_in_subprocess(enabled: bool, n_requests: int) -> dict[str, float]:
+    """This runs the workload in a fresh interpreter because the switch is read at
+    import time."""
+    env: dict[str, str] = {**DUMMY_ENV, **os.environ, "TYPECHECK_ENABLED": str(enabled).lower()}
+    output: str = subprocess.check_output(
+        [sys.executable, __file__, "--worker", "--requests", str(n_requests)],
+        env=env,
+        cwd=ROOT,
+        stderr=subprocess.DEVNULL,
+    ).decode("utf-8")
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@click.command()
+@click.option("--requests", "n_requests", default=2_000, help="Number of calls per workload.")
+@click.option("--worker", is_flag=True, hidden=True)
+def main(n_requests: int, worker: bool) -> None:
+    """Compare the time per call with and without typeguard."""
+    if worker:
+        sys.path.insert(0, str(ROOT))
+        click.echo(json.dumps(run_workload(n_requests=n_requests)))
+        return
+
+    enabled: dict[str, Any] = run_in_subprocess(enabled=True, n_requests=n_requests)
+    disabled: dict[str, Any] = run_in_subprocess(enabled=False, n_requests=n_requests)
+
+    click.echo(f"\n{'workload':<36}{'enabled (us)':>14}{'disabled (us)':>15}{'overhead':>10}")
+    for name in enabled:
+        overhead: float = (enabled[name] - disabled[name]) / disabled[name] * 100
+        click.echo(f"{name:<36}{enabled[name]:>14.1f}{disabled[name]:>15.1f}{overhead:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
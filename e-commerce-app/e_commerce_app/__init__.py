@@ -1,26 +1,95 @@
-# type: ignore
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
 
-from e_commerce_app.config import settings
+if TYPE_CHECKING:
+    from fastapi import FastAPI
 
 
-def create_app() -> FastAPI:
-    """This is used to create the app and add routers."""
+@asynccontextmanager
+async def lifespan(app: "FastAPI") -> AsyncIterator[None]:
+    """This is used to create the engines (and instrument them) and to start the
+    warmup on startup, and to close the connections on shutdown."""
+    from e_commerce_app import models
+    from e_commerce_app.config import get_settings
+    from e_commerce_app.utils.hashing import bulk_hasher, hasher
+    from e_commerce_app.utils.metrics import instrument_engine
+    from e_commerce_app.utils.order_queue import order_queue
+    from e_commerce_app.utils.replicas import replica_router
+    from e_commerce_app.utils.slow_query import slow_query_log
+    from e_commerce_app.utils.warmup import start_warmup
+
+    settings = get_settings()
+    models.init_engines()
+    engines: list[Any] = [models.engine]
+    if models.async_engine is not None:
+        engines.append(models.async_engine.sync_engine)
+    # The read replicas (if any, see `utils/replicas.py`).
+    engines.extend(replica_router.init())
+
+    for engine in engines:
+        # Record the number of queries and the time spent in the database.
+        if settings.metrics.METRICS_ENABLED:
+            instrument_engine(engine=engine)
+        # Log the slow queries (opt-in). They're available at /admin/slow-queries.
+        if settings.slow_query.SLOW_QUERY_ENABLED:
+            slow_query_log.instrument(engine=engine)
+
+    # `/health` reports ready when it's done (see `utils/warmup.py`).
+    warmup: Optional[asyncio.Task[None]] = start_warmup(app=app)
+    # Write the orders in batches (see `utils/order_queue.py`).
+    if settings.order_queue.ORDER_QUEUE_ENABLED:
+        order_queue.start()
+
+    yield
+    # The orders left in the queue are written before the engines are disposed.
+    await order_queue.stop()
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+        with suppress(asyncio.CancelledError):
+            await warmup
+    await models.dispose_engines()
+    await replica_router.dispose()
+    hasher.shutdown()
+    bulk_hasher.shutdown()
+
+
+def create_app() -> "FastAPI":
+    """This is used to create the app and add routers. The heavy imports, the
+    config and the settings are loaded here, not when the package is imported."""
 
     # ==== Included to avoid calling this multiple times. ====
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+
+    from e_commerce_app.config import get_settings
+    from e_commerce_app.config.settings import setup_app_logging
+    from e_commerce_app.utils import credentials
+    from e_commerce_app.utils.hashing import HashingOverloadedError, hashing_overloaded_handler
+    from e_commerce_app.utils.metrics import MetricsMiddleware
+    from e_commerce_app.utils.order_queue import OrderQueueFullError, order_queue_full_handler
     from e_commerce_app.v1.auth.jwt_auth import auth_router
+    from e_commerce_app.v1.routes.admin import admin_router
     from e_commerce_app.v1.routes.customers import customer_router
     from e_commerce_app.v1.routes.health import root_router
+    from e_commerce_app.v1.routes.metrics import metrics_router
     from e_commerce_app.v1.routes.orders import orders_router
     from e_commerce_app.v1.routes.products import products_router
 
+    settings = get_settings()
+    # json: JSON lines written on a background thread (LOGGING_MODE). The dev mode
+    # keeps the default handlers: the loguru intercept handler walks the stack
+    # of every record.
+    if settings.logging.LOGGING_MODE == "json":
+        setup_app_logging(config=settings)
+
     app: FastAPI = FastAPI(
         title=settings.PROJECT_NAME,
         openapi_url=f"/{settings.API_VERSION_STR}/openapi.json",
         docs_url=f"/{settings.API_VERSION_STR}/docs",
         redoc_url=f"/{settings.API_VERSION_STR}/redoc",
         version=settings.API_FLOAT_VERSION,
+        lifespan=lifespan,
     )
     # Set all CORS enabled origins
     if settings.BACKEND_CORS_ORIGINS:
@@ -32,11 +101,57 @@ def create_app() -> FastAPI:
             allow_headers=["*"],
         )
 
+    # Profile the requests of the admins that ask for it (X-Profile: 1).
+    if settings.profiling.PROFILING_ENABLED:
+        from e_commerce_app.utils.profiling import ProfilingMiddleware
+
+        app.add_middleware(ProfilingMiddleware, interval=settings.profiling.PROFILING_INTERVAL)
+
+    # Replay the responses of the create requests retried with the same Idempotency-Key.
+    if settings.idempotency.IDEMPOTENCY_ENABLED:
+        from e_commerce_app.utils.idempotency import IdempotencyMiddleware
+
+        paths: list[str] = ["customers/", "products/", "orders/"]
+        app.add_middleware(
+            IdempotencyMiddleware, paths=[f"/{settings.API_VERSION_STR}/{path}" for path in paths]
+        )
+
+    # Send the reads of the clients that have just written to the primary.
+    if credentials.REPLICA_URLS:
+        from e_commerce_app.utils.replicas import ReadYourWritesMiddleware
+
+        app.add_middleware(
+            ReadYourWritesMiddleware, window=settings.replica.REPLICA_READ_YOUR_WRITES_SECONDS
+        )
+
+    # Record the latency, status codes and database queries of every request.
+    # It's added last, i.e. it's the outermost middleware. The engines are
+    # instrumented on startup (see `lifespan`).
+    if settings.metrics.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+
+    # Reject the requests with 503 when the password hashing queue is full.
+    app.add_exception_handler(HashingOverloadedError, hashing_overloaded_handler)  # type: ignore[arg-type]
+    # Reject the orders with 503 when the order queue is full.
+    app.add_exception_handler(OrderQueueFullError, order_queue_full_handler)  # type: ignore[arg-type]
+
     # Add routers
     app.include_router(root_router)
+    if settings.metrics.METRICS_ENABLED:
+        app.include_router(metrics_router)
     app.include_router(customer_router, prefix=f"/{settings.API_VERSION_STR}")
     app.include_router(products_router, prefix=f"/{settings.API_VERSION_STR}")
     app.include_router(orders_router, prefix=f"/{settings.API_VERSION_STR}")
     app.include_router(auth_router, prefix=f"/{settings.API_VERSION_STR}")
+    app.include_router(admin_router, prefix=f"/{settings.API_VERSION_STR}")
 
     return app
+
+
+def __getattr__(name: str) -> Any:
+    # `from e_commerce_app import settings` loads the settings on first access.
+    if name == "settings":
+        from e_commerce_app.config import get_settings
+
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,27 @@
-from e_commerce_app.config.core import config
-from e_commerce_app.config.settings import settings  # type: ignore
+from typing import TYPE_CHECKING, Any
 
-__all__: list[str] = ["config", "settings"]
+if TYPE_CHECKING:
+    from e_commerce_app.config.settings import Settings
+
+__all__: list[str] = ["config", "get_settings"]
+
+
+def get_settings() -> "Settings":
+    """Return the settings. They're created (and the config file loaded) on the first call."""
+    # NB: `e_commerce_app.config.settings` is the module, so the settings are only
+    # exposed through this function.
+    from e_commerce_app.config.settings import get_settings as _get_settings
+
+    return _get_settings()
+
+
+def __getattr__(name: str) -> Any:
+    # The config file is loaded on first access (e.g. by `create_app`), not when
+    # the package is imported.
+    if name == "config":
+        from e_commerce_app.config.core import get_config
+
+        value: Any = get_config()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
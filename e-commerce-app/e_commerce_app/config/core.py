@@ -1,12 +1,10 @@
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Optional, Union
 
-import yaml  # type: ignore[import]
-from typeguard import typechecked
-
 # Custom Imports
 import e_commerce_app
-from e_commerce_app.logger_config import logger
+from e_commerce_app.utils.typecheck import typechecked
 from e_commerce_app.v1.schemas.api_schema import APIConfigSchema, ConfigVars, PathConfig
 
 SRC_ROOT: Path = Path(e_commerce_app.__file__).absolute().parent  # src/
@@ -17,6 +15,9 @@ CONFIG_FILEPATH: Path = SRC_ROOT / "config/config.yaml"
 @typechecked
 def load_yaml_file(*, filename: Optional[Path] = None) -> Union[dict[str, Any], None]:
     """This loads the YAML file as a dict."""
+    import yaml  # type: ignore[import]
+    from loguru import logger
+
     if filename is None:
         filename = CONFIG_FILEPATH
 
@@ -44,6 +45,18 @@ def validate_config_file(*, filename: Optional[Path] = None) -> ConfigVars:
     return config_file
 
 
-config: ConfigVars = validate_config_file(filename=None)
-DB_PATH: Path = ROOT / config.path_config.DB_PATH
-ENV_PATH: Path = ROOT / config.path_config.ENV_FILE_PATH
+@lru_cache(maxsize=None)
+def get_config() -> ConfigVars:
+    """Return the config. The YAML file is only loaded (and validated) on the first call."""
+    return validate_config_file(filename=None)
+
+
+def __getattr__(name: str) -> Any:
+    # `config`, `DB_PATH` and `ENV_PATH` are loaded on first access, not at import time.
+    if name == "config":
+        return get_config()
+    if name == "DB_PATH":
+        return ROOT / get_config().path_config.DB_PATH
+    if name == "ENV_PATH":
+        return ROOT / get_config().path_config.ENV_FILE_PATH
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,38 +1,189 @@
-# type: ignore
 import logging
 import sys
+from functools import lru_cache
 from types import FrameType
-from typing import cast
+from typing import Literal, cast
 
 from loguru import logger
-from pydantic import AnyHttpUrl
+from pydantic import AnyHttpUrl, Field
 from pydantic_settings import BaseSettings
 
-from e_commerce_app.config import config
+from e_commerce_app.config.core import get_config
 
 
 class LoggingSettings(BaseSettings):
+    """Logging settings. See `utils/json_logging.py` for the json mode."""
+
     LOGGING_LEVEL: int = logging.INFO
+    # dev: loguru on stderr. json: JSON lines written to stdout on a background thread.
+    LOGGING_MODE: Literal["dev", "json"] = "dev"
+    # The level of each logger (json), e.g. {"uvicorn.access": "WARNING"}.
+    LOGGING_LEVELS: dict[str, str] = {}
+    # Fraction of the successful access logs that's kept (json). 4xx/5xx are always kept.
+    LOGGING_ACCESS_SAMPLE_RATE: float = 1.0
+    # Max. number of records waiting to be written (json). The extra ones are dropped.
+    LOGGING_QUEUE_SIZE: int = 10_000
+
+
+class DatabaseSettings(BaseSettings):
+    """Connection pool settings. See `sqlalchemy.pool.QueuePool`."""
+
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1_800  # seconds
+    DB_POOL_TIMEOUT: float = 30.0  # seconds
+    # Use asyncpg + AsyncSession instead of psycopg2 + Session.
+    DB_ASYNC_MODE: bool = False
+
+
+class CacheSettings(BaseSettings):
+    """Cache settings. A size of 0 disables the in-process caches."""
+
+    AUTH_CACHE_SIZE: int = 10_000
+    AUTH_CACHE_TTL: float = 60.0  # seconds
+    # memory: in-process LRU (per worker). redis: shared by all the workers.
+    PRODUCT_CACHE_BACKEND: Literal["memory", "redis"] = "memory"
+    PRODUCT_CACHE_SIZE: int = 10_000
+    PRODUCT_CACHE_TTL: float = 30.0  # seconds
+    PRODUCT_CACHE_URL: str = "redis://localhost:6379/0"
+
+
+class HashingSettings(BaseSettings):
+    """Password hashing (bcrypt) executor settings."""
+
+    HASH_WORKERS: int = 4
+    # Workers of the signups (`POST /customers/`). Logins never wait behind them.
+    HASH_BULK_WORKERS: int = 2
+    # Max. number of jobs waiting for a worker before new ones are rejected (503).
+    HASH_QUEUE_LIMIT: int = 64
+    HASH_EXECUTOR_TYPE: Literal["thread", "process"] = "thread"
+
+
+class MetricsSettings(BaseSettings):
+    """Prometheus metrics (`GET /metrics`)."""
+
+    METRICS_ENABLED: bool = True
+
+
+class SlowQuerySettings(BaseSettings):
+    """Slow query log (`GET /admin/slow-queries`). It's disabled by default."""
+
+    SLOW_QUERY_ENABLED: bool = False
+    SLOW_QUERY_THRESHOLD: float = 0.5  # seconds
+    SLOW_QUERY_BUFFER_SIZE: int = 100
+    # Capture the plan of the slow SELECTs. On Postgres the query runs again (EXPLAIN ANALYZE).
+    SLOW_QUERY_EXPLAIN: bool = False
+
+
+class ProfilingSettings(BaseSettings):
+    """On-demand request profiling (`X-Profile: 1`). It requires `pyinstrument`."""
+
+    PROFILING_ENABLED: bool = False
+    PROFILING_INTERVAL: float = 0.001  # seconds between samples
+    PROFILING_BUFFER_SIZE: int = 20
+
+
+class WarmupSettings(BaseSettings):
+    """Warmup on startup. `/health` only reports ready when it's done."""
+
+    WARMUP_ENABLED: bool = True
+    # Connections opened in the pool(s) on startup. It's capped by DB_POOL_SIZE.
+    WARMUP_POOL_CONNECTIONS: int = 5
+
+
+class ServerSettings(BaseSettings):
+    """Production server: gunicorn with uvicorn workers (see `gunicorn.conf.py`)."""
+
+    # 0: one worker per CPU core.
+    SERVER_WORKERS: int = 0
+    SERVER_BACKLOG: int = 2_048
+    SERVER_KEEPALIVE: int = 5  # seconds
+    # Restart a worker after MAX_REQUESTS + randint(0, MAX_REQUESTS_JITTER) requests.
+    # The jitter keeps the workers from restarting at the same time. 0 disables it.
+    SERVER_MAX_REQUESTS: int = 10_000
+    SERVER_MAX_REQUESTS_JITTER: int = 1_000
+    SERVER_TIMEOUT: int = 30  # seconds
+    SERVER_GRACEFUL_TIMEOUT: int = 30  # seconds
+
+
+class ReplicaSettings(BaseSettings):
+    """Read replicas (`DB_REPLICA_URLS`). See `utils/replicas.py`."""
+
+    # round_robin or least_connections (the replica with the fewest reads in progress).
+    REPLICA_SELECTION: Literal["round_robin", "least_connections"] = "round_robin"
+    # A replica that fails is taken out of the rotation for this long.
+    REPLICA_EJECT_SECONDS: float = 30.0
+    # A client reads from the primary for this long after a write. 0 disables it.
+    REPLICA_READ_YOUR_WRITES_SECONDS: float = 5.0
+
+
+class OrderQueueSettings(BaseSettings):
+    """Write-behind queue of `POST /orders/` (group commit). See `utils/order_queue.py`."""
+
+    ORDER_QUEUE_ENABLED: bool = False
+    # A batch is written when it has MAX_BATCH orders or MAX_DELAY_MS after its first order.
+    ORDER_QUEUE_MAX_BATCH: int = 500
+    ORDER_QUEUE_MAX_DELAY_MS: float = 10.0
+    # Max. number of orders waiting. The extra ones are rejected (503).
+    ORDER_QUEUE_MAX_SIZE: int = 10_000
+    # Postgres only. off: faster commits, but a crash can lose the last (acknowledged) batches.
+    ORDER_QUEUE_SYNCHRONOUS_COMMIT: Literal[
+        "on", "off", "local", "remote_write", "remote_apply"
+    ] = "on"
+
+
+class IdempotencySettings(BaseSettings):
+    """`Idempotency-Key` support of the create endpoints. See `utils/idempotency.py`."""
+
+    IDEMPOTENCY_ENABLED: bool = True
+    # How long a response is replayed for the same key.
+    IDEMPOTENCY_TTL: float = 86_400.0  # seconds
+    # Max. number of responses cached in memory (per worker), in front of the table.
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    # A key still in progress after this long is considered abandoned (e.g. killed worker).
+    IDEMPOTENCY_LOCK_TIMEOUT: float = 60.0  # seconds
+
+
+# They are validated (i.e. converted to `AnyHttpUrl`) like the ones of the environment.
+DEFAULT_CORS_ORIGINS: list[str] = [
+    "http://localhost:3000",
+    "http://localhost:8000",
+    "https://localhost:3000",
+    "https://localhost:8000",
+]
 
 
 class Settings(BaseSettings):
     """These settings ca be overriden using environment variables."""
 
-    API_VERSION_STR: str = config.api_config_schema.API_VERSION_STR
-    API_FLOAT_VERSION: str = config.api_config_schema.API_FLOAT_VERSION
+    API_VERSION_STR: str = Field(
+        default_factory=lambda: get_config().api_config_schema.API_VERSION_STR
+    )
+    API_FLOAT_VERSION: str = Field(
+        default_factory=lambda: get_config().api_config_schema.API_FLOAT_VERSION
+    )
     HOST: str = "0.0.0.0"
     PORT: int = 8000
-    PROJECT_NAME: str = config.api_config_schema.PROJECT_NAME
+    PROJECT_NAME: str = Field(default_factory=lambda: get_config().api_config_schema.PROJECT_NAME)
     RELOAD: bool = False
-    logging: LoggingSettings = LoggingSettings()
+    logging: LoggingSettings = Field(default_factory=LoggingSettings)
+    database: DatabaseSettings = Field(default_factory=DatabaseSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    hashing: HashingSettings = Field(default_factory=HashingSettings)
+    metrics: MetricsSettings = Field(default_factory=MetricsSettings)
+    slow_query: SlowQuerySettings = Field(default_factory=SlowQuerySettings)
+    profiling: ProfilingSettings = Field(default_factory=ProfilingSettings)
+    warmup: WarmupSettings = Field(default_factory=WarmupSettings)
+    server: ServerSettings = Field(default_factory=ServerSettings)
+    replica: ReplicaSettings = Field(default_factory=ReplicaSettings)
+    order_queue: OrderQueueSettings = Field(default_factory=OrderQueueSettings)
+    idempotency: IdempotencySettings = Field(default_factory=IdempotencySettings)
 
     # BACKEND_CORS_ORIGINS is a comma-separated list of origins
-    BACKEND_CORS_ORIGINS: list[AnyHttpUrl] = [
-        "http://localhost:3000",
-        "http://localhost:8000",
-        "https://localhost:3000",
-        "https://localhost:8000",
-    ]
+    BACKEND_CORS_ORIGINS: list[AnyHttpUrl] = Field(
+        default=DEFAULT_CORS_ORIGINS, validate_default=True
+    )
 
     class Config:
         case_sensitive: bool = True
@@ -67,6 +218,17 @@ class InterceptHandler(logging.Handler):
 def setup_app_logging(config: Settings) -> None:
     """This is used to prepare custom logging for the app."""
 
+    if config.logging.LOGGING_MODE == "json":
+        from e_commerce_app.utils.json_logging import setup_json_logging
+
+        setup_json_logging(
+            level=config.logging.LOGGING_LEVEL,
+            levels=config.logging.LOGGING_LEVELS,
+            access_sample_rate=config.logging.LOGGING_ACCESS_SAMPLE_RATE,
+            queue_size=config.logging.LOGGING_QUEUE_SIZE,
+        )
+        return
+
     LOGGERS = ("uvicorn.asgi", "uvicorn.access")
     logging.getLogger().handlers = [InterceptHandler()]
     for logger_name in LOGGERS:
@@ -76,5 +238,7 @@ def setup_app_logging(config: Settings) -> None:
     logger.configure(handlers=[{"sink": sys.stderr, "level": config.logging.LOGGING_LEVEL}])
 
 
-# Create an instance
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Return the settings. They're created (and the config file loaded) on the first call."""
+    return Settings()
@@ -3,15 +3,17 @@
 Author: Chinedu Ezeofor
 """
 
-from typing import Any, Literal
+from pathlib import Path
+from typing import Any, Literal, Optional
 
 import click
 from psycopg2 import connect
 from psycopg2.errors import DuplicateDatabase, InvalidCatalogName
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-from typeguard import typechecked
 
+from e_commerce_app import models
 from e_commerce_app.logger_config import logger
+from e_commerce_app.utils.bulk_import import SUFFIXES, TABLES, BulkImporter
 from e_commerce_app.utils.credentials import (
     DB_HOST,
     DB_NAME,
@@ -19,6 +21,8 @@ from e_commerce_app.utils.credentials import (
     DB_PORT,
     DB_USER,
 )
+from e_commerce_app.utils.seed import END_DATE, SEED_PASSWORD, SeedError, seed_database
+from e_commerce_app.utils.typecheck import typechecked
 
 COMMANDS = Literal["create_db", "drop_db"]
 # PostgreSQL connection parameters
@@ -72,7 +76,7 @@ def drop_db() -> None:
 
 # ======== CLI ========
 @typechecked
-def get_ctx(ctx: Any) -> COMMANDS:
+def get_ctx(ctx: Any) -> Optional[COMMANDS]:
     """Return the required click context.
 
     Params:
@@ -81,9 +85,9 @@ def get_ctx(ctx: Any) -> COMMANDS:
 
     Returns:
     --------
-        command: (COMMANDS)
+        command: (Optional[COMMANDS])
     """
-    command: COMMANDS = ctx.obj.get("command")
+    command: Optional[COMMANDS] = ctx.obj.get("command")
     return command
 
 
@@ -98,7 +102,7 @@ def get_ctx(ctx: Any) -> COMMANDS:
 )
 @click.pass_context
 @typechecked
-def cli(ctx: Any, command: COMMANDS) -> None:
+def cli(ctx: Any, command: Optional[COMMANDS] = None) -> None:
     """Click command object."""
     ctx.ensure_object(dict)
     ctx.obj["command"] = command
@@ -121,5 +125,107 @@ def database_manager(ctx: Any) -> None:
     click.secho(message="\n\n ========== Done ========== ", bg="blue", fg="blue")
 
 
+@cli.command(name="import")
+@click.argument("source", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option("-t", "--table", type=click.Choice(list(TABLES)), required=True)
+@click.option(
+    "-f",
+    "--format",
+    "fmt",
+    type=click.Choice(sorted(set(SUFFIXES.values()))),
+    help="The format of the file. By default, it's inferred from its extension.",
+)
+@click.option("--chunk-size", type=int, default=50_000, show_default=True)
+@click.option(
+    "--hash-workers",
+    type=int,
+    default=0,
+    help="The processes hashing the passwords of the customers. Default: the number of CPUs.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    show_default=True,
+    help="Resume an interrupted import from its checkpoint.",
+)
+@typechecked
+def import_data(
+    source: Path,
+    table: str,
+    fmt: Optional[str],
+    chunk_size: int,
+    hash_workers: int,
+    resume: bool,
+) -> None:
+    """This is used to import a CSV, NDJSON or Parquet file into a table."""
+    click.secho(f"\n\n>>[INFO]: Importing {str(source)!r} into {table!r} <<")
+    importer = BulkImporter(
+        engine=models.engine,
+        table=table,  # type: ignore[arg-type]
+        chunk_size=chunk_size,
+        hash_workers=hash_workers,
+        echo=click.echo,
+    )
+    stats: dict[str, Any] = importer.run(path=source, fmt=fmt, resume=resume)  # type: ignore[arg-type]
+    logger.info(f"Import done: {stats}")
+    click.secho(message="\n\n ========== Done ========== ", bg="blue", fg="blue")
+
+
+@cli.command()
+@click.option("--customers", type=int, default=10_000, show_default=True)
+@click.option("--products", type=int, default=1_000, show_default=True)
+@click.option("--orders", type=int, default=100_000, show_default=True)
+@click.option("--seed", type=int, default=42, show_default=True)
+@click.option(
+    "--skew",
+    type=float,
+    default=0.7,
+    show_default=True,
+    help="The exponent of the Zipf distribution of the orders per customer.",
+)
+@click.option(
+    "--days", type=int, default=365, show_default=True, help="The date range of the orders."
+)
+@click.option(
+    "--end-date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    default=str(END_DATE),
+    show_default=True,
+    help="The date of the most recent orders.",
+)
+@click.option("--reset", is_flag=True, help="Delete the customers, products and orders first.")
+@typechecked
+def seed(
+    customers: int,
+    products: int,
+    orders: int,
+    seed: int,
+    skew: float,
+    days: int,
+    end_date: Any,
+    reset: bool,
+) -> None:
+    """This is used to fill the database with a reproducible synthetic dataset."""
+    click.secho(f"\n\n>>[INFO]: Seeding the database (seed={seed}) <<")
+    try:
+        stats: dict[str, Any] = seed_database(
+            engine=models.engine,
+            customers=customers,
+            products=products,
+            orders=orders,
+            seed=seed,
+            skew=skew,
+            days=days,
+            end_date=end_date.date(),
+            reset=reset,
+            echo=click.echo,
+        )
+    except SeedError as err:
+        raise click.ClickException(str(err)) from err
+    logger.info(f"Seeding done: {stats}")
+    click.echo(f"The password of the customers (user0, user1, ...) is {SEED_PASSWORD!r}.")
+    click.secho(message="\n\n ========== Done ========== ", bg="blue", fg="blue")
+
+
 if __name__ == "__main__":
     cli(obj={})
@@ -1,8 +1,7 @@
 import logging
-from typing import Optional
+from typing import Any, Optional
 
-from rich.logging import RichHandler
-from typeguard import typechecked
+from e_commerce_app.utils.typecheck import typechecked
 
 
 @typechecked
@@ -12,6 +11,9 @@ def get_rich_logger(name: Optional[str] = "richLogger") -> logging.Logger:
     # Create logger if it doesn't exist
     logger = logging.getLogger(name)
     if not logger.handlers:
+        # Imported here: rich is slow to import and only the CLI uses this logger.
+        from rich.logging import RichHandler
+
         logger.setLevel(logging.DEBUG)
 
         # Create console handler with formatting
@@ -30,4 +32,8 @@ def get_rich_logger(name: Optional[str] = "richLogger") -> logging.Logger:
     return logger
 
 
-logger = get_rich_logger()
+def __getattr__(name: str) -> Any:
+    # The logger is created on first access, not at import time.
+    if name == "logger":
+        return get_rich_logger()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
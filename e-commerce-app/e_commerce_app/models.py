@@ -3,14 +3,28 @@
 Author: Chinedu Ezeofor
 """
 
+import os
+import threading
 from datetime import datetime
-from typing import Any, Literal
+from typing import Any, AsyncGenerator, Generator, Literal, Optional, Union
 
 from sqlalchemy import (
     DateTime,
     ForeignKey,
+    Index,
     String,
+    Text,
     create_engine,
+    func,
+    literal,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
 )
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -18,26 +32,134 @@ from sqlalchemy.orm import (
     Session,
     mapped_column,
     relationship,
+    sessionmaker,
 )
-from typeguard import typechecked
-
-from e_commerce_app.utils.credentials import (
-    DB_HOST,
-    DB_NAME,
-    DB_PASSWORD,
-    DB_PORT,
-    DB_USER,
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils import credentials
+from e_commerce_app.utils.pool_stats import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    get_pool_stats,
 )
+from e_commerce_app.utils.typecheck import typechecked
 
 # Sqlite dialect
 # path: str = f"sqlite:///{DB_PATH}"
 # engine = create_engine(path, echo=False, connect_args={"check_same_thread": False})
 
-# Postgres dialect
-SQLALCHEMY_DATABASE_URL: str = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=False)
+# The engines and the session factories are created by `init_engines()`, on
+# startup (see `create_app`) or on first access, not when the module is imported.
+# Every request gets its own session (and connection) from the pool.
+# Async mode: asyncpg + AsyncSession. `async_engine` is None when it's disabled.
+ENGINE_NAMES: frozenset[str] = frozenset(
+    {"engine", "SessionLocal", "async_engine", "AsyncSessionLocal"}
+)
+engine: Engine
+SessionLocal: sessionmaker[Session]
+async_engine: Optional[AsyncEngine]
+AsyncSessionLocal: Optional[async_sessionmaker[AsyncSession]]
+_engines_lock = threading.Lock()
+
+
+@typechecked
+def get_database_url(driver: str = "postgresql") -> str:
+    """Return the URL of the database, e.g. `postgresql+asyncpg` for the async engine."""
+    return (
+        f"{driver}://{credentials.DB_USER}:{credentials.DB_PASSWORD}"
+        f"@{credentials.DB_HOST}:{credentials.DB_PORT}/{credentials.DB_NAME}"
+    )
+
+
+@typechecked
+def get_pool_kwargs() -> dict[str, Any]:
+    """Return the connection pool settings of the engines."""
+    database = get_settings().database
+    return {
+        "pool_size": database.DB_POOL_SIZE,
+        "max_overflow": database.DB_MAX_OVERFLOW,
+        "pool_pre_ping": database.DB_POOL_PRE_PING,
+        "pool_recycle": database.DB_POOL_RECYCLE,
+        "pool_timeout": database.DB_POOL_TIMEOUT,
+    }
+
+
+def init_engines() -> None:
+    """This is used to create the engines and bind the session factories. It only
+    runs once; the ones that are already set (e.g. replaced in tests) are kept."""
+    namespace: dict[str, Any] = globals()
+    if ENGINE_NAMES.issubset(namespace):
+        return
+
+    with _engines_lock:
+        if "engine" not in namespace:
+            namespace["engine"] = create_engine(
+                get_database_url(),
+                echo=False,
+                poolclass=InstrumentedQueuePool,
+                **get_pool_kwargs(),
+            )
+        if "SessionLocal" not in namespace:
+            namespace["SessionLocal"] = sessionmaker(
+                bind=namespace["engine"], autoflush=False, expire_on_commit=False
+            )
+        if "async_engine" not in namespace:
+            namespace["async_engine"] = (
+                create_async_engine(
+                    get_database_url(driver="postgresql+asyncpg"),
+                    echo=False,
+                    poolclass=InstrumentedAsyncQueuePool,
+                    **get_pool_kwargs(),
+                )
+                if get_settings().database.DB_ASYNC_MODE
+                else None
+            )
+        if "AsyncSessionLocal" not in namespace:
+            namespace["AsyncSessionLocal"] = (
+                async_sessionmaker(
+                    bind=namespace["async_engine"], autoflush=False, expire_on_commit=False
+                )
+                if namespace["async_engine"] is not None
+                else None
+            )
+
+
+async def dispose_engines() -> None:
+    """This is used to close the connections of the pools, e.g. on shutdown."""
+    if "async_engine" in globals() and async_engine is not None:
+        await async_engine.dispose()
+    if "engine" in globals():
+        engine.dispose()
+
+
+def _reset_engines_after_fork() -> None:
+    """This replaces the pools of the engines in a forked process (e.g. a gunicorn
+    worker), so it never uses the connections of its parent. They aren't closed:
+    they still belong to the parent."""
+    namespace: dict[str, Any] = globals()
+    if "engine" in namespace:
+        engine.dispose(close=False)
+    if namespace.get("async_engine") is not None:
+        async_engine.sync_engine.dispose(close=False)  # type: ignore[union-attr]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
+
+
+def __getattr__(name: str) -> Any:
+    if name in ENGINE_NAMES:
+        init_engines()
+        return globals()[name]
+    # Kept for alembic (`env.py`).
+    if name == "SQLALCHEMY_DATABASE_URL":
+        return get_database_url()
+    if name == "ASYNC_SQLALCHEMY_DATABASE_URL":
+        return get_database_url(driver="postgresql+asyncpg")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-session_local = Session(bind=engine)
+AnySession = Union[Session, AsyncSession]
 Status = Literal["pending", "processing", "shipped", "delivered"]
 Default: str = "null"
 
@@ -50,15 +172,36 @@ def format_date(date_string: str, date_format: str = "%d-%m-%Y") -> datetime:
     return formatted_date
 
 
-def get_db() -> None:  # type: ignore[misc]
-    """This is used to load the database instance."""
-    db: Session = session_local
+def get_db() -> Generator[Session, None, None]:
+    """This is used to create a new database session for each request.
+    The connection is returned to the pool when the request is done."""
+    init_engines()
+    db: Session = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """This is used to create a new async database session for each request."""
+    init_engines()
+    async with AsyncSessionLocal() as db:  # type: ignore[misc]
+        yield db
+
+
+# The session dependency used by the routers. It's selected with `DB_ASYNC_MODE`.
+get_session = get_async_db if get_settings().database.DB_ASYNC_MODE else get_db
+
+
+@typechecked
+def pool_status() -> dict[str, Any]:
+    """Return the connection pool statistics of the active engine."""
+    init_engines()
+    pool: Any = async_engine.pool if async_engine is not None else engine.pool
+    return get_pool_stats(pool=pool)
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -68,8 +211,10 @@ class Customers(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
-    username: Mapped[str] = mapped_column(String(255), default=Default, nullable=False)
-    email: Mapped[str] = mapped_column(String(255), nullable=False)
+    username: Mapped[str] = mapped_column(
+        String(255), default=Default, nullable=False, unique=True, index=True
+    )
+    email: Mapped[str] = mapped_column(String(255), nullable=False, unique=True, index=True)
     hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
     billing_address: Mapped[str] = mapped_column(String(255), nullable=True)
     shipping_address: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -89,7 +234,7 @@ class Products(Base):
     __tablename__: str = "products"
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    name: Mapped[str] = mapped_column(String(255), nullable=False, index=True)
     description: Mapped[str] = mapped_column(String(255), nullable=False)
     tags: Mapped[str] = mapped_column(String(255), nullable=False)
     price: Mapped[float] = mapped_column(nullable=False)
@@ -101,8 +246,45 @@ class Products(Base):
         )
 
 
+class IdempotencyKeys(Base):
+    """The responses of the requests sent with an `Idempotency-Key` header
+    (see `utils/idempotency.py`). `status_code` is None while it's in progress."""
+
+    __tablename__: str = "idempotency_keys"
+
+    # sha256 of the client, the route and the key.
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    status_code: Mapped[Optional[int]] = mapped_column(nullable=True)
+    response: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"({self.__class__.__name__}(key={self.key!r}, status_code={self.status_code!r}, "
+            f"expires_at={self.expires_at!r})"
+        )
+
+
+# Product search (Postgres only). The literals are rendered inline (not bound) so
+# the queries use exactly the same expressions as the GIN indexes.
+product_document: Any = func.to_tsvector(
+    literal("english", literal_execute=True),
+    Products.name + literal(" ", literal_execute=True) + Products.description,
+)
+product_tags: Any = func.regexp_split_to_array(
+    func.lower(func.trim(Products.tags)),
+    literal("[[:space:]]*,[[:space:]]*", literal_execute=True),
+    type_=ARRAY(Text),
+)
+Index("ix_products_document", product_document, postgresql_using="gin").ddl_if(dialect="postgresql")
+Index("ix_products_tags", product_tags, postgresql_using="gin").ddl_if(dialect="postgresql")
+
+
 class Orders(Base):
     __tablename__: str = "orders"
+    __table_args__ = (Index("ix_orders_customer_id_status", "customer_id", "status"),)
 
     id: Mapped[int] = mapped_column(primary_key=True)
     customer_id: Mapped[int] = mapped_column(ForeignKey("customers.id"), nullable=False)
@@ -0,0 +1,97 @@
+"""This module contains the async variants of the functions in `crud`.
+
+Each variant accepts either a `Session` or an `AsyncSession`:
+    - AsyncSession: the crud function runs on the asyncpg connection via
+      `AsyncSession.run_sync`, so it never blocks the event loop.
+    - Session: the crud function runs in the threadpool.
+
+The read-only functions run on a read replica when there are replicas (see
+`utils/replicas.py`). `db` is then only used if the read must run on the
+primary (e.g. after a write of the client) or if the replica fails.
+
+Author: Chinedu Ezeofor
+"""
+
+from functools import wraps
+from typing import Any, AsyncIterator, Callable, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from e_commerce_app.models import AnySession
+from e_commerce_app.utils import crud
+from e_commerce_app.utils.replicas import Replica, ReplicaUnavailableError, replica_router
+
+
+def _asyncify(func: Callable[..., Any], read_only: bool = False) -> Callable[..., Any]:
+    """This is used to create an awaitable variant of a crud function. The
+    `read_only` ones are sent to a replica if there's one."""
+
+    @wraps(func)
+    async def wrapper(db: AnySession, **kwargs: Any) -> Any:
+        replica: Optional[Replica] = replica_router.choose() if read_only else None
+        if replica is not None:
+            try:
+                return await replica_router.run(replica, func, **kwargs)
+            except ReplicaUnavailableError:
+                pass  # The replica is ejected. The read runs on the primary.
+        if isinstance(db, AsyncSession):
+            return await db.run_sync(lambda session: func(db=session, **kwargs))
+        return await run_in_threadpool(func, db=db, **kwargs)
+
+    return wrapper
+
+
+authenticate_user = _asyncify(crud.authenticate_user)
+get_customer = _asyncify(crud.get_customer, read_only=True)
+get_customer_by_email = _asyncify(crud.get_customer_by_email, read_only=True)
+get_customer_by_username = _asyncify(crud.get_customer_by_username, read_only=True)
+get_customers = _asyncify(crud.get_customers, read_only=True)
+create_customer = _asyncify(crud.create_customer)
+create_customers = _asyncify(crud.create_customers)
+get_products_by_name = _asyncify(crud.get_products_by_name, read_only=True)
+get_products_by_id = _asyncify(crud.get_products_by_id, read_only=True)
+get_products = _asyncify(crud.get_products, read_only=True)
+create_product = _asyncify(crud.create_product)
+create_products = _asyncify(crud.create_products)
+search_products = _asyncify(crud.search_products, read_only=True)
+get_orders = _asyncify(crud.get_orders, read_only=True)
+get_orders_by_id_n_status = _asyncify(crud.get_orders_by_id_n_status, read_only=True)
+create_order = _asyncify(crud.create_order)
+create_orders = _asyncify(crud.create_orders)
+
+
+async def run_in_session(func: Callable[..., Any], **kwargs: Any) -> Any:
+    """This is used to run a crud function in a new session of its own, i.e.
+    outside of a request (e.g. in a background task or a middleware)."""
+    from e_commerce_app import models
+
+    if models.AsyncSessionLocal is not None:
+        async with models.AsyncSessionLocal() as db:
+            return await db.run_sync(lambda session: func(db=session, **kwargs))
+
+    def run() -> Any:
+        with models.SessionLocal() as db:
+            return func(db=db, **kwargs)
+
+    return await run_in_threadpool(run)
+
+
+async def close_session(db: AnySession) -> None:
+    """This is used to return the connection of the session to the pool, e.g.
+    before a long wait. The session can still be used afterwards."""
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        # Not in the threadpool: its threads may all be waiting for this connection.
+        db.close()
+
+
+async def stream_rows(
+    db: AsyncSession, model: Any, columns: list[str], chunk_size: int = 1_000
+) -> AsyncIterator[Sequence[Any]]:
+    """Async variant of `crud.stream_rows`. It uses `AsyncSession.stream`."""
+    stmt: Any = crud.get_export_stmt(model=model, columns=columns, chunk_size=chunk_size)
+    result: Any = await db.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
@@ -0,0 +1,29 @@
+"""This module contains the caches used to authenticate requests.
+
+    - token_cache: verified JWT -> the token data (user_id, username).
+    - user_cache: username -> the resolved user.
+
+Author: Chinedu Ezeofor
+"""
+
+from typing import Any
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils.cache import TTLCache
+from e_commerce_app.utils.typecheck import typechecked
+
+_cache_settings = get_settings().cache
+token_cache = TTLCache(maxsize=_cache_settings.AUTH_CACHE_SIZE, ttl=_cache_settings.AUTH_CACHE_TTL)
+user_cache = TTLCache(maxsize=_cache_settings.AUTH_CACHE_SIZE, ttl=_cache_settings.AUTH_CACHE_TTL)
+
+
+@typechecked
+def invalidate_user(username: str) -> None:
+    """This is used to drop the cached user when the customer record changes."""
+    user_cache.delete(username)
+
+
+@typechecked
+def auth_cache_stats() -> dict[str, Any]:
+    """Return the statistics of the token and the user caches."""
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
@@ -0,0 +1,415 @@
+"""This module is used for importing large files (CSV, NDJSON, Parquet) into the
+`customers`, `products` or `orders` tables (see the `import` command of `database.py`).
+
+The file is read and written in chunks of `chunk_size` rows, i.e. the memory
+use doesn't depend on the size of the file:
+    - each row is validated with its schema of `db_schema`. The invalid rows are
+      written to a rejects file (NDJSON) with their row number and errors.
+    - the passwords of the customers are hashed on a pool of processes (the
+      `hashed_password` (or `password`) column holds the plain passwords, unless
+      they're already hashed).
+    - on Postgres, the rows are written with `COPY ... FROM STDIN`. The customers
+      go through a temporary table, so the ones whose email or username is
+      already registered are skipped (`ON CONFLICT DO NOTHING`). The orders whose
+      customer doesn't exist are rejected. Other databases use `executemany`.
+    - every chunk is committed on its own and recorded in a checkpoint file. An
+      interrupted import resumes after the last committed chunk. On Postgres,
+      the id of the transaction of the chunk is recorded before the commit, so
+      the chunk is neither skipped nor imported twice if it died in between.
+      Other databases commit the chunk before the checkpoint is saved: if the
+      import dies in between, the chunk is imported again when it resumes (the
+      customers already registered are skipped, the other rows are duplicated).
+    - the rejects of a chunk are written before the chunk is committed, so they're
+      never lost (they may be written twice if the import dies in between).
+
+Author: Chinedu Ezeofor
+"""
+
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterator, Literal, Optional
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from e_commerce_app import models
+from e_commerce_app.utils.hashing import HashingExecutor, hash_many
+from e_commerce_app.utils.typecheck import typechecked
+from e_commerce_app.v1.schemas import db_schema
+
+FileFormat = Literal["csv", "ndjson", "parquet"]
+TableName = Literal["customers", "products", "orders"]
+
+TABLES: dict[str, tuple[Any, type[BaseModel]]] = {
+    "customers": (models.Customers, db_schema.CustomersSchemaInDB),
+    "products": (models.Products, db_schema.ProductsSchema),
+    "orders": (models.Orders, db_schema.OrdersSchema),
+}
+SUFFIXES: dict[str, FileFormat] = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".parquet": "parquet",
+}
+# The prefixes of the hashes of passlib's bcrypt.
+BCRYPT_PREFIXES: tuple[str, ...] = ("$2a$", "$2b$", "$2y$")
+
+
+@typechecked
+def detect_format(path: Path) -> FileFormat:
+    """Return the format of the file from its extension."""
+    suffix: str = path.suffix.lower()
+    if suffix not in SUFFIXES:
+        raise ValueError(f"Unknown file format {suffix!r}. Use one of {sorted(SUFFIXES)}.")
+    return SUFFIXES[suffix]
+
+
+def read_rows(path: Path, fmt: FileFormat, batch_size: int = 10_000) -> Iterator[dict[str, Any]]:
+    """Yield the rows of the file one at a time. Parquet requires `pyarrow`."""
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.DictReader(file):
+                # An empty cell is a missing value.
+                yield {key: (value if value != "" else None) for key, value in row.items()}
+    elif fmt == "ndjson":
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as err:
+            raise ImportError(
+                "Parquet files require the `parquet` extra: poetry install --extras parquet"
+            ) from err
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+
+
+@typechecked
+def validate_rows(
+    rows: list[dict[str, Any]], schema: type[BaseModel], first_row: int
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """Return the valid rows (dumped by the schema) and the rejected ones (with
+    their row number in the file and their errors)."""
+    valid: list[dict[str, Any]] = []
+    rejected: list[dict[str, Any]] = []
+    for idx, row in enumerate(rows):
+        if "password" in row and "hashed_password" not in row:
+            row["hashed_password"] = row.pop("password")
+        try:
+            valid.append(schema.model_validate(row).model_dump())
+        except ValidationError as err:
+            rejected.append(
+                {"row": first_row + idx, "errors": err.errors(include_url=False), "data": row}
+            )
+    return valid, rejected
+
+
+def _copy_value(value: Any) -> str:
+    """Return the value in the text format of `COPY`."""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+@typechecked
+def to_copy_buffer(rows: list[dict[str, Any]], columns: list[str]) -> io.StringIO:
+    """Return the rows in the text format of `COPY` (tab-separated)."""
+    buffer = io.StringIO()
+    buffer.writelines(
+        "\t".join(_copy_value(row[column]) for column in columns) + "\n" for row in rows
+    )
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(cursor: Any, table: str, columns: list[str], rows: list[dict[str, Any]]) -> int:
+    """This writes the rows with `COPY ... FROM STDIN` (psycopg2). Return the
+    number of rows."""
+    buffer: io.StringIO = to_copy_buffer(rows=rows, columns=columns)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    return cursor.rowcount
+
+
+class Checkpoint:
+    """The progress of an import, saved to a JSON file after every chunk.
+
+    `rows` is the number of rows of the file that are done (imported or rejected).
+    `pending` is the chunk being committed: its last row and, on Postgres, the id
+    of its transaction."""
+
+    def __init__(self, path: Path, source: Path, table: str) -> None:
+        self.path: Path = path
+        self.source: dict[str, Any] = {
+            "file": str(source.absolute()),
+            "size": source.stat().st_size,
+            "mtime": source.stat().st_mtime,
+            "table": table,
+        }
+        self.rows: int = 0
+        self.pending: Optional[dict[str, Any]] = None
+
+    def load(self) -> bool:
+        """This loads the checkpoint. Return False if there's none for this file
+        (i.e. the file or the table changed)."""
+        if not self.path.exists():
+            return False
+        data: dict[str, Any] = json.loads(self.path.read_text())
+        if data.get("source") != self.source:
+            return False
+        self.rows = data["rows"]
+        self.pending = data.get("pending")
+        return True
+
+    def save(self, rows: int, pending: Optional[dict[str, Any]] = None) -> None:
+        """This saves the checkpoint (atomically, i.e. it's never half-written)."""
+        self.rows, self.pending = rows, pending
+        data: dict[str, Any] = {"source": self.source, "rows": rows, "pending": pending}
+        tmp_path: Path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, self.path)
+
+    def delete(self) -> None:
+        """This is used to delete the checkpoint once the import is done."""
+        self.path.unlink(missing_ok=True)
+
+
+class BulkImporter:
+    """Imports the rows of a file into a table, one chunk (and transaction) at a time."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        table: TableName,
+        chunk_size: int = 50_000,
+        hash_workers: int = 0,
+        echo: Callable[[str], Any] = print,
+    ) -> None:
+        self.engine: Engine = engine
+        self.table: TableName = table
+        self.model, self.schema = TABLES[table]
+        self.columns: list[str] = list(self.schema.model_fields)
+        self.chunk_size: int = chunk_size
+        self.hash_workers: int = hash_workers or os.cpu_count() or 1
+        self.echo: Callable[[str], Any] = echo
+        self.is_postgres: bool = engine.dialect.name == "postgresql"
+        self._hasher: Optional[HashingExecutor] = None
+
+    def hash_passwords(self, rows: list[dict[str, Any]]) -> None:
+        """This hashes the passwords of the rows (in place) on a pool of processes.
+        The passwords that are already bcrypt hashes are kept."""
+        indices: list[int] = [
+            idx
+            for idx, row in enumerate(rows)
+            if not row["hashed_password"].startswith(BCRYPT_PREFIXES)
+        ]
+        if not indices:
+            return
+        if self._hasher is None:
+            self._hasher = HashingExecutor(
+                max_workers=self.hash_workers, queue_limit=0, executor_type="process"
+            )
+        n_jobs: int = min(len(indices), self.hash_workers * 4)
+        jobs: list[list[int]] = [indices[idx::n_jobs] for idx in range(n_jobs)]
+        passwords: list[list[str]] = [[rows[idx]["hashed_password"] for idx in job] for job in jobs]
+        for job, hashed in zip(jobs, self._hasher.executor.map(hash_many, passwords)):
+            for idx, password in zip(job, hashed):
+                rows[idx]["hashed_password"] = password
+
+    def reject_unknown_customers(
+        self, rows: list[dict[str, Any]], first_rows: list[int]
+    ) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """Return the orders whose customer exists and the rejected ones."""
+        customer_ids: set[int] = {row["customer_id"] for row in rows}
+        with self.engine.connect() as conn:
+            stmt: Any = select(models.Customers.id).where(models.Customers.id.in_(customer_ids))
+            existing: set[int] = set(conn.scalars(stmt).all())
+        valid: list[dict[str, Any]] = []
+        rejected: list[dict[str, Any]] = []
+        for row, row_number in zip(rows, first_rows):
+            if row["customer_id"] in existing:
+                valid.append(row)
+            else:
+                detail: str = f"customer_id={row['customer_id']} is not present in table!"
+                rejected.append({"row": row_number, "errors": [{"msg": detail}], "data": row})
+        return valid, rejected
+
+    def _copy(self, cursor: Any, rows: list[dict[str, Any]]) -> int:
+        if self.table != "customers":
+            return copy_rows(cursor=cursor, table=self.table, columns=self.columns, rows=rows)
+
+        # The customers that are already registered (email/username) are skipped.
+        columns: str = ", ".join(self.columns)
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS import_customers ON COMMIT DELETE ROWS "
+            f"AS SELECT {columns} FROM customers WITH NO DATA"
+        )
+        copy_rows(cursor=cursor, table="import_customers", columns=self.columns, rows=rows)
+        cursor.execute(
+            f"INSERT INTO customers ({columns}) SELECT {columns} FROM import_customers "
+            "ON CONFLICT DO NOTHING"
+        )
+        return cursor.rowcount
+
+    def write_postgres(
+        self, connection: Any, rows: list[dict[str, Any]], checkpoint: Checkpoint, done: int
+    ) -> int:
+        """This writes the chunk with `COPY` in one transaction. Return the number
+        of inserted rows."""
+        cursor: Any = connection.cursor()
+        try:
+            cursor.execute("SELECT txid_current()")
+            txid: int = cursor.fetchone()[0]
+            checkpoint.save(rows=checkpoint.rows, pending={"rows": done, "txid": txid})
+            inserted: int = self._copy(cursor=cursor, rows=rows) if rows else 0
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        return inserted
+
+    def write_generic(self, rows: list[dict[str, Any]]) -> int:
+        """This writes the chunk with `executemany` in one transaction (e.g. SQLite).
+        Return the number of rows."""
+        if not rows:
+            return 0
+        stmt: Any = insert(self.model)
+        if self.table == "customers":
+            dialect_insert: dict[str, Any] = {
+                "postgresql": postgresql.insert,
+                "sqlite": sqlite.insert,
+            }
+            if self.engine.dialect.name in dialect_insert:
+                stmt = dialect_insert[self.engine.dialect.name](self.model).on_conflict_do_nothing()
+        with self.engine.begin() as conn:
+            result: Any = conn.execute(stmt, rows)
+        return max(result.rowcount, 0)
+
+    def resume(self, checkpoint: Checkpoint) -> int:
+        """Return the number of rows of the file that are already done. A pending
+        chunk is done if its transaction was committed."""
+        if checkpoint.pending is None:
+            return checkpoint.rows
+        with self.engine.connect() as conn:
+            status: Optional[str] = conn.exec_driver_sql(
+                "SELECT txid_status(%(txid)s)", {"txid": checkpoint.pending["txid"]}
+            ).scalar()
+        if status == "committed":
+            checkpoint.save(rows=checkpoint.pending["rows"])
+        else:
+            checkpoint.save(rows=checkpoint.rows)
+        return checkpoint.rows
+
+    @typechecked
+    def run(
+        self,
+        path: Path,
+        fmt: Optional[FileFormat] = None,
+        checkpoint_path: Optional[Path] = None,
+        rejects_path: Optional[Path] = None,
+        resume: bool = True,
+    ) -> dict[str, Any]:
+        """This imports the file. Return the number of rows read, inserted,
+        skipped (already registered customers) and rejected, and the rows/sec."""
+        fmt = fmt or detect_format(path)
+        checkpoint = Checkpoint(
+            path=checkpoint_path or path.with_name(path.name + ".checkpoint.json"),
+            source=path,
+            table=self.table,
+        )
+        rejects_path = rejects_path or path.with_name(path.name + ".rejects.ndjson")
+        start_row: int = 0
+        if resume and checkpoint.load():
+            start_row = self.resume(checkpoint=checkpoint)
+            self.echo(f"Resuming after row {start_row:,} (checkpoint: {checkpoint.path})")
+            if not self.is_postgres:
+                self.echo(
+                    f"Warning: on {self.engine.dialect.name}, the chunk after row "
+                    f"{start_row:,} is imported again if it was committed before the "
+                    "import stopped (only Postgres imports every row exactly once)."
+                )
+        else:
+            checkpoint.save(rows=0)
+
+        stats: dict[str, Any] = {"read": 0, "inserted": 0, "skipped": 0, "rejected": 0}
+        rows: Iterator[dict[str, Any]] = itertools.islice(
+            read_rows(path=path, fmt=fmt), start_row, None
+        )
+        done: int = start_row
+        start: float = time.perf_counter()
+        connection: Any = self.engine.raw_connection() if self.is_postgres else None
+        try:
+            with open(rejects_path, "a", encoding="utf-8") as rejects:
+                while chunk := list(itertools.islice(rows, self.chunk_size)):
+                    valid, rejected = validate_rows(
+                        rows=chunk, schema=self.schema, first_row=done + 1
+                    )
+                    if self.table == "orders" and valid:
+                        invalid: set[int] = {item["row"] for item in rejected}
+                        row_numbers: list[int] = [
+                            row_number
+                            for row_number in range(done + 1, done + 1 + len(chunk))
+                            if row_number not in invalid
+                        ]
+                        valid, unknown = self.reject_unknown_customers(
+                            rows=valid, first_rows=row_numbers
+                        )
+                        rejected += unknown
+                    if self.table == "customers" and valid:
+                        self.hash_passwords(rows=valid)
+
+                    # The rejects are on disk before the chunk is marked as done.
+                    for item in rejected:
+                        rejects.write(json.dumps(item, default=str) + "\n")
+                    rejects.flush()
+                    os.fsync(rejects.fileno())
+
+                    done += len(chunk)
+                    if self.is_postgres:
+                        inserted: int = self.write_postgres(
+                            connection=connection, rows=valid, checkpoint=checkpoint, done=done
+                        )
+                    else:
+                        inserted = self.write_generic(rows=valid)
+                    checkpoint.save(rows=done)
+
+                    stats["read"] += len(chunk)
+                    stats["inserted"] += inserted
+                    stats["skipped"] += len(valid) - inserted
+                    stats["rejected"] += len(rejected)
+                    rate: float = stats["read"] / (time.perf_counter() - start)
+                    self.echo(
+                        f"{done:,} rows | {stats['inserted']:,} inserted | "
+                        f"{stats['skipped']:,} skipped | {stats['rejected']:,} rejected | "
+                        f"{rate:,.0f} rows/s"
+                    )
+        finally:
+            if connection is not None:
+                connection.close()
+            if self._hasher is not None:
+                self._hasher.shutdown()
+
+        checkpoint.delete()
+        stats["seconds"] = round(time.perf_counter() - start, 3)
+        stats["rows_per_second"] = (
+            round(stats["read"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        )
+        stats["rejects_file"] = str(rejects_path) if stats["rejected"] else None
+        return stats
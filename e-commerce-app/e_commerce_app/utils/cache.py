@@ -0,0 +1,213 @@
+"""This module contains the cache backends used by the API.
+
+    - TTLCache: in-process LRU cache (one per worker).
+    - RedisCache: cache shared by all the workers. It requires `redis` (optional).
+
+Author: Chinedu Ezeofor
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Protocol, runtime_checkable
+
+_MISSING: Any = object()
+
+
+@runtime_checkable
+class CacheBackend(Protocol):
+    """The interface of the cache backends."""
+
+    ttl: float
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        ...
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    def delete(self, key: Hashable) -> bool:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+    def incr(self, key: Hashable) -> int:
+        ...
+
+    def get_counter(self, key: Hashable) -> int:
+        ...
+
+    def stats(self) -> dict[str, Any]:
+        ...
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    When the cache is full, the least recently used entry is evicted. The
+    counters (`incr`) are kept apart: they're never evicted nor expired.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._counters: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.expirations: int = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value or `default` if it's missing or expired."""
+        with self._lock:
+            item: Any = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """This is used to cache a value. `ttl` overrides the default ttl."""
+        if self.maxsize <= 0:
+            return
+        expires_at: float = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """This removes the key from the cache. It returns True if the key was cached."""
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self) -> None:
+        """This removes all the entries. The counters are kept."""
+        with self._lock:
+            self._data.clear()
+
+    def incr(self, key: Hashable) -> int:
+        """This increments the counter `key` (0 if it's missing). Return the new value."""
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key: Hashable) -> int:
+        """Return the value of the counter `key` (0 if it's missing)."""
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the size of the cache and the hit/miss counters."""
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class RedisCache:
+    """A cache stored in Redis, i.e. shared by all the workers. The values are
+    stored as JSON under `prefix`. The size is bounded by the `maxmemory` policy
+    of the server, so `evictions` and `expirations` are the server counters."""
+
+    def __init__(self, url: str, ttl: float, prefix: str = "cache:") -> None:
+        try:
+            import redis
+        except ImportError as err:
+            raise ImportError(
+                "The redis cache backend requires `redis`. Install it with: pip install redis"
+            ) from err
+
+        self.ttl: float = ttl
+        self.prefix: str = prefix
+        self._client: Any = redis.Redis.from_url(url, socket_timeout=1.0)
+        self._lock = threading.Lock()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._client.scan_iter(match=f"{self.prefix}*", count=500))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value or `default` if it's missing or expired."""
+        raw: Optional[bytes] = self._client.get(f"{self.prefix}{key}")
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """This is used to cache a value. `ttl` overrides the default ttl."""
+        expires_in: float = self.ttl if ttl is None else ttl
+        self._client.set(
+            f"{self.prefix}{key}", json.dumps(value), px=max(int(expires_in * 1_000), 1)
+        )
+
+    def delete(self, key: Hashable) -> bool:
+        """This removes the key from the cache. It returns True if the key was cached."""
+        return bool(self._client.delete(f"{self.prefix}{key}"))
+
+    def clear(self) -> None:
+        """This removes all the keys under `prefix`. The counters are kept."""
+        keys: list[Any] = list(self._client.scan_iter(match=f"{self.prefix}*", count=500))
+        for idx in range(0, len(keys), 500):
+            self._client.unlink(*keys[idx : idx + 500])
+
+    def incr(self, key: Hashable) -> int:
+        """This increments the counter `key` (0 if it's missing) for all the
+        workers. The counter never expires. Return the new value."""
+        return int(self._client.incr(f"{self.prefix}{key}"))
+
+    def get_counter(self, key: Hashable) -> int:
+        """Return the value of the counter `key` (0 if it's missing). It isn't
+        counted as a hit or a miss."""
+        raw: Optional[bytes] = self._client.get(f"{self.prefix}{key}")
+        return 0 if raw is None else int(raw)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the size of the cache and the hit/miss counters."""
+        try:
+            server: dict[str, Any] = self._client.info(section="stats")
+        except Exception:
+            # e.g. INFO is disabled on some managed servers.
+            server = {}
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            hits, misses = self.hits, self.misses
+        return {
+            "size": len(self),
+            "maxsize": 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "evictions": server.get("evicted_keys", 0),
+            "expirations": server.get("expired_keys", 0),
+        }
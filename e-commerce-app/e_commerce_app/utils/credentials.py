@@ -1,13 +1,23 @@
 import os
+from functools import lru_cache
 from typing import Any, Optional
 
-from dotenv import find_dotenv, load_dotenv
 from pydantic import BaseModel
-from typeguard import typechecked
 
-from e_commerce_app.config.core import ENV_PATH
+from e_commerce_app.utils.typecheck import typechecked
 
-_ = load_dotenv(find_dotenv(filename=ENV_PATH))
+USER_CREDENTIAL_NAMES: tuple[str, ...] = ("DB_USER", "DB_PASSWORD", "DB_NAME", "DB_HOST", "DB_PORT")
+JWT_CREDENTIAL_NAMES: tuple[str, ...] = ("SECRET_KEY", "ALGORITHM", "ACCESS_TOKEN_EXPIRE_MINUTES")
+
+
+@lru_cache(maxsize=None)
+def load_env_file() -> None:
+    """This is used to load the .env file into the environment. It only runs once."""
+    from dotenv import find_dotenv, load_dotenv
+
+    from e_commerce_app.config.core import ENV_PATH
+
+    _ = load_dotenv(find_dotenv(filename=ENV_PATH))
 
 
 @typechecked
@@ -15,6 +25,7 @@ def get_credentials() -> (
     tuple[Optional[str], Optional[str], Optional[str], Optional[str], Optional[str]]
 ):
     """This is used to load the credentials."""
+    load_env_file()
     DB_USER = os.getenv("DB_USER")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
     DB_NAME = os.getenv("DB_NAME")
@@ -27,6 +38,7 @@ def get_credentials() -> (
 @typechecked
 def get_jwt_credentials() -> tuple[Optional[str], Optional[str], Optional[str]]:
     """This is used to load the jwt credentials."""
+    load_env_file()
     SECRET_KEY = os.getenv("SECRET_KEY")
     ALGORITHM = os.getenv("ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
@@ -34,6 +46,22 @@ def get_jwt_credentials() -> tuple[Optional[str], Optional[str], Optional[str]]:
     return (SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES)
 
 
+@typechecked
+def get_admin_token() -> Optional[str]:
+    """This is used to load the token of the admin endpoints. They're disabled if it's not set."""
+    load_env_file()
+    return os.getenv("ADMIN_TOKEN") or None
+
+
+@typechecked
+def get_replica_urls() -> list[str]:
+    """This is used to load the URLs of the read replicas (`DB_REPLICA_URLS`, comma-separated).
+    There are no replicas if it's not set."""
+    load_env_file()
+    urls: str = os.getenv("DB_REPLICA_URLS", "")
+    return [url.strip() for url in urls.split(",") if url.strip()]
+
+
 class Credentials(BaseModel):
     DB_USER: str
     DB_PASSWORD: str
@@ -48,38 +76,36 @@ class AuthCredentials(BaseModel):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
 
-(DB_USER, DB_PASSWORD, DB_NAME, DB_HOST, DB_PORT) = get_credentials()
-(SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES) = get_jwt_credentials()
-
-
-cred_dict: dict[str, Any] = {
-    "DB_USER": DB_USER,
-    "DB_PASSWORD": DB_PASSWORD,
-    "DB_NAME": DB_NAME,
-    "DB_HOST": DB_HOST,
-    "DB_PORT": DB_PORT,
-}
-
-jwt_cred_dict: dict[str, Any] = {
-    "SECRET_KEY": SECRET_KEY,
-    "ALGORITHM": ALGORITHM,
-    "ACCESS_TOKEN_EXPIRE_MINUTES": ACCESS_TOKEN_EXPIRE_MINUTES,
-}
-
-USER_CREDENTIALS = Credentials(**cred_dict)
-
-(DB_USER, DB_PASSWORD, DB_NAME, DB_HOST, DB_PORT) = (
-    USER_CREDENTIALS.DB_USER,
-    USER_CREDENTIALS.DB_PASSWORD,
-    USER_CREDENTIALS.DB_NAME,
-    USER_CREDENTIALS.DB_HOST,
-    USER_CREDENTIALS.DB_PORT,
-)
-
-JWT_USER_CREDENTIALS = AuthCredentials(**jwt_cred_dict)
-
-(SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES) = (
-    JWT_USER_CREDENTIALS.SECRET_KEY,
-    JWT_USER_CREDENTIALS.ALGORITHM,
-    JWT_USER_CREDENTIALS.ACCESS_TOKEN_EXPIRE_MINUTES,
-)
+@lru_cache(maxsize=None)
+def get_user_credentials() -> Credentials:
+    """Return the validated database credentials. They're loaded on the first call."""
+    return Credentials.model_validate(dict(zip(USER_CREDENTIAL_NAMES, get_credentials())))
+
+
+@lru_cache(maxsize=None)
+def get_jwt_user_credentials() -> AuthCredentials:
+    """Return the validated jwt credentials. They're loaded on the first call."""
+    return AuthCredentials.model_validate(dict(zip(JWT_CREDENTIAL_NAMES, get_jwt_credentials())))
+
+
+def __getattr__(name: str) -> Any:
+    # The credentials (e.g. `DB_USER`, `SECRET_KEY`) are loaded and validated on
+    # first access, not at import time. The values are then cached in the module.
+    value: Any
+    if name in USER_CREDENTIAL_NAMES:
+        value = getattr(get_user_credentials(), name)
+    elif name in JWT_CREDENTIAL_NAMES:
+        value = getattr(get_jwt_user_credentials(), name)
+    elif name == "USER_CREDENTIALS":
+        value = get_user_credentials()
+    elif name == "JWT_USER_CREDENTIALS":
+        value = get_jwt_user_credentials()
+    elif name == "ADMIN_TOKEN":
+        value = get_admin_token()
+    elif name == "REPLICA_URLS":
+        value = get_replica_urls()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
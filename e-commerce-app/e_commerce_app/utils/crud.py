@@ -1,13 +1,18 @@
 """Pydantic v2."""
 
-from typing import Any, Optional, Union
+from datetime import datetime, timedelta
+from typing import Any, Iterator, Optional, Sequence, Union
 
 from passlib.context import CryptContext
-from sqlalchemy import insert, select
+from sqlalchemy import and_, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
-from typeguard import typechecked
 
 from e_commerce_app import models
+from e_commerce_app.utils.auth_cache import invalidate_user
+from e_commerce_app.utils.search import product_index
+from e_commerce_app.utils.typecheck import typechecked
 from e_commerce_app.v1.schemas import db_schema
 
 # Password hashing context
@@ -26,6 +31,152 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+@typechecked
+def _detail(err: Exception) -> str:
+    """Return the message of the database error (without the statement)."""
+    return str(getattr(err, "orig", err))
+
+
+@typechecked
+def _row_error(index: int, detail: str) -> dict[str, Any]:
+    """This is used to report a row that could not be inserted."""
+    return {"index": index, "detail": detail}
+
+
+@typechecked
+def _failed_rows(indices: list[int], err: Exception) -> dict[str, Any]:
+    """This is used to report all the rows as errors, e.g. when the transaction failed."""
+    return {"data": [], "errors": [_row_error(index=idx, detail=_detail(err)) for idx in indices]}
+
+
+# The errors caused by the values of a row (e.g. a constraint), not by the database.
+ROW_ERRORS: tuple[type[Exception], ...] = (IntegrityError, DataError)
+
+# The dialects that support `INSERT ... ON CONFLICT DO NOTHING`.
+ON_CONFLICT_INSERTS: dict[str, Any] = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@typechecked
+def _insert_on_conflict_do_nothing(
+    db: Optional[Session], model: Any, rows: list[dict[str, Any]]
+) -> list[Any]:
+    """This inserts the rows and skips the ones that conflict with a unique index.
+    Return the inserted rows. It runs one `INSERT ... ON CONFLICT DO NOTHING RETURNING`
+    where it's supported, otherwise one INSERT per row, each in a savepoint."""
+    if not rows:
+        return []
+
+    dialect: str = db.get_bind().dialect.name  # type: ignore
+    if dialect in ON_CONFLICT_INSERTS:
+        stmt: Any = ON_CONFLICT_INSERTS[dialect](model).on_conflict_do_nothing().returning(model)
+        return db.scalars(stmt, rows).all()  # type: ignore
+
+    inserted: list[Any] = []
+    for row in rows:
+        obj: Any = model(**row)
+        try:
+            with db.begin_nested():  # type: ignore
+                db.add(obj)  # type: ignore
+        except IntegrityError:
+            continue
+        inserted.append(obj)
+    return inserted
+
+
+@typechecked
+def _insert(
+    db: Optional[Session], model: Any, rows: list[dict[str, Any]], on_conflict_do_nothing: bool
+) -> list[Any]:
+    """This inserts the rows with one multi-row `INSERT ... RETURNING`. Return the
+    inserted rows (in the order of `rows`, unless `on_conflict_do_nothing`)."""
+    if on_conflict_do_nothing:
+        return _insert_on_conflict_do_nothing(db=db, model=model, rows=rows)
+    stmt: Any = insert(model).returning(model, sort_by_parameter_order=True)
+    return db.scalars(stmt, rows).all()  # type: ignore
+
+
+@typechecked
+def _insert_by_halves(
+    db: Optional[Session],
+    model: Any,
+    rows: list[dict[str, Any]],
+    indices: list[int],
+    on_conflict_do_nothing: bool,
+) -> dict[str, Any]:
+    """This inserts the rows in a savepoint. If one of them is invalid, the rows are
+    split in two halves, inserted the same way, until the invalid rows are found."""
+    try:
+        with db.begin_nested():  # type: ignore
+            data: list[Any] = _insert(
+                db=db, model=model, rows=rows, on_conflict_do_nothing=on_conflict_do_nothing
+            )
+        return {"data": data, "errors": []}
+    except ROW_ERRORS as err:
+        if len(rows) == 1:
+            return {"data": [], "errors": [_row_error(index=indices[0], detail=_detail(err))]}
+
+    middle: int = len(rows) // 2
+    first: dict[str, Any] = _insert_by_halves(
+        db=db,
+        model=model,
+        rows=rows[:middle],
+        indices=indices[:middle],
+        on_conflict_do_nothing=on_conflict_do_nothing,
+    )
+    second: dict[str, Any] = _insert_by_halves(
+        db=db,
+        model=model,
+        rows=rows[middle:],
+        indices=indices[middle:],
+        on_conflict_do_nothing=on_conflict_do_nothing,
+    )
+    return {"data": first["data"] + second["data"], "errors": first["errors"] + second["errors"]}
+
+
+@typechecked
+def _bulk_insert(
+    db: Optional[Session],
+    model: Any,
+    rows: list[dict[str, Any]],
+    indices: list[int],
+    on_conflict_do_nothing: bool = False,
+) -> dict[str, Any]:
+    """This inserts all the rows in one transaction using a multi-row `INSERT ... RETURNING`.
+    With `on_conflict_do_nothing`, the rows that conflict with a unique index are skipped.
+
+    If a row is invalid (e.g. a constraint fails), the insert is retried by halves
+    (see `_insert_by_halves`): only the invalid rows are reported as errors and the
+    others are inserted. If the transaction fails for another reason (e.g. the
+    connection is lost), every row is reported as an error."""
+    if not rows:
+        return {"data": [], "errors": []}
+
+    try:
+        result: list[Any] = _insert(
+            db=db, model=model, rows=rows, on_conflict_do_nothing=on_conflict_do_nothing
+        )
+        db.commit()  # type: ignore
+        return {"data": result, "errors": []}
+    except Exception as err:
+        db.rollback()  # type: ignore
+        if not isinstance(err, ROW_ERRORS):
+            return _failed_rows(indices=indices, err=err)
+
+    try:
+        retried: dict[str, Any] = _insert_by_halves(
+            db=db,
+            model=model,
+            rows=rows,
+            indices=indices,
+            on_conflict_do_nothing=on_conflict_do_nothing,
+        )
+        db.commit()  # type: ignore
+        return retried
+    except Exception as err:
+        db.rollback()  # type: ignore
+        return _failed_rows(indices=indices, err=err)
+
+
 @typechecked
 def authenticate_user(username: str, password: str, db: Session) -> Union[Any, bool]:
     """This returns the user if it's correctly authenticated otherwise False."""
@@ -78,10 +229,13 @@ def get_customer_by_username(db, username: str) -> Optional[dict[str, Any]]:
 
 @typechecked
 def get_customers(
-    db: Optional[Session], skip: int = 0, limit: int = 100
+    db: Optional[Session], after_id: Optional[int] = None, limit: int = 100
 ) -> Optional[list[dict[str, Any]]]:
-    """Return all the customer information."""
-    stmt: Any = select(models.Customers).offset(skip).limit(limit)  # type: ignore
+    """Return the customer information ordered by id. It uses keyset pagination:
+    only the rows with `id > after_id` are returned."""
+    stmt: Any = select(models.Customers).order_by(models.Customers.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(models.Customers.id > after_id)
     try:
         result: list[Any] = db.execute(stmt).scalars().all()  # type: ignore
         return result
@@ -89,6 +243,25 @@ def get_customers(
         return None
 
 
+@typechecked
+def get_export_stmt(model: Any, columns: list[str], chunk_size: int = 1_000) -> Any:
+    """Return a statement that selects the columns of all the rows ordered by id.
+    `yield_per` makes the driver use a server-side cursor (`stream_results`)."""
+    selected: list[Any] = [model.__table__.c[name] for name in columns]
+    return select(*selected).order_by(model.id).execution_options(yield_per=chunk_size)
+
+
+@typechecked
+def stream_rows(
+    db: Session, model: Any, columns: list[str], chunk_size: int = 1_000
+) -> Iterator[Sequence[Any]]:
+    """This yields all the rows of the table in chunks of `chunk_size` rows.
+    Only one chunk is held in memory at a time."""
+    stmt: Any = get_export_stmt(model=model, columns=columns, chunk_size=chunk_size)
+    result: Any = db.execute(stmt)
+    yield from result.partitions()
+
+
 @typechecked
 def create_customer(
     db: Optional[Session], data: db_schema.CustomersSchemaInDB
@@ -102,6 +275,7 @@ def create_customer(
     try:
         _ = db.execute(stmt)  # type: ignore
         db.commit()  # type: ignore
+        invalidate_user(username=data.username)
         return input_data
 
     except Exception:
@@ -109,6 +283,67 @@ def create_customer(
         return None
 
 
+@typechecked
+def create_customers(
+    db: Optional[Session],
+    data: list[db_schema.CustomersSchemaInDB],
+    hash_passwords: bool = True,
+) -> dict[str, Any]:
+    """This is used to add new customers to the database in a single transaction.
+
+    It runs one `INSERT ... ON CONFLICT DO NOTHING RETURNING` (see
+    `_insert_on_conflict_do_nothing`). The rows that conflict with the unique indexes
+    on email/username aren't returned and are reported as errors.
+    Set `hash_passwords=False` if the passwords have already been hashed.
+    """
+    rows: list[dict[str, Any]] = []
+    indices: list[int] = []
+    errors: list[dict[str, Any]] = []
+    emails: set[str] = set()
+    usernames: set[str] = set()
+    for idx, row in enumerate(data):
+        if row.email in emails or row.username in usernames:
+            errors.append(_row_error(index=idx, detail="Duplicate email or username in request"))
+            continue
+        emails.add(row.email)
+        usernames.add(row.username)
+
+        input_data: dict[str, Any] = row.model_dump()
+        if hash_passwords:
+            input_data["hashed_password"] = get_password_hash(password=row.hashed_password)
+        rows.append(input_data)
+        indices.append(idx)
+
+    result: dict[str, Any] = _bulk_insert(
+        db=db, model=models.Customers, rows=rows, indices=indices, on_conflict_do_nothing=True
+    )
+
+    # The rows that were neither inserted nor rejected were skipped by ON CONFLICT.
+    # Only those are looked up to know which field conflicted.
+    inserted: set[str] = {customer.email for customer in result["data"]}
+    rejected: set[int] = {err["index"] for err in result["errors"]}
+    conflicts: list[tuple[int, dict[str, Any]]] = [
+        (idx, input_data)
+        for idx, input_data in zip(indices, rows)
+        if input_data["email"] not in inserted and idx not in rejected
+    ]
+    if conflicts:
+        stmt: Any = select(models.Customers.email).where(
+            models.Customers.email.in_([conflict["email"] for _, conflict in conflicts])
+        )
+        registered: set[str] = set(db.scalars(stmt).all())  # type: ignore
+        for idx, conflict in conflicts:
+            field: str = "Email" if conflict["email"] in registered else "Username"
+            errors.append(_row_error(index=idx, detail=f"{field} already registered"))
+
+    for customer in result["data"]:
+        invalidate_user(username=customer.username)
+
+    result["data"] = sorted(result["data"], key=lambda customer: customer.id)
+    result["errors"] = sorted(errors + result["errors"], key=lambda err: err["index"])
+    return result
+
+
 @typechecked
 def get_products_by_name(db: Optional[Session], name: str) -> Optional[dict[str, Any]]:
     """Return the customer information."""
@@ -133,10 +368,13 @@ def get_products_by_id(db: Optional[Session], id: Optional[int]) -> Optional[dic
 
 @typechecked
 def get_products(
-    db: Optional[Session], skip: int = 0, limit: int = 100
+    db: Optional[Session], after_id: Optional[int] = None, limit: int = 100
 ) -> Optional[list[dict[str, Any]]]:
-    """Return all the product information."""
-    stmt: Any = select(models.Products).offset(skip).limit(limit)
+    """Return the product information ordered by id. It uses keyset pagination:
+    only the rows with `id > after_id` are returned."""
+    stmt: Any = select(models.Products).order_by(models.Products.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(models.Products.id > after_id)
     try:
         result: Any = db.execute(stmt).scalars().all()  # type: ignore
         return result
@@ -161,12 +399,58 @@ def create_product(
         return None
 
 
+@typechecked
+def create_products(db: Optional[Session], data: list[db_schema.ProductsSchema]) -> dict[str, Any]:
+    """This is used to add new products to the database in a single transaction."""
+    rows: list[dict[str, Any]] = [row.model_dump() for row in data]
+    result: dict[str, Any] = _bulk_insert(
+        db=db, model=models.Products, rows=rows, indices=list(range(len(rows)))
+    )
+    if result["data"]:
+        product_index.add(products=result["data"])
+    return result
+
+
+@typechecked
+def search_products(
+    db: Optional[Session], q: Optional[str], tags: list[str], limit: int = 100, offset: int = 0
+) -> list[Any]:
+    """Return the products that match the search query and have all the tags,
+    best match first. On Postgres it uses the full-text and the tag GIN indexes,
+    other backends use the in-process `product_index`."""
+    if not (q and q.strip()) and not tags:
+        return []
+
+    if db.get_bind().dialect.name != "postgresql":  # type: ignore
+        product_index.build(db=db)  # type: ignore
+        ids: list[int] = product_index.search(q=q, tags=tags, limit=limit, offset=offset)
+        if not ids:
+            return []
+        stmt: Any = select(models.Products).where(models.Products.id.in_(ids))
+        products: dict[int, Any] = {row.id: row for row in db.scalars(stmt)}  # type: ignore
+        return [products[idx] for idx in ids if idx in products]
+
+    stmt = select(models.Products)
+    order_by: list[Any] = []
+    if q and q.strip():
+        query: Any = func.websearch_to_tsquery(literal("english", literal_execute=True), q)
+        stmt = stmt.where(models.product_document.bool_op("@@")(query))
+        order_by.append(func.ts_rank(models.product_document, query).desc())
+    if tags:
+        stmt = stmt.where(models.product_tags.contains(tags))
+    stmt = stmt.order_by(*order_by, models.Products.id).limit(limit).offset(offset)
+    return db.scalars(stmt).all()  # type: ignore
+
+
 @typechecked
 def get_orders(
-    db: Optional[Session], skip: int = 0, limit: int = 100
+    db: Optional[Session], after_id: Optional[int] = None, limit: int = 100
 ) -> Optional[list[dict[str, Any]]]:
-    """Return all the orders information."""
-    stmt: Any = select(models.Orders).offset(skip).limit(limit)
+    """Return the orders information ordered by id. It uses keyset pagination:
+    only the rows with `id > after_id` are returned."""
+    stmt: Any = select(models.Orders).order_by(models.Orders.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.where(models.Orders.id > after_id)
     try:
         result: Any = db.execute(stmt).scalars().all()  # type: ignore
         return result
@@ -202,3 +486,90 @@ def create_order(db: Optional[Session], data: db_schema.OrdersSchema) -> Optiona
     except Exception:
         db.rollback()  # type: ignore
         return None
+
+
+@typechecked
+def create_orders(db: Optional[Session], data: list[db_schema.OrdersSchema]) -> dict[str, Any]:
+    """This is used to add new orders to the database in a single transaction.
+    Rows whose customer does not exist are reported as errors."""
+    customer_ids: set[int] = {row.customer_id for row in data}
+    stmt: Any = select(models.Customers.id).where(models.Customers.id.in_(customer_ids))
+    existing: set[int] = set(db.scalars(stmt).all())  # type: ignore
+
+    rows: list[dict[str, Any]] = []
+    indices: list[int] = []
+    errors: list[dict[str, Any]] = []
+    for idx, row in enumerate(data):
+        if row.customer_id not in existing:
+            detail: str = f"customer_id={row.customer_id} is not present in table!"
+            errors.append(_row_error(index=idx, detail=detail))
+            continue
+        rows.append(row.model_dump())
+        indices.append(idx)
+
+    result: dict[str, Any] = _bulk_insert(db=db, model=models.Orders, rows=rows, indices=indices)
+    result["errors"] = sorted(errors + result["errors"], key=lambda err: err["index"])
+    return result
+
+
+@typechecked
+def claim_idempotency_key(
+    db: Optional[Session], key: str, request_hash: str, ttl: float, lock_timeout: float
+) -> tuple[bool, Optional[models.IdempotencyKeys]]:
+    """This is used to claim an idempotency key for a request. Return True if the
+    key was claimed (i.e. the request must run), otherwise False and the row of
+    the request that claimed it (None if it's gone meanwhile)."""
+    now: datetime = datetime.utcnow()
+    Keys: Any = models.IdempotencyKeys
+    # An expired key, or one whose request never finished (e.g. its worker was killed), is free.
+    db.execute(  # type: ignore
+        delete(Keys).where(
+            Keys.key == key,
+            or_(
+                Keys.expires_at < now,
+                and_(
+                    Keys.status_code.is_(None),
+                    Keys.created_at < now - timedelta(seconds=lock_timeout),
+                ),
+            ),
+        )
+    )
+    row: dict[str, Any] = {
+        "key": key,
+        "request_hash": request_hash,
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=ttl),
+    }
+    claimed: bool = bool(_insert_on_conflict_do_nothing(db=db, model=Keys, rows=[row]))
+    db.commit()  # type: ignore
+    if claimed:
+        return True, None
+    return False, db.get(Keys, key)  # type: ignore
+
+
+@typechecked
+def save_idempotency_key(db: Optional[Session], key: str, status_code: int, response: str) -> None:
+    """This is used to store the response of the request that claimed the key."""
+    Keys: Any = models.IdempotencyKeys
+    stmt: Any = (
+        update(Keys).where(Keys.key == key).values(status_code=status_code, response=response)
+    )
+    db.execute(stmt)  # type: ignore
+    db.commit()  # type: ignore
+
+
+@typechecked
+def release_idempotency_key(db: Optional[Session], key: str) -> None:
+    """This is used to free a key whose request failed, so it can be retried."""
+    Keys: Any = models.IdempotencyKeys
+    db.execute(delete(Keys).where(Keys.key == key, Keys.status_code.is_(None)))  # type: ignore
+    db.commit()  # type: ignore
+
+
+@typechecked
+def purge_idempotency_keys(db: Optional[Session]) -> int:
+    """This is used to delete the expired idempotency keys. Return the number of keys."""
+    Keys: Any = models.IdempotencyKeys
+    result: Any = db.execute(delete(Keys).where(Keys.expires_at < datetime.utcnow()))  # type: ignore
+    db.commit()  # type: ignore
+    return result.rowcount
@@ -0,0 +1,88 @@
+"""This module is used for streaming whole tables out of the API as NDJSON or CSV.
+
+The rows are read with a server-side cursor and encoded one chunk at a time, so
+the memory usage is constant no matter how big the table is.
+
+Author: Chinedu Ezeofor
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Iterator, Literal, Sequence
+
+from fastapi.responses import StreamingResponse
+
+from e_commerce_app import models
+from e_commerce_app.utils import async_crud, crud
+from e_commerce_app.utils.typecheck import typechecked
+
+ExportFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES: dict[str, str] = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CHUNK_SIZE: int = 1_000
+
+
+def _json_default(value: Any) -> Any:
+    """This is used to serialize the values that aren't supported by `json`."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+@typechecked
+def encode_header(columns: list[str], fmt: ExportFormat) -> bytes:
+    """Return the header of the file. Only CSV files have a header."""
+    if fmt == "csv":
+        return encode_rows(rows=[columns], columns=columns, fmt=fmt)
+    return b""
+
+
+@typechecked
+def encode_rows(rows: Sequence[Any], columns: list[str], fmt: ExportFormat) -> bytes:
+    """This is used to encode a chunk of rows."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(rows)
+        return buffer.getvalue().encode("utf-8")
+
+    lines: list[str] = [
+        json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows
+    ]
+    return "".join(lines).encode("utf-8")
+
+
+def iter_export(model: Any, columns: list[str], fmt: ExportFormat) -> Iterator[bytes]:
+    """This yields the encoded table. It uses its own session because the session of
+    the request is closed before the response is streamed."""
+    yield encode_header(columns=columns, fmt=fmt)
+    with models.SessionLocal() as db:
+        for rows in crud.stream_rows(db=db, model=model, columns=columns, chunk_size=CHUNK_SIZE):
+            yield encode_rows(rows=rows, columns=columns, fmt=fmt)
+
+
+async def aiter_export(model: Any, columns: list[str], fmt: ExportFormat) -> AsyncIterator[bytes]:
+    """Async variant of `iter_export`."""
+    yield encode_header(columns=columns, fmt=fmt)
+    async with models.AsyncSessionLocal() as db:  # type: ignore[misc]
+        async for rows in async_crud.stream_rows(
+            db=db, model=model, columns=columns, chunk_size=CHUNK_SIZE
+        ):
+            yield encode_rows(rows=rows, columns=columns, fmt=fmt)
+
+
+@typechecked
+def export_response(model: Any, columns: list[str], fmt: ExportFormat) -> StreamingResponse:
+    """This returns a response that streams the table as a file download."""
+    content: Any = (
+        aiter_export(model=model, columns=columns, fmt=fmt)
+        if models.AsyncSessionLocal is not None
+        else iter_export(model=model, columns=columns, fmt=fmt)
+    )
+    filename: str = f"{model.__tablename__}.{fmt}"
+    return StreamingResponse(
+        content=content,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
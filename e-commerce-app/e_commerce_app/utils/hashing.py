@@ -0,0 +1,147 @@
+"""This module is used for hashing and verifying passwords off the event loop.
+
+bcrypt is slow on purpose (~250 ms per call). The work runs on a dedicated
+executor with a bounded queue. When the queue is full, the job is rejected
+with `HashingOverloadedError` (503) instead of stalling every other request.
+
+There are two executors: `hasher` (logins) and `bulk_hasher` (the batches of
+`POST /customers/`), so a large signup batch can't delay the logins.
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Literal, Optional
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils.crud import get_password_hash, verify_password
+from e_commerce_app.utils.typecheck import typechecked
+
+ExecutorType = Literal["thread", "process"]
+
+
+class HashingOverloadedError(RuntimeError):
+    """Raised when too many hashing jobs are waiting."""
+
+
+@typechecked
+def hash_many(passwords: list[str]) -> list[str]:
+    """This hashes the passwords one after the other. It runs on a worker."""
+    return [get_password_hash(password=password) for password in passwords]
+
+
+class HashingExecutor:
+    """Runs the bcrypt jobs on a pool of `max_workers` workers. At most
+    `max_workers + queue_limit` jobs can be running or waiting at a time."""
+
+    def __init__(self, max_workers: int, queue_limit: int, executor_type: ExecutorType) -> None:
+        self.max_workers: int = max_workers
+        self.queue_limit: int = queue_limit
+        self.executor_type: ExecutorType = executor_type
+        self._executor: Optional[Executor] = None
+        self._pending: int = 0
+        self._rejected: int = 0
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        """The pool is created on first use (i.e. after the server has forked)."""
+        with self._lock:
+            if self._executor is None:
+                if self.executor_type == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="bcrypt"
+                    )
+            return self._executor
+
+    def _acquire(self, jobs: int) -> None:
+        with self._lock:
+            if self._pending + jobs > self.max_workers + self.queue_limit:
+                self._rejected += jobs
+                raise HashingOverloadedError("Too many password hashing jobs are waiting.")
+            self._pending += jobs
+
+    def _release(self, jobs: int) -> None:
+        with self._lock:
+            self._pending -= jobs
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """This runs `func(*args)` on the executor without blocking the event loop."""
+        self._acquire(jobs=1)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self._release(jobs=1)
+
+    async def hash_password(self, password: str) -> str:
+        """Return the hashed password."""
+        return await self.run(get_password_hash, password)
+
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        """Return True if the passwords match otherwise it returns False."""
+        return await self.run(verify_password, plain_password, hashed_password)
+
+    async def hash_passwords(self, passwords: list[str]) -> list[str]:
+        """Return the hashed passwords. The passwords are split into at most
+        `max_workers` jobs, so a large batch can't flood the queue."""
+        n_jobs: int = min(len(passwords), self.max_workers)
+        if n_jobs == 0:
+            return []
+
+        chunks: list[list[str]] = [passwords[idx::n_jobs] for idx in range(n_jobs)]
+        self._acquire(jobs=n_jobs)
+        try:
+            loop = asyncio.get_running_loop()
+            results: list[list[str]] = await asyncio.gather(
+                *[loop.run_in_executor(self.executor, hash_many, chunk) for chunk in chunks]
+            )
+        finally:
+            self._release(jobs=n_jobs)
+
+        # Undo the round-robin split.
+        hashed: list[str] = [""] * len(passwords)
+        for idx, chunk in enumerate(results):
+            hashed[idx::n_jobs] = chunk
+        return hashed
+
+    def stats(self) -> dict[str, Any]:
+        """Return the number of running/waiting and rejected jobs."""
+        with self._lock:
+            return {"pending": self._pending, "rejected": self._rejected}
+
+    def shutdown(self) -> None:
+        """This is used to stop the workers."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_hashing_settings = get_settings().hashing
+hasher = HashingExecutor(
+    max_workers=_hashing_settings.HASH_WORKERS,
+    queue_limit=_hashing_settings.HASH_QUEUE_LIMIT,
+    executor_type=_hashing_settings.HASH_EXECUTOR_TYPE,
+)
+bulk_hasher = HashingExecutor(
+    max_workers=_hashing_settings.HASH_BULK_WORKERS,
+    queue_limit=_hashing_settings.HASH_QUEUE_LIMIT,
+    executor_type=_hashing_settings.HASH_EXECUTOR_TYPE,
+)
+
+
+async def hashing_overloaded_handler(request: Request, exc: HashingOverloadedError) -> JSONResponse:
+    """This converts `HashingOverloadedError` to a 503 response."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
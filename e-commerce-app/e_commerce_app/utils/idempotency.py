@@ -0,0 +1,296 @@
+"""This module adds `Idempotency-Key` support to the create endpoints
+(`POST /orders/`, `POST /customers/`, `POST /products/`).
+
+A client that retries a request with the same `Idempotency-Key` header gets the
+response of the first one back (with `Idempotent-Replayed: true`), i.e. the rows
+are only inserted once:
+    - the responses are stored in the `idempotency_keys` table for
+      `IDEMPOTENCY_TTL` seconds, with an in-memory cache in front of it, so a
+      replay doesn't touch the database most of the time.
+    - a duplicate that arrives while the first request is still running waits
+      for it in the same worker. In another worker, it gets a 409 (the key is
+      claimed in the table when the request starts) and can retry.
+    - a key sent with a different body gets a 422.
+    - the 5xx responses aren't stored: the request can be retried with the same key.
+
+The keys are scoped to the client (its `Authorization` header) and the route.
+Without an `Authorization` header (e.g. the signup, `POST /customers/`), the
+clients can't be told apart: the key is then also scoped to the body, i.e. only
+the same request gets the stored response back (it holds the customer's data)
+and the same key with another body is a new request, not a 422.
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Optional
+
+from loguru import logger
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils import crud
+from e_commerce_app.utils.async_crud import run_in_session
+from e_commerce_app.utils.cache import TTLCache
+from e_commerce_app.utils.typecheck import typechecked
+
+IDEMPOTENCY_HEADER: bytes = b"idempotency-key"
+REPLAYED_HEADER: bytes = b"idempotent-replayed"
+MAX_KEY_LENGTH: int = 255
+# The expired keys are deleted every `PURGE_EVERY` claims (per worker).
+PURGE_EVERY: int = 1_000
+
+
+class IdempotencyStore:
+    """The stored responses (in memory and in the table), the requests in
+    progress in this worker and the counters."""
+
+    def __init__(self, ttl: float, cache_size: int, lock_timeout: float) -> None:
+        self.ttl: float = ttl
+        self.lock_timeout: float = lock_timeout
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.inflight: dict[str, asyncio.Future[None]] = {}
+        self._lock = threading.Lock()
+        self.claims: int = 0
+        self.replays: int = 0
+        self.coalesced: int = 0
+        self.conflicts: int = 0
+        self.mismatches: int = 0
+
+    def count(self, name: str) -> None:
+        """This is used to increment a counter."""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    async def claim(self, key: str, request_hash: str) -> tuple[bool, Optional[dict[str, Any]]]:
+        """This claims the key in the table. Return True if the request must run,
+        otherwise False and the stored response (None if it's still in progress)."""
+        self.count("claims")
+        if self.claims % PURGE_EVERY == 0:
+            purged: int = await run_in_session(crud.purge_idempotency_keys)
+            logger.info(f"Purged {purged} expired idempotency keys")
+
+        claimed, row = await run_in_session(
+            crud.claim_idempotency_key,
+            key=key,
+            request_hash=request_hash,
+            ttl=self.ttl,
+            lock_timeout=self.lock_timeout,
+        )
+        if claimed or row is None or row.status_code is None:
+            return claimed, None
+        stored: dict[str, Any] = {
+            "request_hash": row.request_hash,
+            "status_code": row.status_code,
+            "body": row.response or "",
+        }
+        self.cache.set(key, stored)
+        return False, stored
+
+    async def save(self, key: str, stored: dict[str, Any]) -> None:
+        """This stores the response of the request that claimed the key."""
+        await run_in_session(
+            crud.save_idempotency_key,
+            key=key,
+            status_code=stored["status_code"],
+            response=stored["body"],
+        )
+        self.cache.set(key, stored)
+
+    async def release(self, key: str) -> None:
+        """This frees the key, e.g. after a 5xx, so the request can be retried."""
+        await run_in_session(crud.release_idempotency_key, key=key)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the statistics of the cache and the counters."""
+        with self._lock:
+            counters: dict[str, Any] = {
+                "claims": self.claims,
+                "replays": self.replays,
+                "coalesced": self.coalesced,
+                "conflicts": self.conflicts,
+                "mismatches": self.mismatches,
+                "in_progress": len(self.inflight),
+            }
+        return {**self.cache.stats(), **counters}
+
+
+idempotency_store = IdempotencyStore(
+    ttl=get_settings().idempotency.IDEMPOTENCY_TTL,
+    cache_size=get_settings().idempotency.IDEMPOTENCY_CACHE_SIZE,
+    lock_timeout=get_settings().idempotency.IDEMPOTENCY_LOCK_TIMEOUT,
+)
+
+
+@typechecked
+def idempotency_stats() -> dict[str, Any]:
+    """Return the statistics of the idempotency keys."""
+    return idempotency_store.stats()
+
+
+@typechecked
+def scope_key(raw_key: bytes, path: str, authorization: Optional[bytes], request_hash: str) -> str:
+    """Return the key of the table: the `Idempotency-Key` of the client for the route.
+    An anonymous client is only identified by its request (see the module docstring)."""
+    client: bytes = authorization if authorization else f"anonymous:{request_hash}".encode()
+    return hashlib.sha256(b"|".join([client, path.encode(), raw_key])).hexdigest()
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks: list[bytes] = []
+    more_body: bool = True
+    while more_body:
+        message: Message = await receive()
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def _send_json(send: Send, status_code: int, body: bytes, replayed: bool = False) -> None:
+    headers: list[tuple[bytes, bytes]] = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if replayed:
+        headers.append((REPLAYED_HEADER, b"true"))
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_error(send: Send, status_code: int, detail: str) -> None:
+    await _send_json(
+        send=send, status_code=status_code, body=json.dumps({"detail": detail}).encode()
+    )
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware that replays the responses of the `POST` requests to
+    `paths` sent with an `Idempotency-Key` header."""
+
+    def __init__(self, app: ASGIApp, paths: list[str]) -> None:
+        self.app: ASGIApp = app
+        self.paths: frozenset[str] = frozenset(paths)
+        self.store: IdempotencyStore = idempotency_store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        headers: dict[bytes, bytes] = dict(scope["headers"])
+        raw_key: Optional[bytes] = headers.get(IDEMPOTENCY_HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not raw_key.strip() or len(raw_key) > MAX_KEY_LENGTH:
+            await _send_error(
+                send=send,
+                status_code=400,
+                detail=f"Idempotency-Key must have 1 to {MAX_KEY_LENGTH} characters.",
+            )
+            return
+
+        body: bytes = await _read_body(receive=receive)
+        request_hash: str = hashlib.sha256(body).hexdigest()
+        key: str = scope_key(
+            raw_key=raw_key,
+            path=scope["path"],
+            authorization=headers.get(b"authorization"),
+            request_hash=request_hash,
+        )
+
+        # A duplicate waits for the request in progress in this worker, then replays it.
+        while True:
+            stored: Optional[dict[str, Any]] = self.store.cache.get(key)
+            if stored is not None:
+                await self._replay(send=send, stored=stored, request_hash=request_hash)
+                return
+            inflight: Optional[asyncio.Future[None]] = self.store.inflight.get(key)
+            if inflight is None:
+                break
+            self.store.count("coalesced")
+            await asyncio.shield(inflight)
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.store.inflight[key] = future
+        try:
+            claimed, stored = await self.store.claim(key=key, request_hash=request_hash)
+            if stored is not None:
+                await self._replay(send=send, stored=stored, request_hash=request_hash)
+            elif not claimed:
+                # It's in progress in another worker.
+                self.store.count("conflicts")
+                await _send_error(
+                    send=send,
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is in progress.",
+                )
+            else:
+                await self._run(
+                    scope=scope,
+                    receive=receive,
+                    send=send,
+                    body=body,
+                    key=key,
+                    request_hash=request_hash,
+                )
+        finally:
+            del self.store.inflight[key]
+            future.set_result(None)
+
+    async def _run(
+        self, scope: Scope, receive: Receive, send: Send, body: bytes, key: str, request_hash: str
+    ) -> None:
+        """This runs the request that claimed the key and stores its response."""
+        body_sent: bool = False
+        response: dict[str, Any] = {"status_code": None, "chunks": []}
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["chunks"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, send_wrapper)
+        except BaseException:
+            await self.store.release(key=key)
+            raise
+
+        status_code: Optional[int] = response["status_code"]
+        if status_code is None or status_code >= 500:
+            await self.store.release(key=key)
+            return
+        stored: dict[str, Any] = {
+            "request_hash": request_hash,
+            "status_code": status_code,
+            "body": b"".join(response["chunks"]).decode(),
+        }
+        await self.store.save(key=key, stored=stored)
+
+    async def _replay(self, send: Send, stored: dict[str, Any], request_hash: str) -> None:
+        if stored["request_hash"] != request_hash:
+            self.store.count("mismatches")
+            await _send_error(
+                send=send,
+                status_code=422,
+                detail="This Idempotency-Key was used with a different request.",
+            )
+            return
+        self.store.count("replays")
+        await _send_json(
+            send=send,
+            status_code=stored["status_code"],
+            body=stored["body"].encode(),
+            replayed=True,
+        )
@@ -0,0 +1,168 @@
+"""This module contains the production logging mode (`LOGGING_MODE=json`).
+
+The log records (of `logging` and of loguru) are put in a bounded queue by a
+`QueueHandler` and written as JSON lines by a `QueueListener` on a background
+thread, i.e. a request only pays for putting the record in the queue:
+    - the formatting (JSON, tracebacks) and the writes happen on the listener thread.
+    - the queue holds at most `LOGGING_QUEUE_SIZE` records. When it's full (e.g.
+      the output is slower than the logs), the new records are dropped and
+      counted instead of blocking the requests.
+    - only a fraction (`LOGGING_ACCESS_SAMPLE_RATE`) of the successful
+      `uvicorn.access` records is kept. The 4xx and 5xx are always kept.
+    - the level of each logger can be set with `LOGGING_LEVELS`, e.g.
+      `{"uvicorn.access": "WARNING", "sqlalchemy.engine": "INFO"}`.
+
+Author: Chinedu Ezeofor
+"""
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+from loguru import logger
+
+from e_commerce_app.utils.typecheck import typechecked
+
+ACCESS_LOGGER: str = "uvicorn.access"
+# Their handlers are removed: the records go to the root logger (i.e. to the queue).
+UVICORN_LOGGERS: tuple[str, ...] = ("uvicorn", "uvicorn.error", "uvicorn.access", "uvicorn.asgi")
+# The index of the status code in the arguments of the `uvicorn.access` records.
+ACCESS_STATUS_ARG: int = 4
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats the records as JSON lines."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """A `QueueHandler` that drops the records when the queue is full."""
+
+    def __init__(self, log_queue: "queue.Queue[Any]") -> None:
+        super().__init__(log_queue)
+        self.dropped: int = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the message is merged here (its arguments may change later). Unlike
+        # `QueueHandler.prepare`, the traceback is formatted on the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+class AccessLogSampler(logging.Filter):
+    """Keeps a fraction `rate` of the successful access records."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate: float = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1:
+            return True
+        args: Any = record.args
+        if isinstance(args, tuple) and len(args) > ACCESS_STATUS_ARG:
+            try:
+                if int(args[ACCESS_STATUS_ARG]) >= 400:
+                    return True
+            except (TypeError, ValueError):
+                return True
+        return random.random() < self.rate
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def stop_json_logging() -> None:
+    """This is used to write the records left in the queue and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+@typechecked
+def setup_json_logging(
+    level: int,
+    levels: dict[str, str],
+    access_sample_rate: float,
+    queue_size: int,
+) -> QueueListener:
+    """This is used to send the records of `logging` and loguru to a bounded
+    queue that's written as JSON lines to stdout on a background thread."""
+    global _handler, _listener
+    stop_json_logging()
+
+    log_queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+    _handler = DroppingQueueHandler(log_queue)
+    root: logging.Logger = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(level)
+
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger: logging.Logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    access_logger: logging.Logger = logging.getLogger(ACCESS_LOGGER)
+    access_logger.filters = [
+        item for item in access_logger.filters if not isinstance(item, AccessLogSampler)
+    ]
+    access_logger.addFilter(AccessLogSampler(rate=access_sample_rate))
+    for name, logger_level in levels.items():
+        logging.getLogger(name).setLevel(logger_level.upper())
+
+    # loguru sends its records to the same queue.
+    logger.configure(handlers=[{"sink": _handler, "level": level, "format": "{message}"}])
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+atexit.register(stop_json_logging)
+
+
+@typechecked
+def logging_stats() -> dict[str, Any]:
+    """Return the size of the log queue and the number of dropped records."""
+    if _handler is None:
+        return {"mode": "dev", "queued": 0, "queue_size": 0, "dropped": 0}
+    log_queue: Any = _handler.queue
+    return {
+        "mode": "json",
+        "queued": log_queue.qsize(),
+        "queue_size": log_queue.maxsize,
+        "dropped": _handler.dropped,
+    }
@@ -0,0 +1,348 @@
+"""This module contains the Prometheus metrics of the API.
+
+    - MetricsMiddleware: latency, in-flight requests and status codes per route.
+    - instrument_engine: number of queries and time spent in the database,
+      attributed to the request that ran them (i.e. N+1 patterns show up as a
+      high `http_request_db_queries` for the route).
+
+The metrics are exposed at `GET /metrics` in the Prometheus text format.
+
+NB: The values live in the memory of the process, i.e. every gunicorn worker has
+its own metrics and a scrape only returns the ones of the worker that served it.
+Every series has a `worker` label (the pid) so the workers never overwrite each
+other's counters: aggregate with `sum without (worker)`. To get all the workers
+in one scrape, run a single worker per container (`SERVER_WORKERS=1`).
+
+Author: Chinedu Ezeofor
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from e_commerce_app.utils.typecheck import typechecked
+
+CONTENT_TYPE: str = "text/plain; version=0.0.4"
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_COUNT_BUCKETS: tuple[float, ...] = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE: str = "<unmatched>"
+WORKER_LABEL: str = "worker"
+
+LabelValues = tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs: list[str] = []
+    for name, value in zip(names, values):
+        escaped: str = value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _split_labels(labels: Sequence[tuple[str, str]]) -> tuple[LabelValues, LabelValues]:
+    """Return the names and the values of `(name, value)` pairs."""
+    return tuple(name for name, _ in labels), tuple(value for _, value in labels)
+
+
+class _Metric(ABC):
+    """The base class of the metrics. The values are stored per label values."""
+
+    type_: str = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name: str = name
+        self.documentation: str = documentation
+        self.labelnames: tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _samples(self, const_labels: Sequence[tuple[str, str]]) -> list[str]:
+        """Return the samples. `const_labels` are added to the labels of every sample."""
+
+    def render(self, const_labels: Sequence[tuple[str, str]] = ()) -> str:
+        """Return the metric in the Prometheus text format."""
+        lines: list[str] = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_}",
+            *self._samples(const_labels=const_labels),
+        ]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    type_ = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name=name, documentation=documentation, labelnames=labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, labels: LabelValues = (), amount: float = 1) -> None:
+        """This is used to increment the counter."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: LabelValues = ()) -> float:
+        """Return the current value."""
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def _samples(self, const_labels: Sequence[tuple[str, str]]) -> list[str]:
+        with self._lock:
+            values: list[tuple[LabelValues, float]] = sorted(self._values.items())
+        const_names, const_values = _split_labels(const_labels)
+        names: tuple[str, ...] = (*const_names, *self.labelnames)
+        return [
+            f"{self.name}{_format_labels(names, (*const_values, *labels))} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    """A value that can go up and down."""
+
+    type_ = "gauge"
+
+    def dec(self, labels: LabelValues = (), amount: float = 1) -> None:
+        """This is used to decrement the gauge."""
+        self.inc(labels=labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Observations counted in cumulative buckets, plus their count and sum."""
+
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name=name, documentation=documentation, labelnames=labelnames)
+        self.buckets: tuple[float, ...] = (*sorted(buckets), float("inf"))
+        # labels -> [count per bucket (non-cumulative), sum]
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        """This is used to record an observation."""
+        idx: int = next(idx for idx, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts, total = self._values.setdefault(labels, ([0] * len(self.buckets), [0.0]))
+            counts[idx] += 1
+            total[0] += value
+
+    def _samples(self, const_labels: Sequence[tuple[str, str]]) -> list[str]:
+        with self._lock:
+            values: list[tuple[LabelValues, list[int], float]] = [
+                (labels, list(counts), total[0])
+                for labels, (counts, total) in sorted(self._values.items())
+            ]
+
+        lines: list[str] = []
+        const_names, const_values = _split_labels(const_labels)
+        names: tuple[str, ...] = (*const_names, *self.labelnames)
+        for labels, counts, total in values:
+            cumulative: int = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                label_str: str = _format_labels(
+                    (*names, "le"), (*const_values, *labels, _format_value(bound))
+                )
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(names, (*const_values, *labels))
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+        return lines
+
+
+class Registry:
+    """A collection of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: Any) -> Any:
+        """This is used to add a metric to the registry. It returns the metric."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name!r}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text format. Every series is
+        labelled with the pid of the worker (see the module docstring)."""
+        const_labels: tuple[tuple[str, str], ...] = ((WORKER_LABEL, str(os.getpid())),)
+        metrics: list[_Metric] = list(self._metrics.values())
+        return "\n".join(metric.render(const_labels=const_labels) for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LABELS: tuple[str, ...] = ("method", "route")
+requests_total: Counter = registry.register(
+    Counter("http_requests_total", "Number of HTTP requests.", (*REQUEST_LABELS, "status"))
+)
+request_duration: Histogram = registry.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency.", REQUEST_LABELS)
+)
+requests_in_progress: Gauge = registry.register(
+    Gauge("http_requests_in_progress", "Number of HTTP requests being served.", REQUEST_LABELS)
+)
+request_db_queries: Histogram = registry.register(
+    Histogram(
+        "http_request_db_queries",
+        "Number of database queries per HTTP request.",
+        REQUEST_LABELS,
+        buckets=QUERY_COUNT_BUCKETS,
+    )
+)
+request_db_duration: Histogram = registry.register(
+    Histogram(
+        "http_request_db_duration_seconds",
+        "Time spent in the database per HTTP request.",
+        REQUEST_LABELS,
+    )
+)
+db_queries_total: Counter = registry.register(
+    Counter("db_queries_total", "Number of database queries (including the ones outside requests).")
+)
+db_query_duration: Histogram = registry.register(
+    Histogram("db_query_duration_seconds", "Database query latency.")
+)
+
+
+class RequestDBStats:
+    """The queries run while serving a request. The object is shared with the
+    threads the request runs its queries on, so it's updated under a lock."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.queries: int = 0
+        self.duration: float = 0.0
+
+    def record(self, duration: float) -> None:
+        """This is used to record a query."""
+        with self._lock:
+            self.queries += 1
+            self.duration += duration
+
+
+_request_db_stats: ContextVar[Optional[RequestDBStats]] = ContextVar(
+    "request_db_stats", default=None
+)
+
+
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool
+) -> None:
+    start_times: list[float] = conn.info.get("query_start_time", [])
+    if not start_times:
+        return
+    duration: float = time.perf_counter() - start_times.pop()
+    db_queries_total.inc()
+    db_query_duration.observe(duration)
+
+    stats: Optional[RequestDBStats] = _request_db_stats.get()
+    if stats is not None:
+        stats.record(duration=duration)
+
+
+@typechecked
+def instrument_engine(engine: Engine) -> None:
+    """This is used to time the queries of the engine. For an async engine,
+    pass `async_engine.sync_engine`. It's safe to call it more than once."""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_path(scope: Scope) -> str:
+    """Return the path template of the route that matches the request."""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records the metrics of every HTTP request. The route
+    label is the path template (e.g. `/api/v1/product/{name}`), not the path, to
+    keep the number of series bounded. Streaming responses are measured until
+    the last chunk is sent."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels: LabelValues = (scope["method"], _route_path(scope))
+        status_code: int = 500
+        stats = RequestDBStats()
+        token: Any = _request_db_stats.set(stats)
+        requests_in_progress.inc(labels=labels)
+        start: float = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration: float = time.perf_counter() - start
+            requests_in_progress.dec(labels=labels)
+            requests_total.inc(labels=(*labels, str(status_code)))
+            request_duration.observe(duration, labels=labels)
+            request_db_queries.observe(stats.queries, labels=labels)
+            request_db_duration.observe(stats.duration, labels=labels)
+            _request_db_stats.reset(token)
+
+
+@typechecked
+def render_metrics() -> str:
+    """Return all the metrics in the Prometheus text format."""
+    return registry.render()
@@ -0,0 +1,250 @@
+"""This module is used for writing the orders in batches (group commit).
+
+With `ORDER_QUEUE_ENABLED=true`, `POST /orders/` doesn't insert the orders
+itself: they're put in an in-process queue and the request waits for them to
+be written. A background task (the flusher) takes the orders from the queue
+and inserts them in one transaction, i.e. one commit (and one fsync) for many
+requests:
+    - a batch is written when it has `ORDER_QUEUE_MAX_BATCH` orders or
+      `ORDER_QUEUE_MAX_DELAY_MS` after its first order, whichever comes first.
+      The delay is the latency added to a request when the traffic is low.
+    - the request gets its orders (with their ids) back when the batch is
+      committed, so an acknowledged order is as durable as before...
+    - ...unless `ORDER_QUEUE_SYNCHRONOUS_COMMIT=off` (Postgres). The commit then
+      doesn't wait for the WAL to be flushed: a crash of the database can lose
+      the last acknowledged batches (but never leaves them half-written).
+    - the queue holds at most `ORDER_QUEUE_MAX_SIZE` orders. The requests that
+      don't fit are rejected with `OrderQueueFullError` (503).
+
+NB: The queue is per worker and in memory: the orders waiting in the queue of a
+worker that is killed are lost (they were never acknowledged). On shutdown, the
+queue is drained. An order is written even if its request was cancelled.
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+import time
+from typing import Any, Optional
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils import async_crud, crud
+from e_commerce_app.utils.typecheck import typechecked
+from e_commerce_app.v1.schemas import db_schema
+
+# Put in the queue by `stop`: the flusher writes the current batch and exits.
+_STOP: Any = object()
+
+
+class OrderQueueFullError(RuntimeError):
+    """Raised when too many orders are waiting to be written."""
+
+
+class OrderRejectedError(Exception):
+    """The order could not be inserted (e.g. its customer doesn't exist)."""
+
+
+def set_synchronous_commit(connection: Connection, synchronous_commit: str) -> None:
+    """This sets `synchronous_commit` for the current transaction only (Postgres)."""
+    # It's one of the values of `ORDER_QUEUE_SYNCHRONOUS_COMMIT`, i.e. not user input.
+    connection.execute(text(f"SET LOCAL synchronous_commit = {synchronous_commit}"))
+
+
+@typechecked
+def write_orders(
+    db: Session, data: list[db_schema.OrdersSchema], synchronous_commit: str
+) -> dict[str, Any]:
+    """This inserts a batch of orders in one transaction (see `crud.create_orders`).
+    On Postgres, `synchronous_commit` is set in every transaction of the session,
+    i.e. also in the one that retries the batch after a rejected order."""
+    if db.get_bind().dialect.name != "postgresql":
+        return crud.create_orders(db=db, data=data)
+
+    def after_begin(session: Session, transaction: Any, connection: Connection) -> None:
+        # The savepoints (`begin_nested`) inherit the setting of their transaction.
+        if transaction.nested:
+            return
+        set_synchronous_commit(connection=connection, synchronous_commit=synchronous_commit)
+
+    if db.in_transaction():
+        set_synchronous_commit(connection=db.connection(), synchronous_commit=synchronous_commit)
+    event.listen(db, "after_begin", after_begin)
+    try:
+        return crud.create_orders(db=db, data=data)
+    finally:
+        event.remove(db, "after_begin", after_begin)
+
+
+class OrderQueue:
+    """The queue of the orders waiting to be written and its flusher."""
+
+    def __init__(
+        self, max_batch: int, max_delay: float, max_size: int, synchronous_commit: str
+    ) -> None:
+        self.max_batch: int = max(max_batch, 1)
+        self.max_delay: float = max_delay
+        self.max_size: int = max_size
+        self.synchronous_commit: str = synchronous_commit
+        self._queue: Optional[asyncio.Queue[Any]] = None
+        self._flusher: Optional[asyncio.Task[None]] = None
+        self.batches: int = 0
+        self.orders: int = 0
+        self.rejected: int = 0
+        self.flush_seconds: float = 0.0
+
+    @property
+    def running(self) -> bool:
+        """Return True if the flusher is running."""
+        return self._flusher is not None and not self._flusher.done()
+
+    def start(self) -> None:
+        """This starts the flusher. It must be called from the event loop (see `lifespan`)."""
+        if self.running:
+            return
+        # Unbounded: `submit` checks the size, so `stop` can always add `_STOP`.
+        self._queue = asyncio.Queue()
+        self._flusher = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """This writes the orders left in the queue and stops the flusher."""
+        if not self.running:
+            return
+        self._queue.put_nowait(_STOP)  # type: ignore[union-attr]
+        await self._flusher  # type: ignore[misc]
+
+    async def submit(self, data: list[db_schema.OrdersSchema]) -> dict[str, Any]:
+        """This puts the orders in the queue and waits for them to be written. Return
+        the inserted orders and the errors (like `crud.create_orders`)."""
+        if self._queue is None or not self.running:
+            raise RuntimeError("The order queue isn't running.")
+        if self._queue.qsize() + len(data) > self.max_size:
+            raise OrderQueueFullError("Too many orders are waiting to be written.")
+
+        loop = asyncio.get_running_loop()
+        futures: list[asyncio.Future[Any]] = []
+        for order in data:
+            future: asyncio.Future[Any] = loop.create_future()
+            self._queue.put_nowait((order, future))
+            futures.append(future)
+
+        results: list[Any] = await asyncio.gather(*futures, return_exceptions=True)
+        rows: list[Any] = []
+        errors: list[dict[str, Any]] = []
+        for idx, result in enumerate(results):
+            if isinstance(result, Exception):
+                errors.append({"index": idx, "detail": str(result)})
+            else:
+                rows.append(result)
+        return {"data": rows, "errors": errors}
+
+    async def _next_batch(self) -> tuple[list[tuple[Any, asyncio.Future[Any]]], bool]:
+        """Return the next batch and whether `stop` was called. It waits for the
+        first order, then for at most `max_delay` seconds."""
+        queue: asyncio.Queue[Any] = self._queue  # type: ignore[assignment]
+        item: Any = await queue.get()
+        if item is _STOP:
+            return [], True
+
+        batch: list[tuple[Any, asyncio.Future[Any]]] = [item]
+        deadline: float = asyncio.get_running_loop().time() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout: float = deadline - asyncio.get_running_loop().time()
+            try:
+                item = (
+                    queue.get_nowait()
+                    if timeout <= 0
+                    else await asyncio.wait_for(queue.get(), timeout=timeout)
+                )
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _write(self, data: list[db_schema.OrdersSchema]) -> dict[str, Any]:
+        return await async_crud.run_in_session(
+            write_orders, data=data, synchronous_commit=self.synchronous_commit
+        )
+
+    async def _flush(self, batch: list[tuple[Any, asyncio.Future[Any]]]) -> None:
+        """This writes the batch and resolves the futures of its orders."""
+        start: float = time.perf_counter()
+        try:
+            result: dict[str, Any] = await self._write(data=[order for order, _ in batch])
+        except Exception as err:
+            logger.error(f"Failed to write a batch of {len(batch)} orders: {err}")
+            result = {
+                "data": [],
+                "errors": [{"index": idx, "detail": str(err)} for idx in range(len(batch))],
+            }
+        self.flush_seconds += time.perf_counter() - start
+        self.batches += 1
+        self.orders += len(result["data"])
+        self.rejected += len(result["errors"])
+
+        # The inserted rows are in the order of the batch, without the rejected ones.
+        errors: dict[int, str] = {error["index"]: error["detail"] for error in result["errors"]}
+        rows: Any = iter(result["data"])
+        for idx, (_, future) in enumerate(batch):
+            outcome: Any = OrderRejectedError(errors[idx]) if idx in errors else next(rows)
+            # The request may have been cancelled meanwhile.
+            if future.done():
+                continue
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    async def _run(self) -> None:
+        stopped: bool = False
+        while not stopped:
+            batch, stopped = await self._next_batch()
+            if batch:
+                await self._flush(batch=batch)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the counters of the queue."""
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "orders": self.orders,
+            "rejected": self.rejected,
+            "avg_batch_size": round((self.orders + self.rejected) / self.batches, 3)
+            if self.batches
+            else 0.0,
+            "avg_flush_seconds": round(self.flush_seconds / self.batches, 6)
+            if self.batches
+            else 0.0,
+        }
+
+
+order_queue = OrderQueue(
+    max_batch=get_settings().order_queue.ORDER_QUEUE_MAX_BATCH,
+    max_delay=get_settings().order_queue.ORDER_QUEUE_MAX_DELAY_MS / 1_000,
+    max_size=get_settings().order_queue.ORDER_QUEUE_MAX_SIZE,
+    synchronous_commit=get_settings().order_queue.ORDER_QUEUE_SYNCHRONOUS_COMMIT,
+)
+
+
+@typechecked
+def order_queue_stats() -> dict[str, Any]:
+    """Return the counters of the order queue."""
+    return order_queue.stats()
+
+
+async def order_queue_full_handler(request: Request, exc: OrderQueueFullError) -> JSONResponse:
+    """This converts `OrderQueueFullError` to a 503 response."""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
@@ -0,0 +1,79 @@
+"""This module is used for keyset (cursor) pagination.
+
+The cursor is an opaque, URL-safe token that holds the `id` of the last row of
+the previous page. The next page is fetched with `WHERE id > :last_id ORDER BY id`,
+so every page costs the same no matter how deep it is.
+
+Author: Chinedu Ezeofor
+"""
+
+import base64
+import json
+from typing import Annotated, Any, Optional
+
+from fastapi import Depends, HTTPException, Query, status
+
+from e_commerce_app.utils.typecheck import typechecked
+
+DEFAULT_PAGE_SIZE: int = 100
+MAX_PAGE_SIZE: int = 1_000
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor can't be decoded."""
+
+
+@typechecked
+def encode_cursor(last_id: int) -> str:
+    """This is used to create an opaque cursor from the id of the last row."""
+    payload: bytes = json.dumps({"id": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+@typechecked
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    """This returns the id stored in the cursor. It returns None for the first page."""
+    if not cursor:
+        return None
+
+    try:
+        padding: str = "=" * (-len(cursor) % 4)
+        payload: Any = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        last_id: Any = payload["id"]
+    except (ValueError, TypeError, KeyError) as err:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from err
+
+    if not isinstance(last_id, int):
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}")
+    return last_id
+
+
+@typechecked
+def paginate(rows: list[Any], limit: int) -> dict[str, Any]:
+    """This builds a page from `limit + 1` rows. The extra row is only used to know
+    whether there is a next page."""
+    data: list[Any] = rows[:limit]
+    next_cursor: Optional[str] = encode_cursor(last_id=data[-1].id) if len(rows) > limit else None
+    return {"data": data, "next_cursor": next_cursor}
+
+
+@typechecked
+def paginate_offset(rows: list[Any], limit: int, offset: int) -> dict[str, Any]:
+    """Offset variant of `paginate`. It's used for the ranked results (e.g. search),
+    which can't be paginated by id."""
+    next_offset: Optional[int] = offset + limit if len(rows) > limit else None
+    return {"data": rows[:limit], "next_offset": next_offset}
+
+
+@typechecked
+def get_after_id(cursor: Optional[str] = None) -> Optional[int]:
+    """This is used as a dependency to decode the `cursor` query parameter."""
+    try:
+        return decode_cursor(cursor=cursor)
+    except InvalidCursorError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+
+
+after_id_dependency = Annotated[Optional[int], Depends(get_after_id)]
+limit_query = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+offset_query = Annotated[int, Query(ge=0)]
@@ -0,0 +1,100 @@
+"""This module is used for tracking the usage of the database connection pool.
+
+Author: Chinedu Ezeofor
+"""
+
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from e_commerce_app.utils.typecheck import typechecked
+
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts and the time spent waiting
+    for a connection."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """This is used to reset all the counters."""
+        with self._lock:
+            self.checkouts: int = 0
+            self.timeouts: int = 0
+            self.total_wait: float = 0.0
+            self.max_wait: float = 0.0
+
+    def record_checkout(self, wait: float) -> None:
+        """This is used to record a successful checkout and its wait time."""
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self, wait: float) -> None:
+        """This is used to record a checkout that timed out."""
+        with self._lock:
+            self.timeouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return a copy of the counters."""
+        with self._lock:
+            avg_wait: float = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "total_wait_seconds": round(self.total_wait, 6),
+                "avg_wait_seconds": round(avg_wait, 6),
+                "max_wait_seconds": round(self.max_wait, 6),
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Records how long each checkout waited for a connection. Each pool has its
+    own `stats` (e.g. the sync and the async engines), which start from zero when
+    the pool is recreated (e.g. by `engine.dispose()` after a fork)."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats: PoolStats = PoolStats()
+
+    def connect(self) -> Any:
+        start: float = time.perf_counter()
+        try:
+            connection = super().connect()  # type: ignore[misc]
+        except exc.TimeoutError:
+            self.stats.record_timeout(wait=time.perf_counter() - start)
+            raise
+        self.stats.record_checkout(wait=time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """A `QueuePool` that records the checkout statistics."""
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """An `AsyncAdaptedQueuePool` (used by async engines) that records the checkout
+    statistics."""
+
+
+@typechecked
+def get_pool_stats(pool: Any) -> dict[str, Any]:
+    """Return the current state of the pool together with its checkout statistics
+    (zero if the pool isn't instrumented)."""
+    stats: dict[str, Any] = {
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    pool_stats: PoolStats = getattr(pool, "stats", None) or PoolStats()
+    stats.update(pool_stats.snapshot())
+    return stats
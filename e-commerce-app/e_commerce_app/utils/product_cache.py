@@ -0,0 +1,176 @@
+"""This module contains the read-through cache of the products router.
+
+    - name:<name>: a product (`GET /product/{name}`).
+    - page:<after_id>:<limit>: a page of products (`GET /products/`).
+
+A cold key is loaded only once: the concurrent requests for the same key wait
+for the first one (request coalescing). Any write to the products invalidates
+the whole cache: the keys are prefixed with a generation counter stored in the
+backend (i.e. shared by the workers with `redis`), which the write increments.
+The entries of the previous generations are no longer read and expire on their
+own, so a load that started before the write can't serve its stale value.
+
+With read replicas, the loads run on the primary for
+`REPLICA_READ_YOUR_WRITES_SECONDS` after the generation changed: a replica may
+not have the write yet and its result would be cached for `PRODUCT_CACHE_TTL`.
+
+NB: With the `memory` backend every worker has its own cache, i.e. the other
+workers only see a write when their entries expire (`PRODUCT_CACHE_TTL`).
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils.cache import CacheBackend, RedisCache, TTLCache
+from e_commerce_app.utils.replicas import read_from_primary
+from e_commerce_app.utils.typecheck import typechecked
+
+GENERATION_KEY: str = "generation"
+
+
+@typechecked
+def create_backend() -> CacheBackend:
+    """Return the cache backend selected with `PRODUCT_CACHE_BACKEND`."""
+    cache_settings = get_settings().cache
+    if cache_settings.PRODUCT_CACHE_BACKEND == "redis":
+        return RedisCache(
+            url=cache_settings.PRODUCT_CACHE_URL,
+            ttl=cache_settings.PRODUCT_CACHE_TTL,
+            prefix="products:",
+        )
+    return TTLCache(maxsize=cache_settings.PRODUCT_CACHE_SIZE, ttl=cache_settings.PRODUCT_CACHE_TTL)
+
+
+class ProductCache:
+    """A read-through cache with request coalescing on top of a `CacheBackend`.
+    The calls to a remote backend run on the threadpool, so they don't block the
+    event loop."""
+
+    def __init__(self, backend: CacheBackend, primary_window: float = 0.0) -> None:
+        self.backend: CacheBackend = backend
+        # Seconds the loads run on the primary after the generation changed.
+        self.primary_window: float = primary_window
+        self._remote: bool = not isinstance(backend, TTLCache)
+        # Only used on the event loop. The keys include the generation.
+        self._inflight: dict[str, asyncio.Task[Any]] = {}
+        # The last generation seen by this worker and when it changed.
+        self._generation: Optional[int] = None
+        self._generation_changed_at: float = float("-inf")
+        self._lock = threading.Lock()
+        self.loads: int = 0
+        self.coalesced: int = 0
+        self.invalidations: int = 0
+
+    async def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._remote:
+            return await run_in_threadpool(func, *args)
+        return func(*args)
+
+    def _lookup(self, key: str) -> tuple[str, Any]:
+        """Return the key of the current generation and its cached value."""
+        generation: int = self.backend.get_counter(GENERATION_KEY)
+        with self._lock:
+            # The first generation seen on startup isn't a change.
+            if self._generation is not None and generation != self._generation:
+                self._generation_changed_at = time.monotonic()
+            self._generation = generation
+        versioned_key: str = f"{generation}:{key}"
+        return versioned_key, self.backend.get(versioned_key)
+
+    def _recently_written(self) -> bool:
+        with self._lock:
+            return time.monotonic() - self._generation_changed_at < self.primary_window
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if self._recently_written():
+            # The load runs in its own task, i.e. this only affects its reads.
+            with read_from_primary():
+                value: Any = await loader()
+        else:
+            value = await loader()
+        # `None` (i.e. not found) isn't cached.
+        if value is not None:
+            await self._call(self.backend.set, key, value)
+        return value
+
+    def _forget(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value of `key`. On a miss, the value is loaded with
+        `loader()` and cached. Concurrent misses share the same load."""
+        versioned_key, value = await self._call(self._lookup, key)
+        if value is not None:
+            return value
+
+        task: Optional[asyncio.Task[Any]] = self._inflight.get(versioned_key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key=versioned_key, loader=loader))
+            self._inflight[versioned_key] = task
+            task.add_done_callback(lambda done: self._forget(key=versioned_key, task=done))
+            with self._lock:
+                self.loads += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+
+        # The load isn't cancelled if this request is, the other requests may be waiting for it.
+        return await asyncio.shield(task)
+
+    def _invalidate(self) -> None:
+        self.backend.incr(GENERATION_KEY)
+        # The old generations would only take up room in the LRU. With a remote
+        # backend, they expire on their own (no SCAN of the whole keyspace).
+        if not self._remote:
+            self.backend.clear()
+        with self._lock:
+            self.invalidations += 1
+
+    async def invalidate(self) -> None:
+        """This is used to drop all the cached products, e.g. after a write."""
+        await self._call(self._invalidate)
+
+    def stats(self) -> dict[str, Any]:
+        """Return the statistics of the backend and the load/coalescing counters."""
+        with self._lock:
+            counters: dict[str, Any] = {
+                "loads": self.loads,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+            }
+        return {
+            "backend": type(self.backend).__name__,
+            **self.backend.stats(),
+            **counters,
+        }
+
+
+product_cache = ProductCache(
+    backend=create_backend(),
+    primary_window=get_settings().replica.REPLICA_READ_YOUR_WRITES_SECONDS,
+)
+
+
+@typechecked
+async def invalidate_products() -> None:
+    """This is used to drop the cached products when the products change, i.e.
+    after the write is committed. A failure is logged: the write itself succeeded."""
+    try:
+        await product_cache.invalidate()
+    except Exception as err:
+        logger.warning(f"The product cache could not be invalidated: {err}")
+
+
+@typechecked
+def product_cache_stats() -> dict[str, Any]:
+    """Return the statistics of the product cache."""
+    return product_cache.stats()
@@ -0,0 +1,196 @@
+"""This module is used for profiling single requests on demand.
+
+When `PROFILING_ENABLED=true`, an admin can send `X-Profile: 1` (or `?profile=1`)
+together with a valid `X-Admin-Token` to run the request under pyinstrument (a
+sampling profiler). The profile is stored in memory and its id is returned in the
+`X-Profile-Id` response header. See `GET /admin/profiles/{profile_id}` for the
+speedscope file (https://www.speedscope.app).
+
+The time of the request is split into:
+    - validation: request parsing and dependencies (`solve_dependencies`).
+    - database: `crud`/`async_crud` and the database drivers.
+    - serialization: response validation and encoding.
+    - bcrypt: password hashing/verification.
+    - other: everything else (endpoint code, middlewares, ...).
+A sample counts for the innermost of these it's in, e.g. the database lookup of
+`get_current_user` counts as database, not validation.
+
+NB: pyinstrument is an optional dependency and the middleware is only added
+when profiling is enabled, i.e. there's no overhead when it's off.
+
+Author: Chinedu Ezeofor
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils.typecheck import typechecked
+from e_commerce_app.v1.auth.admin_auth import is_admin_token
+
+PROFILE_HEADER: bytes = b"x-profile"
+PROFILE_QUERY_PARAM: str = "profile"
+ADMIN_TOKEN_HEADER: bytes = b"x-admin-token"
+TRUTHY: tuple[str, ...] = ("1", "true", "yes", "on")
+
+# category -> (file path fragments, function names). The first match wins.
+CATEGORIES: tuple[tuple[str, tuple[str, ...], tuple[str, ...]], ...] = (
+    ("bcrypt", ("/bcrypt/", "/passlib/", "e_commerce_app/utils/hashing.py"), ()),
+    (
+        "database",
+        (
+            "/sqlalchemy/",
+            "/psycopg2/",
+            "/asyncpg/",
+            "e_commerce_app/utils/crud.py",
+            "e_commerce_app/utils/async_crud.py",
+        ),
+        (),
+    ),
+    ("serialization", ("starlette/responses.py",), ("serialize_response", "jsonable_encoder")),
+    ("validation", (), ("solve_dependencies", "request_body_to_args")),
+)
+OTHER: str = "other"
+
+
+def _frame_category(frame: Any) -> Optional[str]:
+    file_path: str = frame.file_path or ""
+    for category, paths, functions in CATEGORIES:
+        if frame.function in functions or any(path in file_path for path in paths):
+            return category
+    return None
+
+
+@typechecked
+def time_split(root_frame: Any) -> dict[str, float]:
+    """Return the time (in seconds) spent in each category. Every sample counts
+    for the innermost category of its stack."""
+    split: dict[str, float] = {category: 0.0 for category, _, _ in CATEGORIES}
+    split[OTHER] = 0.0
+    if root_frame is None:
+        return split
+
+    stack: list[tuple[Any, str]] = [(root_frame, OTHER)]
+    while stack:
+        frame, category = stack.pop()
+        category = _frame_category(frame) or category
+        if not frame.children:
+            split[category] += frame.time
+        stack.extend((child, category) for child in frame.children)
+    return {category: round(seconds, 6) for category, seconds in split.items()}
+
+
+class ProfileStore:
+    """The last `maxsize` profiles."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._profiles: deque[dict[str, Any]] = deque(maxlen=maxsize)
+        self._lock = threading.Lock()
+
+    def add(self, profile: dict[str, Any]) -> None:
+        """This is used to store a profile."""
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[dict[str, Any]]:
+        """Return the profile or None if it doesn't exist (anymore)."""
+        with self._lock:
+            return next((item for item in self._profiles if item["id"] == profile_id), None)
+
+    def summaries(self) -> list[dict[str, Any]]:
+        """Return the profiles without the speedscope files, the newest first."""
+        with self._lock:
+            profiles: list[dict[str, Any]] = list(self._profiles)
+        return [
+            {key: value for key, value in item.items() if key != "speedscope"}
+            for item in reversed(profiles)
+        ]
+
+    def clear(self) -> None:
+        """This is used to remove all the profiles."""
+        with self._lock:
+            self._profiles.clear()
+
+
+profile_store = ProfileStore(maxsize=get_settings().profiling.PROFILING_BUFFER_SIZE)
+
+
+def _is_requested(scope: Scope) -> bool:
+    """Return True if the request asks to be profiled and has a valid admin token."""
+    headers: dict[bytes, bytes] = dict(scope["headers"])
+    flag: Optional[str] = None
+    if PROFILE_HEADER in headers:
+        flag = headers[PROFILE_HEADER].decode("latin-1")
+    elif scope.get("query_string"):
+        query: dict[str, list[str]] = parse_qs(scope["query_string"].decode("latin-1"))
+        flag = query.get(PROFILE_QUERY_PARAM, [None])[-1]
+
+    if flag is None or flag.strip().lower() not in TRUTHY:
+        return False
+    token: Optional[bytes] = headers.get(ADMIN_TOKEN_HEADER)
+    return is_admin_token(token=None if token is None else token.decode("latin-1"))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles the requests of the admins that ask for it.
+    The other requests go straight to the app."""
+
+    def __init__(self, app: ASGIApp, interval: float) -> None:
+        try:
+            from pyinstrument import Profiler
+            from pyinstrument.renderers import SpeedscopeRenderer
+        except ImportError as err:
+            raise ImportError(
+                "Profiling requires `pyinstrument`. Install it with: pip install pyinstrument"
+            ) from err
+
+        self.app: ASGIApp = app
+        self.interval: float = interval
+        self._profiler_class: Any = Profiler
+        self._renderer_class: Any = SpeedscopeRenderer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _is_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id: str = uuid.uuid4().hex
+        status_code: int = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        # async_mode="enabled": only this request is sampled, and the time spent
+        # awaiting (e.g. the threadpool) is attributed to the awaiting frame.
+        profiler: Any = self._profiler_class(interval=self.interval, async_mode="enabled")
+        start: float = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session: Any = profiler.stop()
+            duration: float = time.perf_counter() - start
+            profile_store.add(
+                {
+                    "id": profile_id,
+                    "timestamp": datetime.now(timezone.utc),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "duration_seconds": round(duration, 6),
+                    "time_split_seconds": time_split(root_frame=session.root_frame()),
+                    "speedscope": self._renderer_class().render(session),
+                }
+            )
@@ -0,0 +1,326 @@
+"""This module is used for sending the reads to the read replicas.
+
+The replicas are set with `DB_REPLICA_URLS` (comma-separated). The read-only
+functions of `async_crud` (e.g. `get_customer`, `get_products`, `get_orders`)
+run on a replica, the other queries on the primary:
+
+    - selection: `round_robin` or `least_connections` (the replica with the
+      fewest reads in progress), see `REPLICA_SELECTION`.
+    - ejection: a replica that fails (e.g. connection refused, disconnect) is
+      taken out of the rotation for `REPLICA_EJECT_SECONDS` and the read is
+      retried on the primary. After that, the next read checks if it's back.
+    - read-your-writes: a client that has just written (POST, PUT, PATCH,
+      DELETE) reads from the primary for `REPLICA_READ_YOUR_WRITES_SECONDS`, so
+      it doesn't miss its own write because of the replication lag.
+      The client is identified by a cookie and, for the clients that don't keep
+      cookies, by its `Authorization` header (or address) in this worker.
+
+Without replicas, everything runs on the primary as before.
+
+Author: Chinedu Ezeofor
+"""
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils import credentials
+from e_commerce_app.utils.cache import TTLCache
+from e_commerce_app.utils.typecheck import typechecked
+
+READ_YOUR_WRITES_COOKIE: str = "db_recent_write"
+SAFE_METHODS: frozenset[str] = frozenset({"GET", "HEAD", "OPTIONS"})
+RECENT_WRITERS_SIZE: int = 10_000
+
+_use_primary: ContextVar[bool] = ContextVar("use_primary", default=False)
+
+
+@contextmanager
+def read_from_primary() -> Iterator[None]:
+    """This is used to run the reads of the block on the primary."""
+    token: Any = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaUnavailableError(Exception):
+    """The read failed on the replica. It's retried on the primary."""
+
+
+class Replica:
+    """A read replica: its engine, session factory and health."""
+
+    def __init__(self, url: str, async_mode: bool, pool_kwargs: dict[str, Any]) -> None:
+        self.url: str = make_url(url).render_as_string(hide_password=True)
+        self.engine: Any
+        self.session_factory: Any
+        if async_mode:
+            async_url: Any = make_url(url).set(drivername="postgresql+asyncpg")
+            self.engine = create_async_engine(async_url, echo=False, **pool_kwargs)
+            self.session_factory = async_sessionmaker(
+                bind=self.engine, autoflush=False, expire_on_commit=False
+            )
+        else:
+            self.engine = create_engine(url, echo=False, **pool_kwargs)
+            self.session_factory = sessionmaker(
+                bind=self.engine, autoflush=False, expire_on_commit=False
+            )
+        self.ejected_until: float = 0.0
+        self.in_progress: int = 0
+        self.reads: int = 0
+        self.failures: int = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def sync_engine(self) -> Engine:
+        """Return the (sync) engine, e.g. to instrument it."""
+        return getattr(self.engine, "sync_engine", self.engine)
+
+    def is_healthy(self, now: float) -> bool:
+        """Return True if the replica isn't ejected."""
+        return self.ejected_until <= now
+
+    def stats(self, now: float) -> dict[str, Any]:
+        """Return the health and the counters of the replica."""
+        return {
+            "url": self.url,
+            "healthy": self.is_healthy(now=now),
+            "ejected_for_seconds": round(max(self.ejected_until - now, 0.0), 3),
+            "in_progress": self.in_progress,
+            "reads": self.reads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaRouter:
+    """Chooses the replica of each read and tracks the health of the replicas.
+    The engines are created on the first use (or by `init`)."""
+
+    def __init__(
+        self, urls: list[str], selection: str, eject_seconds: float, async_mode: bool
+    ) -> None:
+        self.urls: list[str] = urls
+        self.selection: str = selection
+        self.eject_seconds: float = eject_seconds
+        self.async_mode: bool = async_mode
+        self._replicas: Optional[list[Replica]] = None
+        self._counter: Any = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if there are replicas."""
+        return bool(self.urls)
+
+    @property
+    def replicas(self) -> list[Replica]:
+        """Return the replicas. The engines are created on the first call."""
+        if self._replicas is None:
+            with self._lock:
+                if self._replicas is None:
+                    from e_commerce_app.models import get_pool_kwargs
+
+                    replicas: list[Replica] = [
+                        Replica(url=url, async_mode=self.async_mode, pool_kwargs=get_pool_kwargs())
+                        for url in self.urls
+                    ]
+                    for replica in replicas:
+                        self._listen(replica=replica)
+                    self._replicas = replicas
+        return self._replicas
+
+    def init(self) -> list[Engine]:
+        """This is used to create the engines, e.g. on startup. Return the (sync)
+        engines of the replicas."""
+        return [replica.sync_engine for replica in self.replicas]
+
+    def _listen(self, replica: Replica) -> None:
+        def handle_error(context: Any) -> None:
+            # Only the connection errors: a bad query would fail on the primary too.
+            if context.is_disconnect or context.connection is None:
+                self.eject(replica=replica, error=context.original_exception)
+
+        event.listen(replica.sync_engine, "handle_error", handle_error)
+
+    def eject(self, replica: Replica, error: Any) -> None:
+        """This is used to take the replica out of the rotation for `eject_seconds`."""
+        with self._lock:
+            replica.failures += 1
+            replica.last_error = str(error).strip()
+            replica.ejected_until = time.monotonic() + self.eject_seconds
+        logger.warning(f"Replica {replica.url} ejected for {self.eject_seconds}s: {error}")
+
+    def choose(self) -> Optional[Replica]:
+        """Return the replica of the next read or None if it must run on the primary
+        (no replicas, all ejected or a recent write of the client)."""
+        if not self.enabled or _use_primary.get():
+            return None
+        now: float = time.monotonic()
+        healthy: list[Replica] = [replica for replica in self.replicas if replica.is_healthy(now)]
+        if not healthy:
+            return None
+        if self.selection == "least_connections":
+            return min(healthy, key=lambda replica: replica.in_progress)
+        return healthy[next(self._counter) % len(healthy)]
+
+    def _unavailable(self, replica: Replica, failures: int, error: Any) -> ReplicaUnavailableError:
+        """Return the error to raise when the replica failed. It's ejected unless
+        `handle_error` did it already."""
+        if replica.failures == failures:
+            self.eject(replica=replica, error=error)
+        return ReplicaUnavailableError(str(error))
+
+    def _run_sync(
+        self, replica: Replica, failures: int, func: Callable[..., Any], kwargs: dict[str, Any]
+    ) -> Any:
+        db: Session
+        with replica.session_factory() as db:
+            # The connection is opened first: the crud functions return None on errors.
+            try:
+                db.connection()
+            except Exception as err:
+                raise self._unavailable(replica=replica, failures=failures, error=err) from err
+            return func(db=db, **kwargs)
+
+    async def _run_async(
+        self, replica: Replica, failures: int, func: Callable[..., Any], kwargs: dict[str, Any]
+    ) -> Any:
+        db: AsyncSession
+        async with replica.session_factory() as db:
+            try:
+                await db.connection()
+            except Exception as err:
+                raise self._unavailable(replica=replica, failures=failures, error=err) from err
+            return await db.run_sync(lambda session: func(db=session, **kwargs))
+
+    async def run(self, replica: Replica, func: Callable[..., Any], **kwargs: Any) -> Any:
+        """Return the result of the crud function on the replica. It raises
+        `ReplicaUnavailableError` if the replica failed meanwhile."""
+        failures: int = replica.failures
+        with self._lock:
+            replica.in_progress += 1
+            replica.reads += 1
+        try:
+            if self.async_mode:
+                result: Any = await self._run_async(replica, failures, func, kwargs)
+            else:
+                result = await run_in_threadpool(self._run_sync, replica, failures, func, kwargs)
+        finally:
+            with self._lock:
+                replica.in_progress -= 1
+
+        # The connection can also be lost during the query: the crud function then
+        # returns None and the failure is only seen by `handle_error`.
+        if replica.failures != failures:
+            raise ReplicaUnavailableError(replica.last_error)
+        return result
+
+    async def dispose(self) -> None:
+        """This is used to close the connections of the replicas."""
+        for replica in self._replicas or []:
+            if self.async_mode:
+                await replica.engine.dispose()
+            else:
+                replica.engine.dispose()
+
+    def reset_after_fork(self) -> None:
+        """This replaces the pools in a forked process (see `models`)."""
+        for replica in self._replicas or []:
+            replica.sync_engine.dispose(close=False)
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Return the health and the counters of the replicas."""
+        if not self.enabled:
+            return []
+        now: float = time.monotonic()
+        with self._lock:
+            return [replica.stats(now=now) for replica in self.replicas]
+
+
+replica_router = ReplicaRouter(
+    urls=credentials.REPLICA_URLS,
+    selection=get_settings().replica.REPLICA_SELECTION,
+    eject_seconds=get_settings().replica.REPLICA_EJECT_SECONDS,
+    async_mode=get_settings().database.DB_ASYNC_MODE,
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=replica_router.reset_after_fork)
+
+
+@typechecked
+def replica_stats() -> list[dict[str, Any]]:
+    """Return the health and the counters of the replicas."""
+    return replica_router.stats()
+
+
+def _client_key(scope: Scope, headers: dict[bytes, bytes]) -> Optional[Any]:
+    """Return the key of the client: its `Authorization` header or its address."""
+    authorization: Optional[bytes] = headers.get(b"authorization")
+    if authorization:
+        return authorization
+    client: Optional[tuple[str, int]] = scope.get("client")
+    return client[0] if client else None
+
+
+def _has_cookie(headers: dict[bytes, bytes], name: str) -> bool:
+    cookies: str = headers.get(b"cookie", b"").decode("latin-1")
+    return any(item.strip().partition("=")[0] == name for item in cookies.split(";"))
+
+
+class ReadYourWritesMiddleware:
+    """ASGI middleware that sends the reads of the clients that have just written
+    to the primary. It's only added when there are replicas."""
+
+    def __init__(self, app: ASGIApp, window: float) -> None:
+        self.app: ASGIApp = app
+        self.window: float = window
+        self.recent_writers = TTLCache(maxsize=RECENT_WRITERS_SIZE, ttl=window)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.window <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        headers: dict[bytes, bytes] = dict(scope["headers"])
+        client: Optional[Any] = _client_key(scope=scope, headers=headers)
+        is_write: bool = scope["method"] not in SAFE_METHODS
+        use_primary: bool = (
+            is_write
+            or _has_cookie(headers=headers, name=READ_YOUR_WRITES_COOKIE)
+            or (client is not None and self.recent_writers.get(client) is not None)
+        )
+
+        async def send_wrapper(message: Message) -> None:
+            if is_write and message["type"] == "http.response.start" and message["status"] < 400:
+                if client is not None:
+                    self.recent_writers.set(client, True)
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{READ_YOUR_WRITES_COOKIE}=1; Max-Age={max(int(self.window), 1)}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        token: Any = _use_primary.set(use_primary)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _use_primary.reset(token)
@@ -0,0 +1,143 @@
+"""This module is used for searching the product catalog.
+
+On Postgres the search runs in the database (see `crud.search_products`). Other
+backends (e.g. SQLite in tests) use `ProductIndex`, an in-process inverted index
+over the name, description and tags of the products. It's built on the first
+search and kept up to date by `crud.create_products`.
+
+NB: The in-process index is local to the worker, i.e. it doesn't see the rows
+inserted by other processes. It's only meant for development and tests.
+
+Author: Chinedu Ezeofor
+"""
+
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from e_commerce_app import models
+from e_commerce_app.utils.typecheck import typechecked
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+@typechecked
+def parse_tags(tags: Optional[str]) -> list[str]:
+    """Return the normalized tags of a comma-separated string."""
+    if not tags:
+        return []
+    return [tag for tag in (tag.strip().lower() for tag in tags.split(",")) if tag]
+
+
+@typechecked
+def tokenize(text: Optional[str]) -> list[str]:
+    """Return the lowercase words of the text."""
+    if not text:
+        return []
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+@typechecked
+def parse_query(q: Optional[str]) -> tuple[list[str], list[str]]:
+    """Return the required and the excluded (`-word`) terms of a search query."""
+    include: list[str] = []
+    exclude: list[str] = []
+    for word in (q or "").split():
+        terms: list[str] = tokenize(word.lstrip("-"))
+        (exclude if word.startswith("-") else include).extend(terms)
+    return include, exclude
+
+
+class ProductIndex:
+    """A thread-safe inverted index of the products.
+
+    - terms: word -> {product id: number of occurrences in name + description}
+    - tags: normalized tag -> {product ids}
+    """
+
+    def __init__(self) -> None:
+        self._terms: defaultdict[str, dict[int, int]] = defaultdict(dict)
+        self._tags: defaultdict[str, set[int]] = defaultdict(set)
+        self._ids: set[int] = set()
+        self._built: bool = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _add(self, product: Any) -> None:
+        if product.id in self._ids:
+            return
+        self._ids.add(product.id)
+        counts: Counter[str] = Counter(tokenize(f"{product.name} {product.description}"))
+        for term, count in counts.items():
+            self._terms[term][product.id] = count
+        for tag in parse_tags(product.tags):
+            self._tags[tag].add(product.id)
+
+    def add(self, products: Iterable[Any]) -> None:
+        """This is used to index new products. It's a no-op until the index is built,
+        because the products are loaded when it's built."""
+        with self._lock:
+            if not self._built:
+                return
+            for product in products:
+                self._add(product)
+
+    def build(self, db: Session, chunk_size: int = 1_000) -> None:
+        """This loads all the products into the index. It only runs once."""
+        with self._lock:
+            if self._built:
+                return
+            stmt: Any = select(
+                models.Products.id,
+                models.Products.name,
+                models.Products.description,
+                models.Products.tags,
+            ).execution_options(yield_per=chunk_size)
+            for product in db.execute(stmt):
+                self._add(product)
+            self._built = True
+
+    def clear(self) -> None:
+        """This empties the index. It's rebuilt on the next search."""
+        with self._lock:
+            self._terms.clear()
+            self._tags.clear()
+            self._ids.clear()
+            self._built = False
+
+    def search(self, q: Optional[str], tags: list[str], limit: int, offset: int = 0) -> list[int]:
+        """Return the ids of the matching products, best match first.
+
+        A product matches if it contains all the words of `q`, none of the
+        `-excluded` words and all the `tags`. The rank is the number of
+        occurrences of the words; ties are ordered by id.
+        """
+        include, exclude = parse_query(q)
+        with self._lock:
+            candidates: Optional[set[int]] = None
+            for term in include:
+                matches: set[int] = set(self._terms.get(term, ()))
+                candidates = matches if candidates is None else candidates & matches
+            for tag in tags:
+                matches = self._tags.get(tag, set())
+                candidates = set(matches) if candidates is None else candidates & matches
+            if candidates is None:
+                return []
+            for term in exclude:
+                candidates -= self._terms.get(term, {}).keys()
+
+            ranks: dict[int, int] = {
+                idx: sum(self._terms[term].get(idx, 0) for term in include) for idx in candidates
+            }
+
+        ranked: list[int] = sorted(ranks, key=lambda idx: (-ranks[idx], idx))
+        return ranked[offset : offset + limit]
+
+
+product_index = ProductIndex()
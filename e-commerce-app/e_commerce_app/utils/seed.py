@@ -0,0 +1,301 @@
+"""This module is used for generating a synthetic dataset of customers, products
+and orders (see the `seed` command of `database.py`), e.g. for capacity planning
+and reproducible benchmarks.
+
+The dataset only depends on the seed and the sizes, i.e. two runs with the same
+arguments create the same rows (and ids) on Postgres and on SQLite. The tables
+must be empty (or reset) and the ids restart from 1 (see `reset_tables`):
+    - the rows are generated in chunks of `CHUNK_SIZE`, each with its own
+      `random.Random` seeded with (seed, table, chunk), using the batched
+      `choices(k=...)` draws where possible.
+    - the orders per customer follow a Zipf distribution (`skew`): a few
+      customers place most of the orders, like on a real shop.
+    - the order dates are spread over the `days` before `end_date`, with more
+      recent orders (growth). The status depends on the age of the order: the
+      recent ones are pending or processing, the old ones delivered.
+    - every customer has the password `SEED_PASSWORD`. It's hashed once (bcrypt
+      is ~250 ms per call), with a salt derived from the seed.
+    - the rows are loaded with `COPY` on Postgres and `executemany` otherwise,
+      then the tables are analyzed.
+
+Author: Chinedu Ezeofor
+"""
+
+import itertools
+import random
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Iterator, Optional
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.engine import Engine
+
+from e_commerce_app import models
+from e_commerce_app.utils.bulk_import import TABLES, copy_rows
+from e_commerce_app.utils.crud import pwd_context
+from e_commerce_app.utils.typecheck import typechecked
+
+SEED_PASSWORD: str = "password"
+# Fixed, so the chunks (and their random numbers) don't depend on any option.
+CHUNK_SIZE: int = 10_000
+END_DATE: date = date(2024, 12, 31)
+BCRYPT_SALT_CHARS: str = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+FIRST_NAMES: tuple[str, ...] = (
+    "ada", "bola", "chidi", "dami", "emeka", "funmi", "grace", "hassan", "ife", "james",
+    "kemi", "lola", "musa", "ngozi", "olu", "peter", "queen", "rita", "sade", "tunde",
+)  # fmt: skip
+LAST_NAMES: tuple[str, ...] = (
+    "adeyemi", "bello", "chukwu", "danjuma", "eze", "fashola", "garba", "ibrahim",
+    "johnson", "kalu", "lawal", "mohammed", "nwosu", "okafor", "smith", "yusuf",
+)  # fmt: skip
+CITIES: tuple[str, ...] = (
+    "lagos", "abuja", "enugu", "kano", "ibadan", "london", "berlin", "toronto",
+)  # fmt: skip
+STREETS: tuple[str, ...] = (
+    "main", "market", "church", "station", "park", "broad", "allen", "queens",
+)  # fmt: skip
+ADJECTIVES: tuple[str, ...] = (
+    "classic", "compact", "deluxe", "eco", "essential", "premium", "portable", "smart",
+    "sturdy", "vintage", "wireless", "organic",
+)  # fmt: skip
+NOUNS: tuple[str, ...] = (
+    "backpack", "blender", "chair", "headphones", "jacket", "kettle", "lamp", "mug",
+    "notebook", "phone case", "sneakers", "speaker", "t-shirt", "watch",
+)  # fmt: skip
+TAGS: tuple[str, ...] = (
+    "electronics", "home", "kitchen", "fashion", "sports", "office", "outdoor", "gift",
+    "sale", "new",
+)  # fmt: skip
+# (max age in days, statuses, cumulative weights)
+STATUS_BY_AGE: tuple[tuple[float, tuple[str, ...], tuple[float, ...]], ...] = (
+    (1, ("pending", "processing"), (0.6, 1.0)),
+    (3, ("pending", "processing", "shipped"), (0.1, 0.6, 1.0)),
+    (10, ("shipped", "delivered"), (0.6, 1.0)),
+    (float("inf"), ("shipped", "delivered"), (0.02, 1.0)),
+)
+
+
+class SeedError(RuntimeError):
+    """Raised when the tables aren't empty (the dataset wouldn't be reproducible)."""
+
+
+@typechecked
+def chunk_rng(seed: int, table: str, index: int) -> random.Random:
+    """Return the random generator of a chunk of the table."""
+    return random.Random(f"{seed}:{table}:{index}")
+
+
+def _chunks(n: int) -> Iterator[tuple[int, int, int]]:
+    """Yield the index, first row and size of the chunks of `n` rows."""
+    for index, start in enumerate(range(0, n, CHUNK_SIZE)):
+        yield index, start, min(CHUNK_SIZE, n - start)
+
+
+@typechecked
+def seed_password_hash(seed: int) -> str:
+    """Return the hash of `SEED_PASSWORD` with a salt derived from the seed."""
+    rng: random.Random = chunk_rng(seed=seed, table="password", index=0)
+    # The last character of a bcrypt salt only has 2 significant bits.
+    salt: str = "".join(rng.choices(BCRYPT_SALT_CHARS, k=21)) + rng.choice(".Oeu")
+    return pwd_context.handler("bcrypt").using(salt=salt).hash(SEED_PASSWORD)
+
+
+def generate_customers(n: int, seed: int, hashed_password: str) -> Iterator[list[dict[str, Any]]]:
+    """Yield the customers in chunks. The username of the i-th customer is `user{i}`."""
+    for index, start, size in _chunks(n):
+        rng: random.Random = chunk_rng(seed=seed, table="customers", index=index)
+        first_names: list[str] = rng.choices(FIRST_NAMES, k=size)
+        last_names: list[str] = rng.choices(LAST_NAMES, k=size)
+        cities: list[str] = rng.choices(CITIES, k=size)
+        streets: list[str] = rng.choices(STREETS, k=size)
+        rows: list[dict[str, Any]] = []
+        for idx in range(size):
+            number: int = start + idx
+            address: str = f"{rng.randint(1, 999)} {streets[idx]} street, {cities[idx]}"
+            rows.append(
+                {
+                    "name": f"{first_names[idx]} {last_names[idx]}",
+                    "username": f"user{number}",
+                    "email": f"user{number}@example.com",
+                    "billing_address": address if rng.random() < 0.5 else None,
+                    "shipping_address": address,
+                    "phone_number": f"+234{rng.randrange(10**9):09d}"
+                    if rng.random() < 0.7
+                    else None,
+                    "hashed_password": hashed_password,
+                }
+            )
+        yield rows
+
+
+def generate_products(n: int, seed: int) -> Iterator[list[dict[str, Any]]]:
+    """Yield the products in chunks. The prices follow a log-normal distribution."""
+    for index, _, size in _chunks(n):
+        rng: random.Random = chunk_rng(seed=seed, table="products", index=index)
+        adjectives: list[str] = rng.choices(ADJECTIVES, k=size)
+        nouns: list[str] = rng.choices(NOUNS, k=size)
+        rows: list[dict[str, Any]] = []
+        for idx in range(size):
+            name: str = f"{adjectives[idx]} {nouns[idx]}"
+            rows.append(
+                {
+                    "name": name,
+                    "description": f"a {name} for everyday use.",
+                    "tags": ",".join(rng.sample(TAGS, k=rng.randint(1, 3))),
+                    "price": round(rng.lognormvariate(3.0, 1.0), 2),
+                }
+            )
+        yield rows
+
+
+def _status(age_days: float, draw: float) -> str:
+    for max_age, statuses, cum_weights in STATUS_BY_AGE:
+        if age_days < max_age:
+            return statuses[next(idx for idx, weight in enumerate(cum_weights) if draw < weight)]
+    return "delivered"
+
+
+def generate_orders(
+    n: int,
+    customer_ids: list[int],
+    seed: int,
+    skew: float,
+    days: int,
+    end_date: date,
+) -> Iterator[list[dict[str, Any]]]:
+    """Yield the orders in chunks. The customers are drawn from a Zipf
+    distribution over a shuffled ranking of `customer_ids`."""
+    ranking: list[int] = list(customer_ids)
+    chunk_rng(seed=seed, table="ranking", index=0).shuffle(ranking)
+    cum_weights: list[float] = list(
+        itertools.accumulate(1 / rank**skew for rank in range(1, len(ranking) + 1))
+    )
+    for index, _, size in _chunks(n):
+        rng: random.Random = chunk_rng(seed=seed, table="orders", index=index)
+        customers: list[int] = rng.choices(ranking, cum_weights=cum_weights, k=size)
+        rows: list[dict[str, Any]] = []
+        for idx in range(size):
+            # More recent orders than old ones (mode = 0 days ago).
+            age: float = rng.triangular(0, days, 0)
+            rows.append(
+                {
+                    "customer_id": customers[idx],
+                    "order_date": end_date - timedelta(days=int(age)),
+                    "total_price": round(rng.lognormvariate(3.8, 0.9), 2),
+                    "status": _status(age_days=age, draw=rng.random()),
+                }
+            )
+        yield rows
+
+
+@typechecked
+def count_rows(engine: Engine) -> dict[str, int]:
+    """Return the number of rows of the seeded tables."""
+    with engine.connect() as conn:
+        return {
+            table: conn.scalar(select(func.count()).select_from(model)) or 0
+            for table, (model, _) in TABLES.items()
+        }
+
+
+@typechecked
+def reset_tables(engine: Engine) -> None:
+    """This is used to delete the orders, products and customers (and reset the ids)."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("TRUNCATE orders, products, customers RESTART IDENTITY CASCADE"))
+        else:
+            for table in ("orders", "products", "customers"):
+                conn.execute(text(f"DELETE FROM {table}"))
+
+
+def write_rows(engine: Engine, table: str, rows: list[dict[str, Any]]) -> None:
+    """This writes the rows in one transaction: `COPY` on Postgres, otherwise `executemany`."""
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as conn:
+            conn.execute(insert(TABLES[table][0]), rows)
+        return
+
+    connection: Any = engine.raw_connection()
+    try:
+        cursor: Any = connection.cursor()
+        copy_rows(cursor=cursor, table=table, columns=list(rows[0]), rows=rows)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+@typechecked
+def seed_database(
+    engine: Engine,
+    customers: int,
+    products: int,
+    orders: int,
+    seed: int = 42,
+    skew: float = 0.7,
+    days: int = 365,
+    end_date: date = END_DATE,
+    reset: bool = False,
+    echo: Callable[[str], Any] = print,
+) -> dict[str, Any]:
+    """This generates and loads the dataset. Return the number of rows and the
+    rows/sec of each table. It raises `SeedError` if the tables aren't empty,
+    unless `reset` is True."""
+    if orders and not customers:
+        raise SeedError("The orders need customers.")
+    if not reset and any(count_rows(engine=engine).values()):
+        raise SeedError("The tables aren't empty. Use `reset` to delete their rows first.")
+    # Even if the tables are empty: on Postgres, the sequences keep counting after
+    # the rows are deleted, and the ids must restart from 1.
+    reset_tables(engine=engine)
+
+    stats: dict[str, Any] = {"seed": seed}
+
+    def load(table: str, chunks: Iterator[list[dict[str, Any]]], total: int) -> None:
+        start: float = time.perf_counter()
+        done: int = 0
+        for rows in chunks:
+            write_rows(engine=engine, table=table, rows=rows)
+            done += len(rows)
+            rate: float = done / (time.perf_counter() - start)
+            echo(f"{table}: {done:,}/{total:,} rows | {rate:,.0f} rows/s")
+        seconds: float = time.perf_counter() - start
+        stats[table] = {
+            "rows": done,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(done / seconds, 1) if seconds else 0.0,
+        }
+
+    hashed_password: str = seed_password_hash(seed=seed)
+    load(
+        "customers",
+        generate_customers(n=customers, seed=seed, hashed_password=hashed_password),
+        customers,
+    )
+    load("products", generate_products(n=products, seed=seed), products)
+
+    customer_ids: Optional[list[int]] = None
+    if orders:
+        with engine.connect() as conn:
+            customer_ids = list(
+                conn.scalars(select(models.Customers.id).order_by(models.Customers.id))
+            )
+    load(
+        "orders",
+        generate_orders(
+            n=orders,
+            customer_ids=customer_ids or [],
+            seed=seed,
+            skew=skew,
+            days=days,
+            end_date=end_date,
+        ),
+        orders,
+    )
+
+    # The planner needs the statistics of the new rows.
+    is_postgres: bool = engine.dialect.name == "postgresql"
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE customers, products, orders" if is_postgres else "ANALYZE"))
+    return stats
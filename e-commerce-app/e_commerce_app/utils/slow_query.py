@@ -0,0 +1,204 @@
+"""This module is used for recording the slow database queries.
+
+Every statement that takes longer than `SLOW_QUERY_THRESHOLD` seconds is logged
+with its bound parameters and kept in a ring buffer (see `GET /admin/slow-queries`).
+
+With `SLOW_QUERY_EXPLAIN=true`, the plan of a slow SELECT is captured too:
+    - Postgres: `EXPLAIN (ANALYZE, BUFFERS)`, i.e. the query runs a second time.
+    - SQLite: `EXPLAIN QUERY PLAN`.
+The plan is captured once per statement (the plan of the same lookup rarely
+changes between calls) and inside a savepoint, so a failure can't break the
+transaction of the request. The plans of the last `MAX_PLANS` statements are
+kept (least recently used first out).
+
+Author: Chinedu Ezeofor
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils.typecheck import typechecked
+
+EXPLAIN_PREFIXES: dict[str, str] = {
+    "postgresql": "EXPLAIN (ANALYZE, BUFFERS) ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+MAX_PARAMETERS_LENGTH: int = 1_000
+MAX_PLANS: int = 1_000
+REDACTED: str = "***"
+
+
+@typechecked
+def format_parameters(parameters: Any) -> str:
+    """Return the bound parameters as a (truncated) string. The values of the
+    named parameters that look like passwords are redacted."""
+    if isinstance(parameters, dict):
+        parameters = {
+            key: REDACTED if "password" in str(key).lower() else value
+            for key, value in parameters.items()
+        }
+    elif isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], dict):
+        # executemany
+        parameters = [format_parameters(params) for params in parameters]
+
+    text: str = repr(parameters)
+    if len(text) > MAX_PARAMETERS_LENGTH:
+        text = f"{text[:MAX_PARAMETERS_LENGTH]}... ({len(text)} chars)"
+    return text
+
+
+def _name_parameters(parameters: Any, context: Any) -> Any:
+    """This maps the positional parameters (e.g. sqlite, asyncpg) to their names,
+    so they can be redacted."""
+    names: Optional[list[str]] = getattr(getattr(context, "compiled", None), "positiontup", None)
+    if not names or not isinstance(parameters, (list, tuple)):
+        return parameters
+    if parameters and isinstance(parameters[0], (list, tuple)):
+        # executemany
+        return [_name_parameters(parameters=params, context=context) for params in parameters]
+    if len(names) != len(parameters):
+        return parameters
+    return dict(zip(names, parameters))
+
+
+class SlowQueryLog:
+    """Records the statements slower than `threshold` seconds. The last
+    `maxsize` ones are kept in memory, with the plans of `max_plans` statements."""
+
+    def __init__(
+        self, threshold: float, maxsize: int, explain: bool, max_plans: int = MAX_PLANS
+    ) -> None:
+        self.threshold: float = threshold
+        self.explain: bool = explain
+        self.max_plans: int = max_plans
+        self._entries: deque[dict[str, Any]] = deque(maxlen=maxsize)
+        self._plans: OrderedDict[str, Optional[str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.total: int = 0
+        # The listeners must be the same objects to be found by `event.contains`.
+        self._listeners: dict[str, Any] = {
+            "before_cursor_execute": self._before_cursor_execute,
+            "after_cursor_execute": self._after_cursor_execute,
+        }
+
+    def _before_cursor_execute(
+        self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, many: bool
+    ) -> None:
+        conn.info.setdefault("slow_query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(
+        self, conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, many: bool
+    ) -> None:
+        start_times: list[float] = conn.info.get("slow_query_start_time", [])
+        if not start_times:
+            return
+        duration: float = time.perf_counter() - start_times.pop()
+        if duration < self.threshold:
+            return
+
+        plan: Optional[str] = None
+        if self.explain and not many and statement.lstrip()[:6].upper() == "SELECT":
+            plan = self._get_plan(conn=conn, statement=statement, parameters=parameters)
+        self.record(
+            statement=statement,
+            parameters=_name_parameters(parameters=parameters, context=context),
+            duration=duration,
+            plan=plan,
+        )
+
+    def _get_plan(self, conn: Any, statement: str, parameters: Any) -> Optional[str]:
+        """Return the plan of the statement. It's only captured the first time."""
+        with self._lock:
+            if statement in self._plans:
+                self._plans.move_to_end(statement)
+                return self._plans[statement]
+            # Reserve it, so concurrent requests don't explain the same statement.
+            self._set_plan(statement=statement, plan=None)
+
+        prefix: Optional[str] = EXPLAIN_PREFIXES.get(conn.dialect.name)
+        if prefix is None:
+            return None
+
+        # A raw cursor is used, so the EXPLAIN itself isn't timed or recorded.
+        savepoint: bool = conn.dialect.name == "postgresql"
+        dbapi_cursor: Any = conn.connection.cursor()
+        try:
+            if savepoint:
+                dbapi_cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                dbapi_cursor.execute(prefix + statement, parameters)
+                rows: list[Any] = dbapi_cursor.fetchall()
+            finally:
+                if savepoint:
+                    dbapi_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                    dbapi_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            plan: Optional[str] = "\n".join(" ".join(str(col) for col in row) for row in rows)
+        except Exception as err:
+            logger.warning(f"Could not explain the slow query: {err}")
+            plan = None
+        finally:
+            dbapi_cursor.close()
+
+        with self._lock:
+            self._set_plan(statement=statement, plan=plan)
+        return plan
+
+    def _set_plan(self, statement: str, plan: Optional[str]) -> None:
+        """This caches the plan and evicts the least recently used ones. The
+        caller must hold the lock."""
+        self._plans[statement] = plan
+        self._plans.move_to_end(statement)
+        while len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+
+    def record(
+        self, statement: str, parameters: Any, duration: float, plan: Optional[str] = None
+    ) -> None:
+        """This is used to log a slow query and add it to the buffer."""
+        entry: dict[str, Any] = {
+            "timestamp": datetime.now(timezone.utc),
+            "duration_seconds": round(duration, 6),
+            "statement": statement,
+            "parameters": format_parameters(parameters),
+            "plan": plan,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+        logger.warning(
+            f"Slow query ({duration:.3f}s): {statement} | parameters: {entry['parameters']}"
+        )
+
+    def entries(self) -> list[dict[str, Any]]:
+        """Return the recorded queries, the slowest first."""
+        with self._lock:
+            entries: list[dict[str, Any]] = list(self._entries)
+        return sorted(entries, key=lambda entry: entry["duration_seconds"], reverse=True)
+
+    def clear(self) -> None:
+        """This is used to empty the buffer and the captured plans."""
+        with self._lock:
+            self._entries.clear()
+            self._plans.clear()
+
+    def instrument(self, engine: Engine) -> None:
+        """This is used to time the queries of the engine. For an async engine,
+        pass `async_engine.sync_engine`. It's safe to call it more than once."""
+        for identifier, listener in self._listeners.items():
+            if not event.contains(engine, identifier, listener):
+                event.listen(engine, identifier, listener)
+
+
+slow_query_log = SlowQueryLog(
+    threshold=get_settings().slow_query.SLOW_QUERY_THRESHOLD,
+    maxsize=get_settings().slow_query.SLOW_QUERY_BUFFER_SIZE,
+    explain=get_settings().slow_query.SLOW_QUERY_EXPLAIN,
+)
@@ -0,0 +1,94 @@
+"""This module contains the `typechecked` decorator used by the app.
+
+typeguard adds runtime type checks to every call of the decorated function.
+They're useful in development and tests but add overhead to every request, so
+they can be switched off with `TYPECHECK_ENABLED=false` (e.g. in production).
+
+The functions are instrumented on their first call, not when they're decorated:
+typeguard parses and compiles the whole module of every function it instruments,
+i.e. instrumenting them all at import time made the cold start ~0.5s slower.
+`instrument_all()` instruments the remaining ones (see `utils/warmup.py`).
+
+NB: The variable is read when the modules are imported, i.e. it must be set
+before the app starts. It can't be read from `Settings` because the settings
+themselves are built from modules that use this decorator.
+
+Author: Chinedu Ezeofor
+"""
+
+import functools
+import inspect
+import os
+from typing import Any, Callable, Optional, TypeVar
+
+from typeguard import typechecked as _typechecked
+
+T_CallableOrType = TypeVar("T_CallableOrType", bound=Callable[..., Any])
+
+TYPECHECK_ENABLED: bool = os.getenv("TYPECHECK_ENABLED", "true").strip().lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+# The instrumenting callbacks of the functions that haven't been instrumented yet.
+_pending: list[Callable[[], Callable[..., Any]]] = []
+
+
+def _lazily_typechecked(target: Callable[..., Any]) -> Callable[..., Any]:
+    """Return a wrapper that instruments `target` on its first call. The wrapper
+    is of the same kind (coroutine, generator, ...) as `target`, so FastAPI
+    still treats the dependencies the same way."""
+    instrumented: Optional[Callable[..., Any]] = None
+
+    def get_instrumented() -> Callable[..., Any]:
+        nonlocal instrumented
+        # Instrumenting twice (e.g. from two threads) is harmless.
+        if instrumented is None:
+            instrumented = _typechecked(target)
+        return instrumented
+
+    wrapper: Callable[..., Any]
+    if inspect.iscoroutinefunction(target):
+
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return await get_instrumented()(*args, **kwargs)
+
+    elif inspect.isasyncgenfunction(target):
+
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:  # type: ignore[misc]
+            async for item in get_instrumented()(*args, **kwargs):
+                yield item
+
+    elif inspect.isgeneratorfunction(target):
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return (yield from get_instrumented()(*args, **kwargs))
+
+    else:
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return get_instrumented()(*args, **kwargs)
+
+    _pending.append(get_instrumented)
+    return functools.wraps(target)(wrapper)
+
+
+def instrument_all() -> int:
+    """This is used to instrument the functions that haven't been called yet,
+    e.g. on startup. Return the number of functions it went through."""
+    count: int = 0
+    while _pending:
+        _pending.pop()()
+        count += 1
+    return count
+
+
+def typechecked(target: T_CallableOrType) -> T_CallableOrType:
+    """Instrument `target` with typeguard. It's a no-op when `TYPECHECK_ENABLED` is false."""
+    if not TYPECHECK_ENABLED:
+        return target
+    if inspect.isfunction(target):
+        return _lazily_typechecked(target)  # type: ignore[return-value]
+    return _typechecked(target)
@@ -0,0 +1,186 @@
+"""This module is used for warming up the app on startup, so the first requests
+after a deploy aren't slower than the next ones.
+
+    - pool: `WARMUP_POOL_CONNECTIONS` connections are opened (and returned to
+      the pool), i.e. the first requests don't pay for the connection setup.
+    - statements: the read queries of `crud` run once (with arguments that match
+      no rows, in a transaction that's rolled back). Their compiled forms are then
+      in the statement cache of the engine.
+    - schemas: the pydantic models of the schemas are (re)built if needed and the
+      OpenAPI schema is generated (and cached by FastAPI).
+    - typecheck: the functions decorated with `@typechecked` are instrumented.
+
+The warmup runs in the background: the app serves the requests meanwhile but
+`/health` only reports ready (200) when it's done. A failed step is logged and
+skipped, i.e. the app still becomes ready.
+
+NB: The write statements (INSERT) aren't warmed up: running them would write
+rows (or, on Postgres, use sequence values even if it's rolled back).
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+import inspect
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from e_commerce_app import models
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils import crud
+from e_commerce_app.utils.typecheck import instrument_all, typechecked
+from e_commerce_app.v1.schemas import db_schema, input_schema, output_schema, token_schema
+
+SCHEMA_MODULES: tuple[Any, ...] = (db_schema, input_schema, output_schema, token_schema)
+# No row has this id, name, ...
+NO_MATCH_ID: int = 0
+NO_MATCH_TEXT: str = ""
+
+
+class WarmupStatus:
+    """The state of the warmup. `ready` is False until it's done (or skipped)."""
+
+    def __init__(self) -> None:
+        self.ready: bool = False
+        self.started_at: Optional[datetime] = None
+        self.duration: Optional[float] = None
+        self.steps: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the state as a dict."""
+        return {
+            "ready": self.ready,
+            "started_at": self.started_at,
+            "duration_seconds": None if self.duration is None else round(self.duration, 6),
+            "steps_seconds": {step: round(seconds, 6) for step, seconds in self.steps.items()},
+            "errors": dict(self.errors),
+        }
+
+
+warmup_status = WarmupStatus()
+
+
+@typechecked
+def warm_statements(db: Session) -> int:
+    """This runs the read queries of `crud` once. Return the number of queries."""
+    queries: list[tuple[Any, dict[str, Any]]] = [
+        (crud.get_customer, {"id": NO_MATCH_ID}),
+        (crud.get_customer_by_email, {"email": NO_MATCH_TEXT}),
+        (crud.get_customer_by_username, {"username": NO_MATCH_TEXT}),
+        (crud.get_customers, {"limit": 1}),
+        (crud.get_customers, {"after_id": NO_MATCH_ID, "limit": 1}),
+        (crud.get_products_by_name, {"name": NO_MATCH_TEXT}),
+        (crud.get_products_by_id, {"id": NO_MATCH_ID}),
+        (crud.get_products, {"limit": 1}),
+        (crud.get_products, {"after_id": NO_MATCH_ID, "limit": 1}),
+        (crud.get_orders, {"limit": 1}),
+        (crud.get_orders, {"after_id": NO_MATCH_ID, "limit": 1}),
+        (crud.get_orders_by_id_n_status, {"customer_id": NO_MATCH_ID, "status": "pending"}),
+    ]
+    # On the other backends, the search loads all the products in memory.
+    if db.get_bind().dialect.name == "postgresql":
+        queries.append(
+            (crud.search_products, {"q": "warmup", "tags": ["warmup"], "limit": 1}),
+        )
+
+    try:
+        for func, kwargs in queries:
+            func(db=db, **kwargs)
+    finally:
+        db.rollback()
+    return len(queries)
+
+
+@typechecked
+def warm_schemas(app: FastAPI) -> int:
+    """This builds the pydantic models that aren't complete (e.g. forward
+    references) and the OpenAPI schema. Return the number of models."""
+    schemas: set[type[BaseModel]] = {
+        obj
+        for module in SCHEMA_MODULES
+        for _, obj in inspect.getmembers(module, inspect.isclass)
+        if issubclass(obj, BaseModel) and obj.__module__ == module.__name__
+    }
+    for schema in schemas:
+        if not schema.__pydantic_complete__:
+            schema.model_rebuild()
+    app.openapi()
+    return len(schemas)
+
+
+def _warm_sync_pool(n_connections: int) -> None:
+    connections: list[Any] = [models.engine.connect() for _ in range(n_connections)]
+    for connection in connections:
+        connection.close()
+
+
+async def warm_pools(n_connections: int) -> None:
+    """This opens `n_connections` connections in the pool(s) of the engine(s).
+    They're opened concurrently and returned to the pool."""
+    n_connections = min(n_connections, get_settings().database.DB_POOL_SIZE)
+    if n_connections <= 0:
+        return
+    if models.async_engine is not None:
+        async_engine: Any = models.async_engine
+
+        async def connect() -> Any:
+            return await async_engine.connect()
+
+        connections: list[Any] = await asyncio.gather(*(connect() for _ in range(n_connections)))
+        await asyncio.gather(*(connection.close() for connection in connections))
+    else:
+        await run_in_threadpool(_warm_sync_pool, n_connections)
+
+
+async def _warm_statements() -> int:
+    if models.AsyncSessionLocal is not None:
+        async with models.AsyncSessionLocal() as db:
+            return await db.run_sync(lambda session: warm_statements(db=session))
+
+    def run() -> int:
+        with models.SessionLocal() as db:
+            return warm_statements(db=db)
+
+    return await run_in_threadpool(run)
+
+
+async def run_warmup(app: FastAPI) -> None:
+    """This runs the warmup steps and flips `warmup_status.ready`."""
+    warmup_status.started_at = datetime.now(timezone.utc)
+    start: float = time.perf_counter()
+    steps: dict[str, Any] = {
+        "pool": lambda: warm_pools(n_connections=get_settings().warmup.WARMUP_POOL_CONNECTIONS),
+        "statements": _warm_statements,
+        "schemas": lambda: run_in_threadpool(warm_schemas, app=app),
+        "typecheck": lambda: run_in_threadpool(instrument_all),
+    }
+    for name, step in steps.items():
+        step_start: float = time.perf_counter()
+        try:
+            await step()
+        except Exception as err:
+            warmup_status.errors[name] = str(err)
+            logger.warning(f"Warmup step {name!r} failed: {err}")
+        warmup_status.steps[name] = time.perf_counter() - step_start
+
+    warmup_status.duration = time.perf_counter() - start
+    warmup_status.ready = True
+    logger.info(f"Warmup done in {warmup_status.duration:.3f}s")
+
+
+@typechecked
+def start_warmup(app: FastAPI) -> Optional[asyncio.Task[None]]:
+    """This starts the warmup in the background. If it's disabled, the app is
+    ready right away. Return the task (or None)."""
+    if not get_settings().warmup.WARMUP_ENABLED:
+        warmup_status.ready = True
+        return None
+    return asyncio.ensure_future(run_warmup(app=app))
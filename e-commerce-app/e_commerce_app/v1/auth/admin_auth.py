@@ -0,0 +1,35 @@
+"""This module is used for authenticating the admin endpoints.
+
+The requests must send the `X-Admin-Token` header with the value of the
+`ADMIN_TOKEN` environment variable. If it's not set, the admin endpoints are
+disabled (404).
+
+Author: Chinedu Ezeofor
+"""
+
+import secrets
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+from e_commerce_app.utils import credentials
+from e_commerce_app.utils.typecheck import typechecked
+
+
+@typechecked
+def is_admin_token(token: Optional[str]) -> bool:
+    """Return True if the token is the admin token. It's always False if `ADMIN_TOKEN` isn't set."""
+    if credentials.ADMIN_TOKEN is None or token is None:
+        return False
+    return secrets.compare_digest(token, credentials.ADMIN_TOKEN)
+
+
+@typechecked
+def verify_admin_token(
+    x_admin_token: Optional[str] = Header(default=None, include_in_schema=False),
+) -> None:
+    """This is used as a dependency to protect the admin endpoints."""
+    if credentials.ADMIN_TOKEN is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not is_admin_token(token=x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
@@ -8,18 +8,13 @@ from typing import Annotated, Any, Optional, Union
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-from typeguard import typechecked
-
-from e_commerce_app.models import get_db
-from e_commerce_app.utils.credentials import (
-    ACCESS_TOKEN_EXPIRE_MINUTES,
-    ALGORITHM,
-    SECRET_KEY,
-)
-from e_commerce_app.utils.crud import authenticate_user, get_customer_by_username
-from e_commerce_app.v1.schemas import token_schema
+
+from e_commerce_app.models import AnySession, get_session
+from e_commerce_app.utils import async_crud, credentials
+from e_commerce_app.utils.auth_cache import token_cache, user_cache
+from e_commerce_app.utils.hashing import hasher
+from e_commerce_app.utils.typecheck import typechecked
+from e_commerce_app.v1.schemas import output_schema, token_schema
 
 auth_router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -27,20 +22,24 @@ auth_router = APIRouter(prefix="/auth", tags=["auth"])
 # It sends the request to the tokenUrl endpoint
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AnySession, Depends(get_session)]
 token_dependency = Annotated[str, Depends(oauth2_scheme)]
 
 
 @typechecked
 def create_access_token(username: str, user_id: int, expires_delta: timedelta) -> str:
     """This generates a string as an access token."""
+    # Imported here: jose loads the cryptography backends, which slows down the start.
+    from jose import jwt
 
     to_encode: dict[str, Any] = {"sub": username, "id": user_id}
     expire: datetime = datetime.now(timezone.utc) + expires_delta
 
     # Update the data with the expiration timedelta
     to_encode.update({"exp": expire})
-    encoded_jwt: str = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt: str = jwt.encode(
+        to_encode, credentials.SECRET_KEY, algorithm=credentials.ALGORITHM
+    )
 
     return encoded_jwt
 
@@ -49,18 +48,22 @@ def create_access_token(username: str, user_id: int, expires_delta: timedelta) -
 @auth_router.post("/token")
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db),
+    db: db_dependency,
 ) -> token_schema.Token:
-    user: Optional[dict[str, Any]] = authenticate_user(
-        username=form_data.username, password=form_data.password, db=db
+    user: Optional[Any] = await async_crud.get_customer_by_username(
+        db=db, username=form_data.username
+    )
+    # bcrypt runs on the hashing executor, not on the event loop.
+    is_valid: bool = user is not None and await hasher.verify_password(
+        plain_password=form_data.password, hashed_password=user.hashed_password
     )
-    if not user:
+    if not is_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires: timedelta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token_expires: timedelta = timedelta(minutes=credentials.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         username=user.username,  # type: ignore
         user_id=user.id,  # type: ignore
@@ -82,22 +85,41 @@ async def get_current_user(db: db_dependency, token: token_dependency) -> Union[
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload: dict[str, Any] = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: Optional[int] = payload.get("id")
-        username: Optional[str] = payload.get("sub")
+    # Verified tokens are cached until they expire (at most `AUTH_CACHE_TTL` seconds).
+    token_data: Optional[token_schema.TokenData] = token_cache.get(token)
+    if token_data is None:
+        from jose import JWTError, jwt
 
-        if user_id is None or username is None:
-            raise credentials_exception
+        try:
+            payload: dict[str, Any] = jwt.decode(
+                token, credentials.SECRET_KEY, algorithms=[credentials.ALGORITHM]
+            )
+            user_id: Optional[int] = payload.get("id")
+            username: Optional[str] = payload.get("sub")
+
+            if user_id is None or username is None:
+                raise credentials_exception
 
-        token_data = token_schema.TokenData(user_id=user_id, username=username)
+            token_data = token_schema.TokenData(user_id=user_id, username=username)
 
-    except JWTError:
-        raise credentials_exception
+        except JWTError:
+            raise credentials_exception
 
-    user = get_customer_by_username(db=db, username=token_data.username)  # type: ignore
+        # A token without `exp` never expires: it's cached for `AUTH_CACHE_TTL`.
+        exp: Optional[float] = payload.get("exp")
+        expires_in: float = (
+            token_cache.ttl if exp is None else exp - datetime.now(timezone.utc).timestamp()
+        )
+        token_cache.set(token, token_data, ttl=min(token_cache.ttl, expires_in))
 
+    user: Any = user_cache.get(token_data.username)
     if user is None:
-        raise credentials_exception
+        db_user = await async_crud.get_customer_by_username(db=db, username=token_data.username)
+
+        if db_user is None:
+            raise credentials_exception
+
+        user = output_schema.CustomersOutputSchema.model_validate(db_user, from_attributes=True)
+        user_cache.set(token_data.username, user)
 
     return user
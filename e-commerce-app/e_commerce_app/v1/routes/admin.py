@@ -0,0 +1,67 @@
+"""This module contains the admin (diagnostics) endpoints of the API.
+They're protected by the `X-Admin-Token` header. See `v1/auth/admin_auth.py`.
+
+Author: Chinedu Ezeofor
+"""
+
+from typing import Any, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils.profiling import profile_store
+from e_commerce_app.utils.slow_query import slow_query_log
+from e_commerce_app.utils.typecheck import typechecked
+from e_commerce_app.v1.auth.admin_auth import verify_admin_token
+from e_commerce_app.v1.schemas.output_schema import ProfileSummarySchema, SlowQueriesOutputSchema
+
+admin_router = APIRouter(
+    prefix="/admin", tags=["admin"], dependencies=[Depends(verify_admin_token)]
+)
+
+
+@typechecked
+@admin_router.get(path="/slow-queries")
+async def get_slow_queries() -> SlowQueriesOutputSchema:
+    """This is used to dump the recorded slow queries, the slowest first.
+    The plans are only captured with `SLOW_QUERY_EXPLAIN=true`."""
+
+    return {
+        "enabled": get_settings().slow_query.SLOW_QUERY_ENABLED,
+        "threshold_seconds": slow_query_log.threshold,
+        "total": slow_query_log.total,
+        "data": slow_query_log.entries(),
+    }
+
+
+@typechecked
+@admin_router.delete(path="/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries() -> None:
+    """This is used to empty the slow query buffer and the captured plans."""
+
+    slow_query_log.clear()
+
+
+@typechecked
+@admin_router.get(path="/profiles")
+async def get_profiles() -> list[ProfileSummarySchema]:
+    """This is used to list the stored request profiles and their time split, the newest first.
+    A request is profiled when it's sent with `X-Profile: 1` (`PROFILING_ENABLED=true`)."""
+
+    return profile_store.summaries()
+
+
+@typechecked
+@admin_router.get(path="/profiles/{profile_id}")
+async def get_profile(profile_id: str) -> Response:
+    """This is used to download a profile. Open it with https://www.speedscope.app."""
+
+    profile: Optional[dict[str, Any]] = profile_store.get(profile_id=profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="profile not found")
+    return Response(
+        content=profile["speedscope"],
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'},
+    )
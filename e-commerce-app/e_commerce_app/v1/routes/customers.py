@@ -6,52 +6,58 @@ Author: Chinedu Ezeofor
 from typing import Annotated, Any, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typeguard import typechecked
+from fastapi.responses import StreamingResponse
 
-from e_commerce_app.models import get_db
-from e_commerce_app.utils import crud
+from e_commerce_app import models
+from e_commerce_app.models import AnySession, get_session
+from e_commerce_app.utils import async_crud
+from e_commerce_app.utils.export import ExportFormat, export_response
+from e_commerce_app.utils.hashing import bulk_hasher
+from e_commerce_app.utils.pagination import (
+    DEFAULT_PAGE_SIZE,
+    after_id_dependency,
+    limit_query,
+    paginate,
+)
+from e_commerce_app.utils.typecheck import typechecked
 from e_commerce_app.v1.auth.jwt_auth import get_current_user
-from e_commerce_app.v1.schemas import input_schema, output_schema
+from e_commerce_app.v1.schemas import db_schema, input_schema, output_schema
 
 customer_router = APIRouter()
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AnySession, Depends(get_session)]
 current_user_dependency = Annotated[output_schema.CustomersOutputSchema, Depends(get_current_user)]
 
 
 @typechecked
 @customer_router.post(path="/customers/", tags=["customers"])
-def create_customer(
+async def create_customer(
     data: input_schema.CustomersInputSchema, db: db_dependency
-) -> output_schema.CustomersOutputSchema:
-    """This is used to create a new user."""
-    _data = data.data[0]
-    _email: Optional[dict[str, Any]] = crud.get_customer_by_email(db=db, email=_data.email)
-    _username: Optional[dict[str, Any]] = crud.get_customer_by_username(
-        db=db, username=_data.username
+) -> output_schema.CustomersBulkOutputSchema:
+    """This is used to create new users. All the users are inserted in one transaction
+    and the rows that could not be inserted are returned in `errors`."""
+    # bcrypt runs on the signup executor, not on the event loop (nor on the logins' workers).
+    hashed: list[str] = await bulk_hasher.hash_passwords([row.hashed_password for row in data.data])
+    rows: list[Any] = [
+        row.model_copy(update={"hashed_password": hashed_password})
+        for row, hashed_password in zip(data.data, hashed)
+    ]
+    result: dict[str, Any] = await async_crud.create_customers(
+        db=db, data=rows, hash_passwords=False
     )
 
-    if _email:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
-        )
-    elif _username:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered",
-        )
-    result: output_schema.CustomersOutputSchema = crud.create_customer(db=db, data=_data)
+    if not result["data"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result["errors"])
     return result
 
 
 @typechecked
 @customer_router.get(path="/customer/{id}", tags=["customers"])
-def get_customer(
+async def get_customer(
     id: int, db: db_dependency, current_user: current_user_dependency
 ) -> output_schema.CustomersOutputSchema:
     """This is used to retrieve a registered user."""
-    result: output_schema.CustomersOutputSchema = crud.get_customer(db=db, id=id)
+    result: output_schema.CustomersOutputSchema = await async_crud.get_customer(db=db, id=id)
     if result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     return result
@@ -59,11 +65,33 @@ def get_customer(
 
 @typechecked
 @customer_router.get(path="/customers/", tags=["customers"])
-def get_customers(
-    db: db_dependency, current_user: current_user_dependency
-) -> list[output_schema.CustomersOutputSchema]:
-    """This is used to retrieve all registered users."""
-    result: output_schema.CustomersOutputSchema = crud.get_customers(db=db)
+async def get_customers(
+    db: db_dependency,
+    current_user: current_user_dependency,
+    after_id: after_id_dependency,
+    limit: limit_query = DEFAULT_PAGE_SIZE,
+) -> output_schema.CustomersPageOutputSchema:
+    """This is used to retrieve the registered users one page at a time.
+
+    Usage: GET /customers/?limit=100&cursor=<next_cursor of the previous page>
+    """
+    result: Optional[list[Any]] = await async_crud.get_customers(
+        db=db, after_id=after_id, limit=limit + 1
+    )
     if result is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User not found")
-    return result
+    return paginate(rows=result, limit=limit)
+
+
+@typechecked
+@customer_router.get(path="/customers/export", tags=["customers"])
+async def export_customers(
+    current_user: current_user_dependency, format: ExportFormat = "ndjson"
+) -> StreamingResponse:
+    """This is used to download all the registered users as NDJSON or CSV.
+    The rows are streamed, so the first byte is sent right away.
+
+    Usage: GET /customers/export?format=csv
+    """
+    columns: list[str] = ["id", *db_schema.CustomersSchema.model_fields]
+    return export_response(model=models.Customers, columns=columns, fmt=format)
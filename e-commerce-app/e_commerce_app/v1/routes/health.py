@@ -5,12 +5,30 @@ Author: Chinedu Ezeofor
 
 from typing import Any
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response, status
 from fastapi.responses import HTMLResponse
-from typeguard import typechecked
 
-from e_commerce_app.config import settings
-from e_commerce_app.v1.schemas.output_schema import HealthCheckSchema
+from e_commerce_app.config import get_settings
+from e_commerce_app.models import pool_status
+from e_commerce_app.utils.auth_cache import auth_cache_stats
+from e_commerce_app.utils.idempotency import idempotency_stats
+from e_commerce_app.utils.json_logging import logging_stats
+from e_commerce_app.utils.order_queue import order_queue_stats
+from e_commerce_app.utils.product_cache import product_cache_stats
+from e_commerce_app.utils.replicas import replica_stats
+from e_commerce_app.utils.typecheck import typechecked
+from e_commerce_app.utils.warmup import warmup_status
+from e_commerce_app.v1.schemas.output_schema import (
+    AuthCacheStatsSchema,
+    HealthCheckSchema,
+    IdempotencyStatsSchema,
+    LoggingStatsSchema,
+    OrderQueueStatsSchema,
+    PoolStatsSchema,
+    ProductCacheStatsSchema,
+    ReplicaStatsSchema,
+    WarmupStatusSchema,
+)
 
 root_router = APIRouter()
 
@@ -32,17 +50,97 @@ body_template: str = """
 async def index() -> Any:
     """This is the homepage."""
 
+    settings = get_settings()
     body: str = body_template.format(settings.PROJECT_NAME, settings.API_VERSION_STR)  # type: ignore
     return HTMLResponse(content=body)
 
 
 @typechecked
 @root_router.get(f"/health")
-async def health() -> HealthCheckSchema:
-    """This is used for health check."""
+async def health(response: Response) -> HealthCheckSchema:
+    """This is used for health check. It returns 503 until the warmup is done."""
+
+    if not warmup_status.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {
+            "message": f"{get_settings().PROJECT_NAME} app is warming up!",  # type: ignore
+            "version": get_settings().API_FLOAT_VERSION,  # type: ignore
+            "status": "warming up",
+            "ready": False,
+        }
 
     return {
-        "message": f"{settings.PROJECT_NAME} app is working properly!",  # type: ignore
-        "version": settings.API_FLOAT_VERSION,  # type: ignore
+        "message": f"{get_settings().PROJECT_NAME} app is working properly!",  # type: ignore
+        "version": get_settings().API_FLOAT_VERSION,  # type: ignore
         "status": "success",
+        "ready": True,
     }
+
+
+@typechecked
+@root_router.get("/health/pool")
+async def pool_health() -> PoolStatsSchema:
+    """This is used to inspect the database connection pool.
+    It's useful for sizing `DB_POOL_SIZE` and `DB_MAX_OVERFLOW`."""
+
+    return pool_status()
+
+
+@typechecked
+@root_router.get("/health/replicas")
+async def replicas_health() -> list[ReplicaStatsSchema]:
+    """This is used to inspect the read replicas: their health (ejected or not)
+    and the number of reads and failures."""
+
+    return replica_stats()
+
+
+@typechecked
+@root_router.get("/health/order-queue")
+async def order_queue_health() -> OrderQueueStatsSchema:
+    """This is used to inspect the order queue: the number of batches, their
+    average size and the time it takes to write them."""
+
+    return order_queue_stats()
+
+
+@typechecked
+@root_router.get("/health/warmup")
+async def warmup_health() -> WarmupStatusSchema:
+    """This is used to inspect the warmup: the time of each step and the errors."""
+
+    return warmup_status.to_dict()
+
+
+@typechecked
+@root_router.get("/health/auth-cache")
+async def auth_cache_health() -> AuthCacheStatsSchema:
+    """This is used to inspect the hit/miss counters of the authentication caches."""
+
+    return auth_cache_stats()
+
+
+@typechecked
+@root_router.get("/health/product-cache")
+async def product_cache_health() -> ProductCacheStatsSchema:
+    """This is used to inspect the hit ratio and the evictions of the product cache."""
+
+    return product_cache_stats()
+
+
+@typechecked
+@root_router.get("/health/idempotency")
+async def idempotency_health() -> IdempotencyStatsSchema:
+    """This is used to inspect the idempotency keys: the replayed responses, the
+    duplicates that waited for the first request and the conflicts."""
+
+    return idempotency_stats()
+
+
+@typechecked
+@root_router.get("/health/logging")
+async def logging_health() -> LoggingStatsSchema:
+    """This is used to inspect the log queue (json mode): the records waiting to
+    be written and the ones dropped because it was full."""
+
+    return logging_stats()
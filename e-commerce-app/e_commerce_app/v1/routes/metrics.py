@@ -0,0 +1,20 @@
+"""This module contains the Prometheus metrics endpoint of the API.
+
+Author: Chinedu Ezeofor
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from e_commerce_app.utils.metrics import CONTENT_TYPE, render_metrics
+from e_commerce_app.utils.typecheck import typechecked
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@typechecked
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """This is used by Prometheus to scrape the metrics of the API."""
+
+    return PlainTextResponse(content=render_metrics(), media_type=CONTENT_TYPE)
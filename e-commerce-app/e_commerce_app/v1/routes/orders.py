@@ -3,47 +3,61 @@
 Author: Chinedu Ezeofor
 """
 
-from typing import Annotated
+from typing import Annotated, Any, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typeguard import typechecked
+from fastapi.responses import StreamingResponse
 
-from e_commerce_app.models import get_db
-from e_commerce_app.utils import crud
+from e_commerce_app import models
+from e_commerce_app.models import AnySession, get_session
+from e_commerce_app.utils import async_crud
+from e_commerce_app.utils.export import ExportFormat, export_response
+from e_commerce_app.utils.order_queue import order_queue
+from e_commerce_app.utils.pagination import (
+    DEFAULT_PAGE_SIZE,
+    after_id_dependency,
+    limit_query,
+    paginate,
+)
+from e_commerce_app.utils.typecheck import typechecked
 from e_commerce_app.v1.auth.jwt_auth import get_current_user
-from e_commerce_app.v1.schemas import input_schema, output_schema
+from e_commerce_app.v1.schemas import db_schema, input_schema, output_schema
 from e_commerce_app.v1.schemas.db_schema import Status
 
 orders_router = APIRouter(tags=["orders"])
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AnySession, Depends(get_session)]
 current_user_dependency = Annotated[output_schema.OrdersOutputSchema, Depends(get_current_user)]
 
 
 @typechecked
 @orders_router.post(path="/orders/")
-def create_order(
+async def create_order(
     data: input_schema.OrdersInputSchema,
     db: db_dependency,
     current_user: current_user_dependency,
-) -> output_schema.OrdersOutputSchema:
-    """This is used to create a new order."""
-    _data = data.data[0]
-    result: output_schema.OrdersOutputSchema = crud.create_order(db=db, data=_data)
+) -> output_schema.OrdersBulkOutputSchema:
+    """This is used to create new orders. All the orders are inserted in one transaction
+    and the rows that could not be inserted are returned in `errors`.
 
-    if result is None:
-        raise HTTPException(
-            status_code=404,
-            detail=f"customer_id={_data.customer_id} is not present in table!",
-        )
+    With `ORDER_QUEUE_ENABLED=true`, the orders are written in batches with the
+    orders of the other requests (see `utils/order_queue.py`)."""
+    result: dict[str, Any]
+    if order_queue.running:
+        # The flusher needs a connection: the request doesn't keep its own while it waits.
+        await async_crud.close_session(db=db)
+        result = await order_queue.submit(data=data.data)
+    else:
+        result = await async_crud.create_orders(db=db, data=data.data)
 
+    if not result["data"]:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result["errors"])
     return result
 
 
 @typechecked
 @orders_router.get(path="/order/{customer_id}")
-def get_order(
+async def get_order(
     customer_id: int,
     order_status: Status,
     db: db_dependency,
@@ -53,7 +67,7 @@ def get_order(
 
     Usage: GET /order/customer_id?status=pending
     """
-    result: output_schema.OrdersOutputSchema = crud.get_orders_by_id_n_status(
+    result: output_schema.OrdersOutputSchema = await async_crud.get_orders_by_id_n_status(
         db=db, customer_id=customer_id, status=order_status
     )
     if result is None:
@@ -63,12 +77,33 @@ def get_order(
 
 @typechecked
 @orders_router.get(path="/orders/")
-def get_orders(
+async def get_orders(
     db: db_dependency,
     current_user: current_user_dependency,
-) -> list[output_schema.OrdersOutputSchema]:
-    """This is used to retrieve all available orders."""
-    result: output_schema.OrdersOutputSchema = crud.get_orders(db=db)
+    after_id: after_id_dependency,
+    limit: limit_query = DEFAULT_PAGE_SIZE,
+) -> output_schema.OrdersPageOutputSchema:
+    """This is used to retrieve the available orders one page at a time.
+
+    Usage: GET /orders/?limit=100&cursor=<next_cursor of the previous page>
+    """
+    result: Optional[list[Any]] = await async_crud.get_orders(
+        db=db, after_id=after_id, limit=limit + 1
+    )
     if result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="order not found")
-    return result
+    return paginate(rows=result, limit=limit)
+
+
+@typechecked
+@orders_router.get(path="/orders/export")
+async def export_orders(
+    current_user: current_user_dependency, format: ExportFormat = "ndjson"
+) -> StreamingResponse:
+    """This is used to download all the available orders as NDJSON or CSV.
+    The rows are streamed, so the first byte is sent right away.
+
+    Usage: GET /orders/export?format=csv
+    """
+    columns: list[str] = ["id", *db_schema.OrdersSchema.model_fields]
+    return export_response(model=models.Orders, columns=columns, fmt=format)
@@ -1,43 +1,75 @@
-from typing import Annotated
+from typing import Annotated, Any, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typeguard import typechecked
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 
-from e_commerce_app.models import get_db
-from e_commerce_app.utils import crud
+from e_commerce_app import models
+from e_commerce_app.models import AnySession, get_session
+from e_commerce_app.utils import async_crud
+from e_commerce_app.utils.export import ExportFormat, export_response
+from e_commerce_app.utils.pagination import (
+    DEFAULT_PAGE_SIZE,
+    after_id_dependency,
+    limit_query,
+    offset_query,
+    paginate,
+    paginate_offset,
+)
+from e_commerce_app.utils.product_cache import invalidate_products, product_cache
+from e_commerce_app.utils.search import parse_tags
+from e_commerce_app.utils.typecheck import typechecked
 from e_commerce_app.v1.auth.jwt_auth import get_current_user
-from e_commerce_app.v1.schemas import input_schema, output_schema
+from e_commerce_app.v1.schemas import db_schema, input_schema, output_schema
 
 products_router = APIRouter(tags=["products"])
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AnySession, Depends(get_session)]
 current_user_dependency = Annotated[output_schema.ProductsOutputSchema, Depends(get_current_user)]
 
 
+def _dump(row: Any) -> dict[str, Any]:
+    """This converts a product to a JSON-serializable dict that can be cached."""
+    return output_schema.ProductsOutputSchema.model_validate(row, from_attributes=True).model_dump(
+        mode="json"
+    )
+
+
 @typechecked
 @products_router.post(path="/products/")
-def create_product(
+async def create_product(
     data: input_schema.ProductsInputSchema,
     db: db_dependency,
     current_user: current_user_dependency,
-) -> output_schema.ProductsOutputSchema:
-    """This is used to create a new product."""
-    _data = data.data[0]
-    result: output_schema.ProductsOutputSchema = crud.create_product(db=db, data=_data)
+) -> output_schema.ProductsBulkOutputSchema:
+    """This is used to create new products. All the products are inserted in one
+    transaction and the rows that could not be inserted are returned in `errors`."""
+    result: dict[str, Any] = await async_crud.create_products(db=db, data=data.data)
+
+    if result["data"]:
+        # After the commit, outside of the transaction.
+        await invalidate_products()
+    if not result["data"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=result["errors"])
     return result
 
 
 @typechecked
 @products_router.get(path="/product/{name}")
-def get_product(
+async def get_product(
     name: str,
     db: db_dependency,
     current_user: current_user_dependency,
 ) -> output_schema.ProductsOutputSchema:
-    """This is used to retrieve an available product."""
+    """This is used to retrieve an available product. It's served from the product cache."""
     name = name.strip().lower()
-    result: output_schema.ProductsOutputSchema = crud.get_products_by_name(db=db, name=name)
+
+    async def load() -> Optional[dict[str, Any]]:
+        row: Any = await async_crud.get_products_by_name(db=db, name=name)
+        return None if row is None else _dump(row)
+
+    result: Optional[dict[str, Any]] = await product_cache.get_or_load(
+        key=f"name:{name}", loader=load
+    )
     if result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="product not found")
     return result
@@ -45,12 +77,70 @@ def get_product(
 
 @typechecked
 @products_router.get(path="/products/")
-def get_products(
+async def get_products(
     db: db_dependency,
     current_user: current_user_dependency,
-) -> list[output_schema.ProductsOutputSchema]:
-    """This is used to retrieve all available products."""
-    result: output_schema.ProductsOutputSchema = crud.get_products(db=db)
+    after_id: after_id_dependency,
+    limit: limit_query = DEFAULT_PAGE_SIZE,
+) -> output_schema.ProductsPageOutputSchema:
+    """This is used to retrieve the available products one page at a time.
+    The pages are served from the product cache.
+
+    Usage: GET /products/?limit=100&cursor=<next_cursor of the previous page>
+    """
+
+    async def load() -> Optional[dict[str, Any]]:
+        rows: Optional[list[Any]] = await async_crud.get_products(
+            db=db, after_id=after_id, limit=limit + 1
+        )
+        if rows is None:
+            return None
+        page: dict[str, Any] = paginate(rows=rows, limit=limit)
+        return {**page, "data": [_dump(row) for row in page["data"]]}
+
+    result: Optional[dict[str, Any]] = await product_cache.get_or_load(
+        key=f"page:{after_id}:{limit}", loader=load
+    )
     if result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="product not found")
     return result
+
+
+@typechecked
+@products_router.get(path="/products/search")
+async def search_products(
+    db: db_dependency,
+    current_user: current_user_dependency,
+    q: Annotated[Optional[str], Query(max_length=255)] = None,
+    tags: Annotated[Optional[str], Query(max_length=255)] = None,
+    limit: limit_query = DEFAULT_PAGE_SIZE,
+    offset: offset_query = 0,
+) -> output_schema.ProductsSearchOutputSchema:
+    """This is used to search the products by name/description and tags.
+    The best matches are returned first.
+
+    Usage: GET /products/search?q=android tv -remote&tags=electronics,tv&limit=20&offset=0
+    """
+    tag_list: list[str] = parse_tags(tags=tags)
+    if not (q and q.strip()) and not tag_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Provide a search query or tags"
+        )
+    result: list[Any] = await async_crud.search_products(
+        db=db, q=q, tags=tag_list, limit=limit + 1, offset=offset
+    )
+    return paginate_offset(rows=result, limit=limit, offset=offset)
+
+
+@typechecked
+@products_router.get(path="/products/export")
+async def export_products(
+    current_user: current_user_dependency, format: ExportFormat = "ndjson"
+) -> StreamingResponse:
+    """This is used to download all the available products as NDJSON or CSV.
+    The rows are streamed, so the first byte is sent right away.
+
+    Usage: GET /products/export?format=csv
+    """
+    columns: list[str] = ["id", *db_schema.ProductsSchema.model_fields]
+    return export_response(model=models.Products, columns=columns, fmt=format)
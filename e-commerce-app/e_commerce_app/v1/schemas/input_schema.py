@@ -6,17 +6,21 @@ Author: Chinedu Ezeofor
 
 from typing import Any, Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from e_commerce_app.v1.schemas import db_schema
 
 Status = Literal["pending", "processing", "shipped", "delivered"]
 
+# Max. number of customers per request. Every password is hashed with bcrypt
+# (~250 ms), i.e. a larger batch would hold the hashing workers for minutes.
+MAX_CUSTOMERS_PER_REQUEST: int = 100
+
 
 class CustomersInputSchema(BaseModel):
     """Schema for customer input."""
 
-    data: list[db_schema.CustomersSchemaInDB]
+    data: list[db_schema.CustomersSchemaInDB] = Field(max_length=MAX_CUSTOMERS_PER_REQUEST)
 
     model_config: dict[str, Any] = {
         "json_schema_extra": {
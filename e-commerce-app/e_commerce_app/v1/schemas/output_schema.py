@@ -3,6 +3,7 @@
 Author: Chinedu Ezeofor
 """
 
+from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel, ConfigDict
@@ -26,9 +27,163 @@ class ProductsOutputSchema(ProductsSchema):
     id: Optional[int] = None
 
 
+class RowErrorSchema(BaseModel):
+    """A row of a bulk insert that could not be inserted."""
+
+    index: int
+    detail: str
+
+
+class CustomersBulkOutputSchema(BaseModel):
+    data: list[CustomersOutputSchema]
+    errors: list[RowErrorSchema] = []
+
+
+class OrdersBulkOutputSchema(BaseModel):
+    data: list[OrdersOutputSchema]
+    errors: list[RowErrorSchema] = []
+
+
+class ProductsBulkOutputSchema(BaseModel):
+    data: list[ProductsOutputSchema]
+    errors: list[RowErrorSchema] = []
+
+
+class CustomersPageOutputSchema(BaseModel):
+    data: list[CustomersOutputSchema]
+    next_cursor: Optional[str] = None
+
+
+class OrdersPageOutputSchema(BaseModel):
+    data: list[OrdersOutputSchema]
+    next_cursor: Optional[str] = None
+
+
+class ProductsPageOutputSchema(BaseModel):
+    data: list[ProductsOutputSchema]
+    next_cursor: Optional[str] = None
+
+
+class ProductsSearchOutputSchema(BaseModel):
+    data: list[ProductsOutputSchema]
+    next_offset: Optional[int] = None
+
+
 class HealthCheckSchema(BaseModel):
     model_config = ConfigDict(str_to_lower=True, str_strip_whitespace=True)
 
     message: str
     version: str
     status: str
+    ready: bool
+
+
+class WarmupStatusSchema(BaseModel):
+    ready: bool
+    started_at: Optional[datetime] = None
+    duration_seconds: Optional[float] = None
+    steps_seconds: dict[str, float]
+    errors: dict[str, str]
+
+
+class ReplicaStatsSchema(BaseModel):
+    url: str
+    healthy: bool
+    ejected_for_seconds: float
+    in_progress: int
+    reads: int
+    failures: int
+    last_error: Optional[str] = None
+
+
+class OrderQueueStatsSchema(BaseModel):
+    running: bool
+    queued: int
+    batches: int
+    orders: int
+    rejected: int
+    avg_batch_size: float
+    avg_flush_seconds: float
+
+
+class LoggingStatsSchema(BaseModel):
+    mode: str
+    queued: int
+    queue_size: int
+    dropped: int
+
+
+class PoolStatsSchema(BaseModel):
+    pool_size: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    total_wait_seconds: float
+    avg_wait_seconds: float
+    max_wait_seconds: float
+
+
+class CacheStatsSchema(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    expirations: int
+
+
+class AuthCacheStatsSchema(BaseModel):
+    tokens: CacheStatsSchema
+    users: CacheStatsSchema
+
+
+class SlowQuerySchema(BaseModel):
+    timestamp: datetime
+    duration_seconds: float
+    statement: str
+    parameters: str
+    plan: Optional[str] = None
+
+
+class SlowQueriesOutputSchema(BaseModel):
+    enabled: bool
+    threshold_seconds: float
+    total: int
+    data: list[SlowQuerySchema]
+
+
+class TimeSplitSchema(BaseModel):
+    bcrypt: float
+    database: float
+    serialization: float
+    validation: float
+    other: float
+
+
+class ProfileSummarySchema(BaseModel):
+    id: str
+    timestamp: datetime
+    method: str
+    path: str
+    status_code: int
+    duration_seconds: float
+    time_split_seconds: TimeSplitSchema
+
+
+class ProductCacheStatsSchema(CacheStatsSchema):
+    backend: str
+    loads: int
+    coalesced: int
+    invalidations: int
+
+
+class IdempotencyStatsSchema(CacheStatsSchema):
+    claims: int
+    replays: int
+    coalesced: int
+    conflicts: int
+    mismatches: int
+    in_progress: int
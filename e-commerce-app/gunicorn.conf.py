@@ -0,0 +1,49 @@
+"""This is the config of the production server: gunicorn with uvicorn workers.
+The values come from `Settings` (i.e. they can be overridden with environment
+variables, see `ServerSettings`).
+
+Usage:
+    gunicorn -c gunicorn.conf.py app:app
+
+NB: The app isn't preloaded: every worker imports the app and creates its own
+engines after the fork (see `lifespan`). `models` also replaces the pools of
+the engines inherited from a fork, so the connections are never shared.
+The Prometheus metrics are per worker too (see `utils/metrics.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+import os
+from typing import Any
+
+from e_commerce_app.config import get_settings
+
+
+def get_workers(workers: int) -> int:
+    """Return the number of workers. 0 means one per CPU core available to the
+    process (which can be less than `os.cpu_count()` in a container)."""
+    if workers > 0:
+        return workers
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+settings: Any = get_settings()
+
+bind: str = f"{settings.HOST}:{settings.PORT}"
+worker_class: str = "uvicorn.workers.UvicornWorker"
+workers: int = get_workers(settings.server.SERVER_WORKERS)
+backlog: int = settings.server.SERVER_BACKLOG
+keepalive: int = settings.server.SERVER_KEEPALIVE
+max_requests: int = settings.server.SERVER_MAX_REQUESTS
+max_requests_jitter: int = settings.server.SERVER_MAX_REQUESTS_JITTER
+timeout: int = settings.server.SERVER_TIMEOUT
+graceful_timeout: int = settings.server.SERVER_GRACEFUL_TIMEOUT
+preload_app: bool = False
+
+
+def on_starting(server: Any) -> None:
+    server.log.info(
+        f"Starting {workers} workers (max_requests={max_requests}, jitter={max_requests_jitter})"
+    )
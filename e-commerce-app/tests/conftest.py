@@ -0,0 +1,64 @@
+"""The fixtures of the tests. They run against an in-memory SQLite database.
+
+Author: Chinedu Ezeofor
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+
+ROOT: Path = Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Dummy credentials. The database is the one of the `engine` fixture.
+DUMMY_ENV: dict[str, str] = {
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_NAME": "test",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+}
+for key, value in DUMMY_ENV.items():
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture()
+def engine(monkeypatch: pytest.MonkeyPatch) -> Iterator[Any]:
+    """An empty in-memory SQLite database. The sessions of the app (e.g. the ones
+    of `async_crud.run_in_session`) are bound to it."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from e_commerce_app import models
+
+    engine: Any = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(models, "engine", engine, raising=False)
+    monkeypatch.setattr(
+        models,
+        "SessionLocal",
+        sessionmaker(bind=engine, autoflush=False, expire_on_commit=False),
+        raising=False,
+    )
+    monkeypatch.setattr(models, "async_engine", None, raising=False)
+    monkeypatch.setattr(models, "AsyncSessionLocal", None, raising=False)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def db(engine: Any) -> Iterator[Any]:
+    """A session of the test database."""
+    from sqlalchemy.orm import Session
+
+    with Session(bind=engine, autoflush=False, expire_on_commit=False) as session:
+        yield session
@@ -0,0 +1,69 @@
+"""The tests of the bulk import (`utils/bulk_import.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+from sqlalchemy import func, select
+
+from e_commerce_app import models
+from e_commerce_app.utils.bulk_import import BulkImporter, Checkpoint
+
+
+class ImportStopped(Exception):
+    pass
+
+
+@pytest.fixture()
+def source(tmp_path: Path) -> Path:
+    """Two chunks of two products. The second product is invalid (no price)."""
+    path: Path = tmp_path / "products.ndjson"
+    products: list[dict[str, Any]] = [
+        {"name": "pen", "description": "blue", "tags": "home", "price": 1.0},
+        {"name": "ink", "description": "black", "tags": "home"},
+        {"name": "cup", "description": "white", "tags": "home", "price": 2.0},
+        {"name": "mug", "description": "red", "tags": "home", "price": 3.0},
+    ]
+    path.write_text("".join(json.dumps(product) + "\n" for product in products))
+    return path
+
+
+def count_products(engine: Any) -> int:
+    with engine.connect() as conn:
+        return conn.scalar(select(func.count()).select_from(models.Products))
+
+
+def test_rejects_are_written_before_the_checkpoint(
+    engine: Any, source: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    messages: list[str] = []
+    importer = BulkImporter(engine=engine, table="products", chunk_size=2, echo=messages.append)
+    save: Any = Checkpoint.save
+
+    def stop_after_the_commit(
+        self: Checkpoint, rows: int, pending: Optional[dict[str, Any]] = None
+    ) -> None:
+        if rows:
+            raise ImportStopped
+        save(self, rows=rows, pending=pending)
+
+    monkeypatch.setattr(Checkpoint, "save", stop_after_the_commit)
+    with pytest.raises(ImportStopped):
+        importer.run(path=source)
+
+    # The first chunk is committed and its reject is on disk.
+    rejects_path: Path = source.with_name(source.name + ".rejects.ndjson")
+    assert [json.loads(line)["row"] for line in rejects_path.read_text().splitlines()] == [2]
+    assert count_products(engine) == 1
+
+    monkeypatch.setattr(Checkpoint, "save", save)
+    stats: dict[str, Any] = importer.run(path=source)
+
+    # SQLite can't tell if the chunk was committed: it's imported again (with a warning).
+    assert any(message.startswith("Warning: on sqlite") for message in messages)
+    assert stats["read"] == 4
+    assert count_products(engine) == 4
@@ -0,0 +1,85 @@
+"""The tests of the bulk inserts of `utils/crud.py`.
+
+Author: Chinedu Ezeofor
+"""
+
+from typing import Any
+
+from e_commerce_app.utils import crud
+from e_commerce_app.v1.schemas import db_schema
+
+
+def make_customer(name: str, **kwargs: Any) -> db_schema.CustomersSchemaInDB:
+    values: dict[str, Any] = {
+        "name": name,
+        "username": name,
+        "email": f"{name}@example.com",
+        "hashed_password": "hashed",
+        "shipping_address": "1 main street",
+        **kwargs,
+    }
+    return db_schema.CustomersSchemaInDB(**values)
+
+
+def make_invalid_customer(name: str) -> db_schema.CustomersSchemaInDB:
+    """A customer that passes the schema but fails a constraint (NOT NULL)."""
+    return db_schema.CustomersSchemaInDB.model_construct(
+        **{**make_customer(name).model_dump(), "shipping_address": None}
+    )
+
+
+def create_customers(db: Any, data: list[db_schema.CustomersSchemaInDB]) -> dict[str, Any]:
+    return crud.create_customers(db=db, data=data, hash_passwords=False)
+
+
+def test_create_customers(db: Any) -> None:
+    result: dict[str, Any] = create_customers(db, [make_customer("ann"), make_customer("bob")])
+
+    assert [customer.username for customer in result["data"]] == ["ann", "bob"]
+    assert result["errors"] == []
+
+
+def test_registered_customers_are_reported(db: Any) -> None:
+    create_customers(db, [make_customer("ann"), make_customer("bob")])
+    result: dict[str, Any] = create_customers(
+        db,
+        [
+            make_customer("cid"),
+            make_customer("ann2", email="ann@example.com"),
+            make_customer("bob", email="bob2@example.com"),
+        ],
+    )
+
+    assert [customer.username for customer in result["data"]] == ["cid"]
+    assert result["errors"] == [
+        {"index": 1, "detail": "Email already registered"},
+        {"index": 2, "detail": "Username already registered"},
+    ]
+
+
+def test_invalid_and_registered_customers_are_reported(db: Any) -> None:
+    create_customers(db, [make_customer("ann")])
+    result: dict[str, Any] = create_customers(
+        db,
+        [
+            make_customer("bob"),
+            make_invalid_customer("cid"),
+            make_customer("ann2", email="ann@example.com"),
+            make_customer("dan"),
+        ],
+    )
+
+    # The invalid row doesn't hide the conflict (and vice versa).
+    assert [customer.username for customer in result["data"]] == ["bob", "dan"]
+    assert [err["index"] for err in result["errors"]] == [1, 2]
+    assert "NOT NULL" in result["errors"][0]["detail"]
+    assert result["errors"][1] == {"index": 2, "detail": "Email already registered"}
+
+
+def test_duplicates_in_the_request_are_reported(db: Any) -> None:
+    result: dict[str, Any] = create_customers(
+        db, [make_customer("ann"), make_customer("ann", email="ann2@example.com")]
+    )
+
+    assert [customer.username for customer in result["data"]] == ["ann"]
+    assert result["errors"] == [{"index": 1, "detail": "Duplicate email or username in request"}]
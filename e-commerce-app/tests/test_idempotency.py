@@ -0,0 +1,150 @@
+"""The tests of the `Idempotency-Key` support (`utils/idempotency.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+from typing import Any, Optional
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+
+from e_commerce_app import models
+from e_commerce_app.utils.idempotency import IdempotencyMiddleware, IdempotencyStore
+
+PATH: str = "/items/"
+
+
+@pytest.fixture()
+def calls() -> list[dict[str, Any]]:
+    """The bodies of the requests that reached the endpoint."""
+    return []
+
+
+@pytest.fixture()
+def middleware(engine: Any, calls: list[dict[str, Any]]) -> IdempotencyMiddleware:
+    """An app whose `POST /items/` returns a 500 when the body has `"fail": true`,
+    behind the middleware (with a store of its own)."""
+    app = FastAPI()
+
+    @app.post(PATH)
+    async def create_item(item: dict[str, Any]) -> JSONResponse:
+        calls.append(item)
+        if item.get("fail"):
+            return JSONResponse(status_code=500, content={"detail": "failed"})
+        return JSONResponse(status_code=201, content={"id": len(calls), **item})
+
+    middleware = IdempotencyMiddleware(app=app, paths=[PATH])
+    middleware.store = IdempotencyStore(ttl=60.0, cache_size=100, lock_timeout=60.0)
+    return middleware
+
+
+@pytest.fixture()
+def client(middleware: IdempotencyMiddleware) -> TestClient:
+    return TestClient(middleware)
+
+
+def post(
+    client: TestClient, body: dict[str, Any], key: str = "key-1", bearer: Optional[str] = "a"
+) -> Any:
+    headers: dict[str, str] = {"Idempotency-Key": key}
+    if bearer is not None:
+        headers["Authorization"] = f"Bearer {bearer}"
+    return client.post(PATH, json=body, headers=headers)
+
+
+def count_keys(db: Any) -> int:
+    return db.scalar(select(func.count()).select_from(models.IdempotencyKeys))
+
+
+def test_duplicate_key_is_replayed(client: TestClient, calls: list[dict[str, Any]]) -> None:
+    first: Any = post(client, body={"name": "pen"})
+    second: Any = post(client, body={"name": "pen"})
+
+    assert len(calls) == 1
+    assert first.status_code == second.status_code == 201
+    assert second.json() == first.json()
+    assert "idempotent-replayed" not in first.headers
+    assert second.headers["idempotent-replayed"] == "true"
+
+
+def test_stored_response_is_replayed_by_another_worker(
+    db: Any, middleware: IdempotencyMiddleware, client: TestClient, calls: list[dict[str, Any]]
+) -> None:
+    first: Any = post(client, body={"name": "pen"})
+    # Another worker doesn't have the response in memory: it's read from the table.
+    middleware.store = IdempotencyStore(ttl=60.0, cache_size=100, lock_timeout=60.0)
+    second: Any = post(client, body={"name": "pen"})
+
+    assert len(calls) == 1
+    assert count_keys(db) == 1
+    assert second.json() == first.json()
+    assert second.headers["idempotent-replayed"] == "true"
+
+
+def test_key_with_a_different_body_is_rejected(
+    middleware: IdempotencyMiddleware, client: TestClient, calls: list[dict[str, Any]]
+) -> None:
+    post(client, body={"name": "pen"})
+    response: Any = post(client, body={"name": "pencil"})
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+    assert middleware.store.stats()["mismatches"] == 1
+
+
+def test_5xx_response_releases_the_key(
+    db: Any, client: TestClient, calls: list[dict[str, Any]]
+) -> None:
+    failed: Any = post(client, body={"name": "pen", "fail": True})
+
+    assert failed.status_code == 500
+    assert count_keys(db) == 0
+
+    # The retry runs the request again.
+    retried: Any = post(client, body={"name": "pen", "fail": True})
+    assert retried.status_code == 500
+    assert "idempotent-replayed" not in retried.headers
+    assert len(calls) == 2
+
+
+def test_keys_are_scoped_to_the_client(client: TestClient, calls: list[dict[str, Any]]) -> None:
+    for token in ["a", "b"]:
+        response: Any = post(client, body={"name": "pen"}, bearer=token)
+        assert "idempotent-replayed" not in response.headers
+    assert len(calls) == 2
+
+
+def test_anonymous_keys_are_scoped_to_the_body(
+    client: TestClient, calls: list[dict[str, Any]]
+) -> None:
+    first: Any = post(client, body={"name": "pen"}, bearer=None)
+    # Another client with the same key doesn't get the stored response (nor a 422).
+    other: Any = post(client, body={"name": "pencil"}, bearer=None)
+    retried: Any = post(client, body={"name": "pen"}, bearer=None)
+
+    assert len(calls) == 2
+    assert other.status_code == 201
+    assert other.json()["name"] == "pencil"
+    assert "idempotent-replayed" not in other.headers
+    assert retried.json() == first.json()
+    assert retried.headers["idempotent-replayed"] == "true"
+
+
+def test_requests_without_a_key_are_not_stored(
+    db: Any, client: TestClient, calls: list[dict[str, Any]]
+) -> None:
+    client.post(PATH, json={"name": "pen"})
+    client.post(PATH, json={"name": "pen"})
+
+    assert len(calls) == 2
+    assert count_keys(db) == 0
+
+
+def test_invalid_key_is_rejected(client: TestClient, calls: list[dict[str, Any]]) -> None:
+    response: Any = post(client, body={"name": "pen"}, key="k" * 256)
+
+    assert response.status_code == 400
+    assert calls == []
@@ -0,0 +1,68 @@
+"""The tests of the lazy imports: importing the package must not load the config,
+the credentials, the engines or the heavy dependencies (see
+`benchmarks/import_time.py` for the timings).
+
+They run in fresh interpreters, since the other tests have imported everything.
+
+Author: Chinedu Ezeofor
+"""
+
+import json
+import os
+import subprocess
+import sys
+from typing import Any
+
+from tests.conftest import DUMMY_ENV, ROOT
+
+# Imported by `create_app()` (or on first use), not by `import e_commerce_app`.
+LAZY_MODULES: list[str] = [
+    "dotenv",
+    "fastapi",
+    "jose",
+    "pydantic",
+    "rich",
+    "sqlalchemy",
+    "typeguard",
+    "yaml",
+    "e_commerce_app.config.core",
+    "e_commerce_app.config.settings",
+    "e_commerce_app.models",
+    "e_commerce_app.utils.credentials",
+]
+
+
+def run_python(code: str) -> Any:
+    """This runs `code` in a fresh interpreter and returns the JSON it printed last."""
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env={**os.environ, **DUMMY_ENV},
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_is_lazy() -> None:
+    code: str = f"""
+import json, sys
+import e_commerce_app
+print(json.dumps([name for name in {LAZY_MODULES!r} if name in sys.modules]))
+"""
+    assert run_python(code) == []
+
+
+def test_create_app_after_importing_the_settings_module() -> None:
+    # The `settings` submodule must not shadow the settings (see `config.get_settings`).
+    code: str = """
+import json
+import e_commerce_app.config.settings
+from e_commerce_app import create_app
+from e_commerce_app.config import get_settings
+app = create_app()
+print(json.dumps([app.title, get_settings().PROJECT_NAME]))
+"""
+    title, project_name = run_python(code)
+    assert title == project_name
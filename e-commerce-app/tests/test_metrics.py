@@ -0,0 +1,32 @@
+"""The tests of the Prometheus metrics (`utils/metrics.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+import os
+
+import pytest
+
+from e_commerce_app.utils.metrics import Counter, Histogram, Registry, _Metric
+
+
+def test_series_are_labelled_with_the_worker() -> None:
+    registry = Registry()
+    counter: Counter = registry.register(Counter("requests_total", "Requests.", ("route",)))
+    histogram: Histogram = registry.register(Histogram("latency", "Latency.", buckets=(1.0,)))
+    counter.inc(labels=("/items",))
+    histogram.observe(0.5)
+
+    worker: str = f'worker="{os.getpid()}"'
+    lines: list[str] = registry.render().splitlines()
+
+    assert f'requests_total{{{worker},route="/items"}} 1' in lines
+    assert f'latency_bucket{{{worker},le="1.0"}} 1' in lines
+    assert f'latency_bucket{{{worker},le="+Inf"}} 1' in lines
+    assert f"latency_count{{{worker}}} 1" in lines
+    assert f"latency_sum{{{worker}}} 0.5" in lines
+
+
+def test_metric_must_implement_the_samples() -> None:
+    with pytest.raises(TypeError):
+        _Metric("metric", "A metric.")  # type: ignore[abstract]
@@ -0,0 +1,167 @@
+"""The tests of the order queue (`utils/order_queue.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+from datetime import date
+from typing import Any
+
+import pytest
+from sqlalchemy import func, select
+
+from e_commerce_app import models
+from e_commerce_app.utils import order_queue
+from e_commerce_app.utils.order_queue import OrderQueue, OrderQueueFullError, write_orders
+from e_commerce_app.v1.schemas import db_schema
+
+MISSING_CUSTOMER_ID: int = 999
+
+
+@pytest.fixture()
+def customer_id(db: Any) -> int:
+    """The id of a customer of the test database."""
+    customer: Any = models.Customers(
+        name="john doe",
+        username="johndoe",
+        email="john@example.com",
+        hashed_password="hashed",
+        shipping_address="1 main street",
+    )
+    db.add(customer)
+    db.commit()
+    return customer.id
+
+
+def make_order(customer_id: int, total_price: float = 10.0) -> db_schema.OrdersSchema:
+    return db_schema.OrdersSchema(
+        customer_id=customer_id,
+        order_date=date(2024, 1, 1),
+        total_price=total_price,
+        status="pending",
+    )
+
+
+def make_queue(**kwargs: Any) -> OrderQueue:
+    options: dict[str, Any] = {
+        "max_batch": 100,
+        "max_delay": 0.05,
+        "max_size": 100,
+        "synchronous_commit": "on",
+    }
+    return OrderQueue(**{**options, **kwargs})
+
+
+def count_orders(db: Any) -> int:
+    return db.scalar(select(func.count()).select_from(models.Orders))
+
+
+def test_batch_flush_reports_the_errors_per_order(db: Any, customer_id: int) -> None:
+    queue: OrderQueue = make_queue()
+
+    async def run() -> tuple[dict[str, Any], dict[str, Any]]:
+        queue.start()
+        try:
+            return await asyncio.gather(
+                queue.submit(data=[make_order(customer_id), make_order(customer_id, 20.0)]),
+                queue.submit(data=[make_order(MISSING_CUSTOMER_ID), make_order(customer_id, 30.0)]),
+            )
+        finally:
+            await queue.stop()
+
+    first, second = asyncio.run(run())
+
+    # Both requests are written in one batch.
+    assert queue.stats()["batches"] == 1
+    assert queue.stats()["orders"] == 3
+    assert queue.stats()["rejected"] == 1
+
+    assert [row.total_price for row in first["data"]] == [10.0, 20.0]
+    assert first["errors"] == []
+    # The rejected order doesn't fail the other orders of its request or of the batch.
+    assert [row.total_price for row in second["data"]] == [30.0]
+    assert len(second["errors"]) == 1
+    assert second["errors"][0]["index"] == 0
+    assert f"customer_id={MISSING_CUSTOMER_ID}" in second["errors"][0]["detail"]
+    assert count_orders(db) == 3
+
+
+def test_batch_size_is_capped(db: Any, customer_id: int) -> None:
+    queue: OrderQueue = make_queue(max_batch=2)
+
+    async def run() -> dict[str, Any]:
+        queue.start()
+        try:
+            return await queue.submit(data=[make_order(customer_id) for _ in range(5)])
+        finally:
+            await queue.stop()
+
+    result: dict[str, Any] = asyncio.run(run())
+
+    assert len(result["data"]) == 5
+    assert queue.stats()["batches"] == 3
+    assert count_orders(db) == 5
+
+
+def test_stop_writes_the_queued_orders(db: Any, customer_id: int) -> None:
+    queue: OrderQueue = make_queue(max_delay=60.0)
+
+    async def run() -> dict[str, Any]:
+        queue.start()
+        submitted: Any = asyncio.ensure_future(queue.submit(data=[make_order(customer_id)]))
+        await asyncio.sleep(0)
+        # The batch would wait for `max_delay`: `stop` writes it right away.
+        await queue.stop()
+        return await submitted
+
+    result: dict[str, Any] = asyncio.run(run())
+
+    assert len(result["data"]) == 1
+    assert not queue.running
+    assert count_orders(db) == 1
+
+
+def test_full_queue_is_rejected(engine: Any) -> None:
+    queue: OrderQueue = make_queue(max_size=2)
+
+    async def run() -> None:
+        queue.start()
+        try:
+            with pytest.raises(OrderQueueFullError):
+                await queue.submit(data=[make_order(MISSING_CUSTOMER_ID) for _ in range(3)])
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+    assert queue.stats()["batches"] == 0
+
+
+def test_submit_requires_a_running_queue() -> None:
+    with pytest.raises(RuntimeError):
+        asyncio.run(make_queue().submit(data=[make_order(MISSING_CUSTOMER_ID)]))
+
+
+def test_synchronous_commit_is_set_in_every_transaction(
+    db: Any, engine: Any, customer_id: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    transactions: list[str] = []
+    # SQLite has no `synchronous_commit`: the statement is only recorded.
+    monkeypatch.setattr(engine.dialect, "name", "postgresql")
+    monkeypatch.setattr(
+        order_queue,
+        "set_synchronous_commit",
+        lambda connection, synchronous_commit: transactions.append(synchronous_commit),
+    )
+    # It fails a constraint (NOT NULL): the batch is rolled back and retried by halves.
+    invalid: db_schema.OrdersSchema = db_schema.OrdersSchema.model_construct(
+        **{**make_order(customer_id).model_dump(), "status": None}
+    )
+
+    result: dict[str, Any] = write_orders(
+        db=db, data=[make_order(customer_id), invalid], synchronous_commit="off"
+    )
+
+    assert len(result["data"]) == 1
+    assert [err["index"] for err in result["errors"]] == [1]
+    # The first attempt and the retry.
+    assert transactions == ["off", "off"]
@@ -0,0 +1,72 @@
+"""The tests of the connection pool statistics (`utils/pool_stats.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+from typing import Any
+
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import StaticPool
+
+from e_commerce_app.utils.pool_stats import InstrumentedQueuePool, get_pool_stats
+
+
+def make_engine() -> Any:
+    return create_engine(
+        "sqlite://",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.01,
+    )
+
+
+def test_checkouts_are_counted_per_pool() -> None:
+    first: Any = make_engine()
+    second: Any = make_engine()
+    for _ in range(3):
+        first.connect().close()
+    second.connect().close()
+
+    assert get_pool_stats(pool=first.pool)["checkouts"] == 3
+    assert get_pool_stats(pool=second.pool)["checkouts"] == 1
+
+
+def test_timeouts_are_counted() -> None:
+    engine: Any = make_engine()
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    stats: dict[str, Any] = get_pool_stats(pool=engine.pool)
+    assert stats["checkouts"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_seconds"] > 0
+
+
+def test_recreated_pool_starts_from_zero() -> None:
+    engine: Any = make_engine()
+    engine.connect().close()
+    engine.dispose()
+
+    assert get_pool_stats(pool=engine.pool)["checkouts"] == 0
+
+
+def test_pool_without_stats() -> None:
+    class Pool(StaticPool):
+        def size(self) -> int:
+            return 1
+
+        def checkedout(self) -> int:
+            return 0
+
+        def checkedin(self) -> int:
+            return 1
+
+        def overflow(self) -> int:
+            return 0
+
+    engine: Any = create_engine("sqlite://", poolclass=Pool)
+
+    assert get_pool_stats(pool=engine.pool)["checkouts"] == 0
@@ -0,0 +1,27 @@
+"""The tests of the slow query log (`utils/slow_query.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+from typing import Any
+
+from sqlalchemy import create_engine, text
+
+from e_commerce_app.utils.slow_query import SlowQueryLog
+
+
+def test_plans_are_bounded() -> None:
+    engine: Any = create_engine("sqlite://")
+    # Every query is slow.
+    log = SlowQueryLog(threshold=0.0, maxsize=10, explain=True, max_plans=2)
+    log.instrument(engine)
+    statements: list[str] = ["SELECT 1", "SELECT 2", "SELECT 1", "SELECT 3"]
+
+    with engine.connect() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
+
+    # "SELECT 2" is the least recently used plan.
+    assert list(log._plans) == ["SELECT 1", "SELECT 3"]
+    assert all(entry["plan"] is not None for entry in log.entries())
+    assert log.total == len(statements)
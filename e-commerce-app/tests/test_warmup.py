@@ -0,0 +1,77 @@
+"""The tests of the warmup on startup (`utils/warmup.py`).
+
+Author: Chinedu Ezeofor
+"""
+
+import asyncio
+from typing import Any, Optional
+
+import pytest
+from fastapi import FastAPI
+
+from e_commerce_app.config import get_settings
+from e_commerce_app.utils import warmup
+from e_commerce_app.utils.warmup import WarmupStatus
+
+STEPS: list[str] = ["pool", "statements", "schemas", "typecheck"]
+
+
+@pytest.fixture()
+def status(monkeypatch: pytest.MonkeyPatch) -> WarmupStatus:
+    """A fresh warmup status."""
+    status = WarmupStatus()
+    monkeypatch.setattr(warmup, "warmup_status", status)
+    return status
+
+
+def test_warm_statements(db: Any) -> None:
+    # The search is only warmed up on Postgres.
+    assert warmup.warm_statements(db=db) == 12
+
+
+def test_warmup_runs_every_step(engine: Any, status: WarmupStatus) -> None:
+    asyncio.run(warmup.run_warmup(app=FastAPI()))
+
+    assert status.ready
+    assert list(status.steps) == STEPS
+    assert status.errors == {}
+    assert status.to_dict()["duration_seconds"] is not None
+
+
+def test_failed_step_is_skipped(
+    engine: Any, status: WarmupStatus, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def fail() -> int:
+        raise RuntimeError("the database is down")
+
+    monkeypatch.setattr(warmup, "_warm_statements", fail)
+    asyncio.run(warmup.run_warmup(app=FastAPI()))
+
+    # The app still becomes ready.
+    assert status.ready
+    assert list(status.steps) == STEPS
+    assert status.errors == {"statements": "the database is down"}
+
+
+def test_start_warmup_runs_in_the_background(engine: Any, status: WarmupStatus) -> None:
+    async def run() -> None:
+        task: Optional[asyncio.Task[None]] = warmup.start_warmup(app=FastAPI())
+        assert task is not None
+        assert not status.ready
+        await task
+
+    asyncio.run(run())
+    assert status.ready
+
+
+def test_disabled_warmup_is_ready_right_away(
+    status: WarmupStatus, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(get_settings().warmup, "WARMUP_ENABLED", False)
+
+    async def run() -> Optional[asyncio.Task[None]]:
+        return warmup.start_warmup(app=FastAPI())
+
+    assert asyncio.run(run()) is None
+    assert status.ready
+    assert status.steps == {}